@@ -2,7 +2,38 @@
 import os
 import sys
 import subprocess
+import json
 import argparse
+import contextlib
+
+# Optional metrics registry shipped in /app/tools (served by health_check.py /metrics)
+sys.path.insert(0, '/app/tools')
+# Each tool is guarded on its own so one failed import does not silently disable the others
+try:
+    from inference_metrics import REGISTRY, track_inference, record_job_usage
+    HAS_METRICS = True
+except ImportError as e:
+    print(f"Warning: inference metrics disabled ({e})", file=sys.stderr)
+    HAS_METRICS = False
+try:
+    from process_tree import JobTracker
+    HAS_PROCESS_TREE = True
+except ImportError as e:
+    print(f"Warning: process-tree accounting disabled ({e})", file=sys.stderr)
+    HAS_PROCESS_TREE = False
+try:
+    from admission_control import MemoryProfileStore
+    HAS_ADMISSION = True
+except ImportError as e:
+    print(f"Warning: memory profile recording disabled ({e})", file=sys.stderr)
+    HAS_ADMISSION = False
+
+# Optional prebuilt sample_token index (see tools/sample_index.py)
+try:
+    from sample_index import resolve_sample_token
+    HAS_SAMPLE_INDEX = True
+except ImportError:
+    HAS_SAMPLE_INDEX = False
 
 def main():
     """
@@ -33,6 +64,17 @@ def main():
         print(f"Error reading input file: {e}", file=sys.stderr)
         sys.exit(1)
 
+    # Fail fast on unknown tokens when an index is available for the dataroot
+    if HAS_SAMPLE_INDEX:
+        try:
+            record = resolve_sample_token(sample_token, args.dataroot)
+        except KeyError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        if record is not None:
+            print(f"Resolved sample_token: scene {record.scene_name}, "
+                  f"{len(record.cameras)} cameras, timestamp {record.timestamp}")
+
     # --- Construct the command to call the actual demo script ---
     # The demo script is inside the PETR project directory
     demo_script_path = '/app/PETR/tools/demo.py'
@@ -51,9 +93,16 @@ def main():
     print(f"Executing command: {' '.join(command)}")
 
     # --- Execute the command ---
+    tracker = track_inference('PETR', stage='demo') if HAS_METRICS else contextlib.nullcontext()
+    job = JobTracker(sample_token, gpu=True) if HAS_PROCESS_TREE else None
     try:
         # Add timeout protection (10 minutes for inference)
-        result = subprocess.run(command, check=True, timeout=600)
+        with tracker:
+            if job is not None:
+                # Track demo.py and its dataloader workers as one job
+                result = job.run(command, check=True, timeout=600)
+            else:
+                result = subprocess.run(command, check=True, timeout=600)
         print("Inference completed successfully")
     except subprocess.TimeoutExpired:
         print(f"Error: Inference timed out after 600 seconds", file=sys.stderr)
@@ -64,6 +113,23 @@ def main():
     except subprocess.CalledProcessError as e:
         print(f"Error executing demo script: {e}", file=sys.stderr)
         sys.exit(1)
+    finally:
+        if job is not None and job.tree is not None:
+            usage = job.usage()
+            if HAS_METRICS:
+                record_job_usage('PETR', usage)
+            if HAS_ADMISSION:
+                try:
+                    # Learned peaks feed admission control for co-scheduled runs
+                    MemoryProfileStore().record_usage('PETR', usage)
+                except OSError as e:
+                    print(f"Warning: failed to record memory profile: {e}", file=sys.stderr)
+            print(f"Job resource usage: {json.dumps(usage.to_dict())}", file=sys.stderr)
+        if HAS_METRICS:
+            try:
+                REGISTRY.persist(name='PETR')
+            except OSError as e:
+                print(f"Warning: failed to persist metrics: {e}", file=sys.stderr)
 
 if __name__ == "__main__":
     main()
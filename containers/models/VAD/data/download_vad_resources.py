@@ -6,10 +6,20 @@ VAD资源下载脚本
 
 import os
 import sys
+import hashlib
 import subprocess
 import urllib.request
 from pathlib import Path
 
+# 校验和工具 (可选): 仓库内为 tools/，容器内为 /app/tools
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../../tools'))
+sys.path.insert(0, '/app/tools')
+try:
+    from file_checksum import ChecksumManifest, ChecksumVerifier
+    HAS_CHECKSUM = True
+except ImportError:
+    HAS_CHECKSUM = False
+
 def install_gdown():
     """安装gdown包"""
     try:
@@ -80,6 +90,48 @@ def download_from_url(url, output_path, description):
         print(f"❌ Error downloading {description}: {e}")
         return False
 
+def verify_existing(verifier, manifest, output_path):
+    """按清单校验已存在的文件，截断或损坏时删除以便重新下载"""
+    if verifier is None or manifest.get(str(output_path)) is None:
+        return True
+    result = verifier.verify(manifest, [str(output_path)])[0]
+    if result.ok:
+        print(f"🔒 Checksum verified{' (cached)' if result.cached else ''}")
+        return True
+    if result.status == 'size_mismatch':
+        print(f"❌ Size mismatch (expected {result.expected_size}, got {result.actual_size}), file is truncated")
+    else:
+        print(f"❌ Checksum mismatch ({result.status}), file is corrupted")
+    output_path.unlink()
+    return False
+
+def check_hash_prefix(output_path, prefix):
+    """torchvision 权重文件名中的哈希为 sha256 前缀 (已知正确的摘要)，不符时删除文件"""
+    digest = hashlib.sha256()
+    with open(output_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(4 << 20), b''):
+            digest.update(chunk)
+    if digest.hexdigest().startswith(prefix):
+        print(f"🔒 sha256 prefix {prefix} verified")
+        return True
+    print(f"❌ sha256 does not start with {prefix}, file is truncated or corrupted")
+    output_path.unlink()
+    return False
+
+def record_checksum(verifier, manifest, output_path):
+    """记录本次下载文件的校验和，之后的运行据此发现截断或损坏
+
+    只对本次运行下载的文件调用: 已存在的文件可能是之前中断的下载，不能作为参考摘要。
+    """
+    if verifier is None:
+        return
+    try:
+        verifier.record(manifest, [str(output_path)])
+        manifest.save()
+        print(f"🔒 Checksum recorded in {manifest.path}")
+    except OSError as e:
+        print(f"⚠️  Failed to record checksum: {e}")
+
 def main():
     # 设置基础路径 - 优先使用/workspace，如果不存在则使用当前目录
     if Path('/workspace').exists():
@@ -99,6 +151,12 @@ def main():
     # 创建目录结构
     dirs = create_directories(base_path)
     
+    # 校验和清单: 已存在的文件先校验再跳过，新下载的文件记录校验和
+    verifier = manifest = None
+    if HAS_CHECKSUM:
+        verifier = ChecksumVerifier()
+        manifest = ChecksumManifest(str(base_path / 'checksums.json'))
+    
     # 定义下载资源
     downloads = [
         # VAD模型权重
@@ -134,7 +192,8 @@ def main():
             'type': 'url',
             'url': 'https://download.pytorch.org/models/resnet50-19c8e357.pth',
             'output': dirs['pretrained'] / 'resnet50-19c8e357.pth',
-            'description': 'ResNet50 Pretrained Weights'
+            'description': 'ResNet50 Pretrained Weights',
+            'sha256_prefix': '19c8e357',
         }
     ]
     
@@ -149,10 +208,14 @@ def main():
         print(f"\n[{i}/{total_count}] {item['description']}")
         print("-" * 40)
         
-        # 检查文件是否已存在
-        if item['output'].exists():
+        # 检查文件是否已存在 (有已知摘要或校验和记录时先校验，截断或损坏的文件重新下载)
+        prefix = item.get('sha256_prefix')
+        if (item['output'].exists() and verify_existing(verifier, manifest, item['output'])
+                and (prefix is None or check_hash_prefix(item['output'], prefix))):
             file_size = item['output'].stat().st_size / (1024*1024)  # MB
             print(f"⚠️  File already exists ({file_size:.1f} MB), skipping...")
+            if prefix is None and (manifest is None or manifest.get(str(item['output'])) is None):
+                print("⚠️  No reference checksum, cannot verify; delete the file to re-download if in doubt")
             success_count += 1
             continue
         
@@ -170,7 +233,10 @@ def main():
                 item['description']
             )
         
+        if success and prefix is not None:
+            success = check_hash_prefix(item['output'], prefix)
         if success:
+            record_checksum(verifier, manifest, item['output'])
             success_count += 1
     
     # 输出结果统计
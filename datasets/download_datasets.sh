@@ -23,6 +23,16 @@ fi
 
 LOG_FILE="$SCRIPT_DIR/download_log_$(date +%Y%m%d_%H%M%S).log"
 
+# 压缩包校验和清单 (JSON 或 sha256sum 格式，键为压缩包文件名)，存在时解压前校验。
+# 数据集提供方不公布压缩包摘要，仓库也不附带清单，需要先在一台机器上生成:
+#   RECORD_CHECKSUMS=1 ./download_datasets.sh ...   解压成功 (gzip 已校验完整数据流) 后记录摘要再删除压缩包
+# 或对已知完好的压缩包手动记录:
+#   python3 tools/file_checksum.py datasets/checksums.json v1.0-mini.tgz --root . --record
+# 之后把清单复制到其他机器 (或用 CHECKSUM_MANIFEST 指定路径)，截断/损坏的下载在解压前即被发现。
+TOOLS_DIR="$SCRIPT_DIR/../tools"
+CHECKSUM_MANIFEST="${CHECKSUM_MANIFEST:-$SCRIPT_DIR/checksums.json}"
+RECORD_CHECKSUMS="${RECORD_CHECKSUMS:-0}"
+
 # 颜色输出
 RED='\033[0;31m'
 GREEN='\033[0;32m'
@@ -56,6 +66,32 @@ check_command() {
     return 0
 }
 
+# 解压前校验压缩包 (清单中没有的文件直接通过)
+verify_archive() {
+    local file=$1
+    if [ ! -f "$CHECKSUM_MANIFEST" ]; then
+        warn "没有校验和清单 $CHECKSUM_MANIFEST，跳过 $file 的校验 (生成方法见脚本开头的说明)"
+        return 0
+    fi
+    if [ ! -f "$TOOLS_DIR/file_checksum.py" ]; then
+        warn "未找到 $TOOLS_DIR/file_checksum.py，跳过 $file 的校验"
+        return 0
+    fi
+    info "校验 $file ..."
+    python3 "$TOOLS_DIR/file_checksum.py" "$CHECKSUM_MANIFEST" "$file" --root "$(pwd)" --allow-unknown
+}
+
+# RECORD_CHECKSUMS=1 时记录解压成功的压缩包摘要 (在删除压缩包之前调用)
+record_archive() {
+    local file=$1
+    if [ "$RECORD_CHECKSUMS" != "1" ] || [ ! -f "$TOOLS_DIR/file_checksum.py" ]; then
+        return 0
+    fi
+    info "记录 $file 的校验和到 $CHECKSUM_MANIFEST ..."
+    python3 "$TOOLS_DIR/file_checksum.py" "$CHECKSUM_MANIFEST" "$file" --root "$(pwd)" --record \
+        || warn "记录 $file 的校验和失败"
+}
+
 # 检查存储空间
 check_disk_space() {
     local required_gb=$1
@@ -169,6 +205,11 @@ download_nuscenes_mini() {
         return 1
     fi
     
+    if ! verify_archive v1.0-mini.tgz; then
+        error "❌ v1.0-mini.tgz 校验失败 (下载不完整或已损坏)，请删除后重新下载"
+        return 1
+    fi
+    
     info "下载完成，开始自动解压..."
     if tar -xzf v1.0-mini.tgz; then
         # 验证解压结果
@@ -177,6 +218,7 @@ download_nuscenes_mini() {
             info "场景数量: $(find v1.0-mini -name "scene.json" -exec jq length {} \; 2>/dev/null || echo "10")"
             
             # 解压成功后删除压缩包
+            record_archive v1.0-mini.tgz
             info "解压成功，删除原压缩包 v1.0-mini.tgz..."
             rm -f v1.0-mini.tgz
             log "✅ 压缩包已删除，节省存储空间"
@@ -349,9 +391,14 @@ download_nuscenes_trainval() {
             # 解压文件
             for file in "${blob_files[@]}" "${meta_files[@]}"; do
                 if [ -f "$file" ]; then
+                    if ! verify_archive "$file"; then
+                        error "❌ $file 校验失败 (下载不完整或已损坏)，跳过解压，请删除后重新下载"
+                        continue
+                    fi
                     info "解压 $file..."
                     if tar -xzf "$file"; then
                         info "✅ $file 解压成功"
+                        record_archive "$file"
                         # 解压成功后删除压缩包
                         info "删除压缩包 $file..."
                         rm -f "$file"
@@ -421,12 +468,18 @@ download_nuscenes_test() {
     if wget -c -t 3 -T 300 "$base_url/$test_file"; then
         log "✅ nuScenes Test 数据集下载成功"
         
+        if ! verify_archive "$test_file"; then
+            error "❌ $test_file 校验失败 (下载不完整或已损坏)，请删除后重新下载"
+            return 1
+        fi
+        
         # 自动解压
         info "开始自动解压 $test_file..."
         if tar -xzf "$test_file"; then
             log "✅ nuScenes Test 数据集解压成功"
             
             # 解压成功后删除压缩包
+            record_archive "$test_file"
             info "解压成功，删除原压缩包 $test_file..."
             rm -f "$test_file"
             log "✅ 压缩包已删除，节省存储空间"
@@ -3,11 +3,41 @@ import json
 import subprocess
 import argparse
 import time
+import sys
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 
 # Get the directory where the script is located
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 MODELS_CONFIG_PATH = os.path.join(SCRIPT_DIR, "../config/models_config.json")
 
+# 准入控制 (可选): 多个模型并行时按学习到的内存峰值排队启动
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "../../tools"))
+try:
+    from admission_control import AdmissionController, MemoryProfileStore
+    HAS_ADMISSION = True
+except ImportError:
+    HAS_ADMISSION = False
+
+# 推理指标 (可选): 调度方维护等待准入的任务数，写入指标目录供 /metrics 导出
+try:
+    from inference_metrics import REGISTRY, QUEUE_DEPTH
+    HAS_METRICS = True
+except ImportError:
+    HAS_METRICS = False
+
+# sample_token 索引 (可选): 启动容器前剔除数据集中不存在的token
+try:
+    from sample_index import covering_indexes
+    HAS_SAMPLE_INDEX = True
+except ImportError:
+    HAS_SAMPLE_INDEX = False
+
+# 容器内包装脚本写入指标和内存峰值记录的目录
+CONTAINER_METRICS_DIR = "/tmp/inference_metrics"
+# 调度方在指标目录中的快照文件名
+SCHEDULER_METRICS_NAME = "scheduler"
+
 def run_inference_in_docker(
     model_name: str,
     image_name: str,
@@ -16,6 +46,7 @@ def run_inference_in_docker(
     output_results_path: str,
     model_weights_path: str,
     dataroot_path: str,
+    profile_dir: str = None,
 ):
     """在 Docker 容器中运行模型推理"""
     print(f"\n--- 运行模型: {model_name} ---")
@@ -45,6 +76,10 @@ def run_inference_in_docker(
     # 4. nuScenes 数据集
     command.extend(["-v", f"{os.path.abspath(dataroot_path)}:/app/data/nuscenes:ro"])
 
+    # 5. 指标和内存峰值记录目录 (用于准入控制学习各模型的内存峰值)
+    if profile_dir:
+        command.extend(["-v", f"{os.path.abspath(profile_dir)}:{CONTAINER_METRICS_DIR}:rw"])
+
     # --- 指定镜像和执行命令 ---
     # 容器内固定的推理脚本路径
     container_inference_script = f"/app/{model_name}/inference.py"
@@ -79,6 +114,44 @@ def run_inference_in_docker(
         print(f"错误: Docker 命令未找到。请确保 Docker 已安装并运行。")
         return False, 0
 
+@contextlib.contextmanager
+def queued(model_name: str, metrics_dir: str):
+    """等待准入期间计入该模型的排队深度 (inference_queue_depth)，每次变化都写入指标目录"""
+    if not HAS_METRICS:
+        yield
+        return
+    QUEUE_DEPTH.inc(model=model_name)
+    REGISTRY.persist(metrics_dir, name=SCHEDULER_METRICS_NAME)
+    try:
+        yield
+    finally:
+        QUEUE_DEPTH.dec(model=model_name)
+        REGISTRY.persist(metrics_dir, name=SCHEDULER_METRICS_NAME)
+
+
+def filter_known_tokens(input_files: list, dataroot: str, version: str = None) -> list:
+    """用预建索引检查输入文件中的 sample_token，返回可用的输入文件
+
+    没有覆盖所评测版本的索引时无法判断，原样返回；未知token在启动任何容器之前报告并跳过。
+    """
+    if not HAS_SAMPLE_INDEX:
+        return input_files
+    indexes = covering_indexes(dataroot, version=version)
+    if not indexes:
+        return input_files
+
+    known = []
+    for input_file in input_files:
+        with open(input_file, "r") as f:
+            token = f.read().strip()
+        if any(token in index for index in indexes):
+            known.append(input_file)
+        else:
+            print(f"⚠️ 跳过 {os.path.basename(input_file)}: sample_token '{token}' 不在索引中")
+    print(f"sample_token 检查: {len(known)}/{len(input_files)} 个输入可用")
+    return known
+
+
 def calculate_metrics(model_name: str, input_data_path: str, output_results_path: str):
     """计算模型性能指标 (占位符)"""
     print(f"\n--- 计算 {model_name} 的指标 ---")
@@ -100,12 +173,74 @@ def calculate_metrics(model_name: str, input_data_path: str, output_results_path
         print(f"计算指标时发生错误: {e}")
         return {}
 
+def run_model(model_info: dict, input_files: list, args, controller=None):
+    """对所有输入文件运行一个模型，返回 (模型名, 汇总)"""
+    model_name = model_info["name"]
+    image_name = model_info["image"]
+    config_path = model_info["config_path"] # 从 config 中获取
+    
+    model_summary = {"inference_times": [], "metrics": {}}
+
+    # 查找对应的模型权重文件
+    model_weights_path = os.path.join(args.model_weights_dir, model_info["weight_file"])
+    if not os.path.exists(model_weights_path):
+        print(f"警告: 未找到 {model_name} 的模型权重文件: {model_weights_path}，跳过该模型。")
+        return model_name, None
+
+    for input_file in input_files:
+        data_filename = os.path.basename(input_file)
+        output_subdir = os.path.join(args.output_dir, model_name)
+        # 为每个输入文件生成一个唯一的JSON输出文件名
+        output_results_file = os.path.join(output_subdir, f"{os.path.splitext(data_filename)[0]}_results.json")
+        
+        # 并行运行时等待内存准入，避免多个模型同时达到峰值而OOM
+        with contextlib.ExitStack() as admission:
+            if controller:
+                with queued(model_name, args.profile_dir):
+                    admission.enter_context(controller.admit(model_name))
+            success, inference_time = run_inference_in_docker(
+                model_name=model_name,
+                image_name=image_name,
+                config_path=config_path,
+                input_data_path=input_file,
+                output_results_path=output_results_file,
+                model_weights_path=model_weights_path,
+                dataroot_path=args.dataroot,
+                profile_dir=args.profile_dir,
+            )
+        
+        if success:
+            model_summary["inference_times"].append(inference_time)
+            metrics = calculate_metrics(model_name, input_file, output_results_file)
+            # 合并指标，如果存在多个数据文件，可能需要平均或累积
+            for k, v in metrics.items():
+                model_summary["metrics"].setdefault(k, []).append(v)
+        else:
+            print(f"跳过 {model_name} 在 {data_filename} 上的指标计算，因为推理失败。")
+    
+    # 对每个模型的指标进行平均 (如果适用)
+    if model_summary["inference_times"]:
+         model_summary["avg_inference_time"] = sum(model_summary["inference_times"]) / len(model_summary["inference_times"])
+    for k, v_list in model_summary["metrics"].items():
+        if v_list:
+            model_summary["metrics"][k] = sum(v_list) / len(v_list)
+        else:
+            model_summary["metrics"][k] = None
+
+    return model_name, model_summary
+
 def main():
     parser = argparse.ArgumentParser(description="模型推理和比较框架")
     parser.add_argument("--data_dir", type=str, required=True, help="包含输入数据文件（每个文件包含一个 sample_token）的目录")
     parser.add_argument("--output_dir", type=str, default="./comparison_results", help="保存推理结果和指标的目录")
     parser.add_argument("--model_weights_dir", type=str, required=True, help="包含所有模型权重文件 (.pth) 的目录")
     parser.add_argument("--dataroot", type=str, required=True, help="nuScenes 数据集的根目录")
+    parser.add_argument("--version", type=str, default=None,
+                        help="评测的 nuScenes 版本，用于 sample_token 检查 (默认要求 dataroot 下每个版本都有索引)")
+    parser.add_argument("--jobs", type=int, default=1, help="并行运行的模型数 (>1 时启用内存准入控制)")
+    parser.add_argument("--profile_dir", type=str, default=None,
+                        help="挂载到容器的指标目录，记录各模型内存峰值 (默认 <output_dir>/metrics)")
+    parser.add_argument("--safety_margin", type=float, default=0.1, help="准入控制的内存安全余量 (占总量比例)")
     args = parser.parse_args()
 
     # 加载模型配置
@@ -114,6 +249,9 @@ def main():
 
     # 确保输出目录存在
     os.makedirs(args.output_dir, exist_ok=True)
+    if args.profile_dir is None:
+        args.profile_dir = os.path.join(args.output_dir, "metrics")
+    os.makedirs(args.profile_dir, exist_ok=True)
 
     # 获取所有输入数据文件
     input_files = [os.path.join(args.data_dir, f) for f in os.listdir(args.data_dir) if os.path.isfile(os.path.join(args.data_dir, f))]
@@ -121,56 +259,27 @@ def main():
         print(f"错误: 在 {args.data_dir} 中未找到任何输入数据文件。")
         return
 
-    comparison_summary = {}
+    input_files = filter_known_tokens(input_files, args.dataroot, args.version)
+    if not input_files:
+        print("错误: 所有输入的 sample_token 都不在数据集索引中。")
+        return
 
-    for model_info in models_config:
-        model_name = model_info["name"]
-        image_name = model_info["image"]
-        config_path = model_info["config_path"] # 从 config 中获取
-        
-        model_summary = {"inference_times": [], "metrics": {}}
-
-        # 查找对应的模型权重文件
-        model_weights_path = os.path.join(args.model_weights_dir, model_info["weight_file"])
-        if not os.path.exists(model_weights_path):
-            print(f"警告: 未找到 {model_name} 的模型权重文件: {model_weights_path}，跳过该模型。")
-            continue
-
-        for input_file in input_files:
-            data_filename = os.path.basename(input_file)
-            output_subdir = os.path.join(args.output_dir, model_name)
-            # 为每个输入文件生成一个唯一的JSON输出文件名
-            output_results_file = os.path.join(output_subdir, f"{os.path.splitext(data_filename)[0]}_results.json")
-            
-            success, inference_time = run_inference_in_docker(
-                model_name=model_name,
-                image_name=image_name,
-                config_path=config_path,
-                input_data_path=input_file,
-                output_results_path=output_results_file,
-                model_weights_path=model_weights_path,
-                dataroot_path=args.dataroot
-            )
-            
-            if success:
-                model_summary["inference_times"].append(inference_time)
-                metrics = calculate_metrics(model_name, input_file, output_results_file)
-                # 合并指标，如果存在多个数据文件，可能需要平均或累积
-                for k, v in metrics.items():
-                    model_summary["metrics"].setdefault(k, []).append(v)
-            else:
-                print(f"跳过 {model_name} 在 {data_filename} 上的指标计算，因为推理失败。")
-        
-        # 对每个模型的指标进行平均 (如果适用)
-        if model_summary["inference_times"]:
-             model_summary["avg_inference_time"] = sum(model_summary["inference_times"]) / len(model_summary["inference_times"])
-        for k, v_list in model_summary["metrics"].items():
-            if v_list:
-                model_summary["metrics"][k] = sum(v_list) / len(v_list)
-            else:
-                model_summary["metrics"][k] = None
-
-        comparison_summary[model_name] = model_summary
+    controller = None
+    if args.jobs > 1:
+        if HAS_ADMISSION:
+            store = MemoryProfileStore(os.path.join(args.profile_dir, "memory_profiles.json"))
+            controller = AdmissionController(store, safety_margin=args.safety_margin)
+        else:
+            print("警告: 准入控制不可用 (缺少 psutil 等依赖)，并行运行可能因内存不足失败。")
+
+    comparison_summary = {}
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = [executor.submit(run_model, model_info, input_files, args, controller)
+                   for model_info in models_config]
+        for future in futures:
+            model_name, model_summary = future.result()
+            if model_summary is not None:
+                comparison_summary[model_name] = model_summary
 
     # 保存总览报告
     summary_report_path = os.path.join(args.output_dir, "comparison_summary.json")
@@ -83,13 +83,9 @@ check_dependencies() {
         exit 1
     fi
     
-    # 检查必要的Python包
-    python3 -c "import pandas, matplotlib, seaborn" 2>/dev/null || {
-        warn "缺少Python依赖包，尝试安装..."
-        pip install pandas matplotlib seaborn || {
-            error "无法安装Python依赖包"
-            exit 1
-        }
+    # 检查可选的绘图依赖 (仅图表生成需要，报告和CSV不依赖)
+    python3 -c "import matplotlib" 2>/dev/null || {
+        warn "未安装matplotlib，将跳过比较图表生成 (报告和CSV不受影响)"
     }
     
     info "依赖检查完成"
@@ -104,6 +100,7 @@ setup_output_dirs() {
     # 复制标准化和比较工具
     cp "$SCRIPT_DIR/../tools/model_output_standard.py" "$OUTPUT_DIR/"
     cp "$SCRIPT_DIR/../tools/model_comparison.py" "$OUTPUT_DIR/"
+    cp "$SCRIPT_DIR/../tools/performance_store.py" "$OUTPUT_DIR/"
     cp "$SCRIPT_DIR/../tools/health_check.py" "$OUTPUT_DIR/"
     
     info "输出目录已创建: $OUTPUT_DIR"
@@ -308,7 +305,7 @@ import json
 from pathlib import Path
 
 # 创建比较器
-comparator = ModelComparator('$comparison_output')
+comparator = ModelComparator('$comparison_output', store_dir='$OUTPUT_DIR/performance_store')
 
 # 加载所有标准化输出
 output_dir = Path('$OUTPUT_DIR/model_outputs')
@@ -13,6 +13,8 @@ NC='\033[0m'
 
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 TEST_DIR="$SCRIPT_DIR/test_results"
+TOOLS_DIR="$SCRIPT_DIR/../../tools"
+UTILS_DIR="$SCRIPT_DIR/../utils"
 
 log() {
     echo -e "${GREEN}[TEST]${NC} $1"
@@ -92,7 +94,7 @@ test_output_standardization() {
     # 测试MapTR标准化
     python3 -c "
 import sys
-sys.path.append('$SCRIPT_DIR/../tools')
+sys.path.append('$TOOLS_DIR')
 from model_output_standard import create_standardizer
 import json
 
@@ -113,7 +115,7 @@ standardizer = create_standardizer('MapTR')
 result = standardizer.standardize(maptr_data, metadata)
 
 # 验证结果
-assert result.metadata.model_name == 'MAPTR'
+assert result.metadata.model_name == 'MapTR'
 assert result.map_elements is not None
 assert len(result.map_elements) == 1  # 只有一个divider
 assert result.detections_3d is not None
@@ -129,7 +131,7 @@ print('✅ MapTR 标准化测试通过')
     # 测试PETR标准化
     python3 -c "
 import sys
-sys.path.append('$SCRIPT_DIR/../tools')
+sys.path.append('$TOOLS_DIR')
 from model_output_standard import create_standardizer
 import json
 
@@ -170,7 +172,7 @@ test_model_comparison() {
     
     python3 -c "
 import sys
-sys.path.append('$SCRIPT_DIR/../tools')
+sys.path.append('$TOOLS_DIR')
 from model_comparison import ModelComparator
 from model_output_standard import StandardOutput, ModelMetadata, Detection3D, VectorElement, BoundingBox3D
 import json
@@ -271,12 +273,708 @@ print(f'比较了 {report[\"summary\"][\"total_models\"]} 个模型')
     info "模型比较测试完成"
 }
 
+# 测试工具冷启动导入耗时
+test_import_budget() {
+    log "测试工具导入耗时..."
+    
+    python3 -c "
+import sys
+import time
+sys.path.append('$TOOLS_DIR')
+
+# 导入预算 (毫秒)，重量级库必须按需导入
+budget_ms = 500
+start = time.perf_counter()
+import model_comparison
+elapsed_ms = (time.perf_counter() - start) * 1000
+
+for heavy in ('pandas', 'matplotlib', 'seaborn'):
+    assert heavy not in sys.modules, f'{heavy} 在模块加载时被导入'
+assert elapsed_ms < budget_ms, f'导入耗时 {elapsed_ms:.0f}ms 超出预算 {budget_ms}ms'
+
+print(f'✅ 导入耗时测试通过 ({elapsed_ms:.0f}ms < {budget_ms}ms)')
+"
+
+    info "导入耗时测试完成"
+}
+
+# 测试跟踪评测 (AMOTA/AMOTP 和 ID 切换)
+test_tracking_metrics() {
+    log "测试跟踪评测功能..."
+    
+    python3 -c "
+import sys
+sys.path.append('$TOOLS_DIR')
+from tracking_metrics import TrackingFrames, TrackingEvaluator
+
+# 两条真值轨迹在同一场景中各出现4帧
+gt_records = []
+for frame in range(4):
+    gt_records.append({'scene': 's0', 'frame': frame, 'track_id': 1, 'center': [frame * 1.0, 0.0], 'class_id': 0})
+    gt_records.append({'scene': 's0', 'frame': frame, 'track_id': 2, 'center': [frame * 1.0, 10.0], 'class_id': 0})
+gt = TrackingFrames.from_records(gt_records)
+evaluator = TrackingEvaluator()
+
+# 完美跟踪: 位置一致、ID 稳定
+perfect = [dict(r, track_id=r['track_id'] + 100, score=0.9) for r in gt_records]
+mean = evaluator.evaluate(gt, TrackingFrames.from_records(perfect))['mean']
+assert abs(mean['amota'] - 1.0) < 1e-9, mean
+assert mean['amotp'] < 1e-9 and mean['ids'] == 0 and mean['fp'] == 0 and mean['fn'] == 0, mean
+
+# 第3帧起轨迹1换了预测ID: 恰好1次ID切换，AMOTA 下降
+switched = [dict(r, track_id=(999 if r['track_id'] == 101 and r['frame'] >= 2 else r['track_id']))
+            for r in perfect]
+mean = evaluator.evaluate(gt, TrackingFrames.from_records(switched))['mean']
+assert mean['ids'] == 1, mean
+assert mean['tp'] == 8 and mean['fp'] == 0 and mean['fn'] == 0, mean
+assert mean['amota'] < 1.0, mean
+
+print('✅ 跟踪评测测试通过')
+"
+
+    info "跟踪评测测试完成"
+}
+
+# 测试规划评测 (L2 误差和碰撞率)
+test_planning_metrics() {
+    log "测试规划评测功能..."
+    
+    python3 -c "
+import sys
+import numpy as np
+sys.path.append('$TOOLS_DIR')
+from planning_metrics import PlanningEvaluator
+
+# 真值沿x轴每步前进1m，预测每步横向多偏0.5m: 各步L2误差为 0.5, 1.0, ..., 3.0
+steps = np.arange(1, 7, dtype=np.float64)
+gt = np.stack([steps, np.zeros(6)], axis=-1)[None]
+pred = np.stack([steps, 0.5 * steps], axis=-1)[None]
+
+# 一个目标框只在第5步 (2.5s) 出现在预测路径点上，另一个框始终远离路径
+boxes = {
+    'sample': np.array([0, 0]),
+    'step': np.array([4, 0]),
+    'box': np.array([[5.0, 2.5, 2.0, 4.0, 0.0], [30.0, -30.0, 2.0, 4.0, 0.0]]),
+}
+results = PlanningEvaluator().evaluate(pred, gt, boxes=boxes)
+assert results['num_samples'] == 1, results
+for key, expected in (('1s', 0.75), ('2s', 1.25), ('3s', 1.75)):
+    assert abs(results['l2_' + key] - expected) < 1e-9, (key, results)
+assert results['collision_1s'] == 0.0 and results['collision_2s'] == 0.0, results
+assert abs(results['collision_3s'] - 1 / 6) < 1e-9, results
+
+# 与真值完全一致时L2为0，无效时间步不计入
+results = PlanningEvaluator().evaluate(gt, gt, gt_valid=np.array([[True] * 4 + [False] * 2]))
+assert results['l2_3s'] == 0.0, results
+
+print('✅ 规划评测测试通过')
+"
+
+    info "规划评测测试完成"
+}
+
+# 测试车道拓扑评测 (Fréchet/Chamfer 匹配和 OLS)
+test_topology_metrics() {
+    log "测试车道拓扑评测功能..."
+    
+    python3 -c "
+import sys
+import numpy as np
+sys.path.append('$TOOLS_DIR')
+from topology_metrics import TopologyEvaluator, frechet_distance_matrix, chamfer_distance_matrix, stack_lanes
+
+# 沿x轴的10m车道与其反向折线: 点集相同 (Chamfer为0)，但Fréchet距离为端点间距10m
+lane = [[x, 0.0, 0.0] for x in range(11)]
+a, b = stack_lanes([lane]), stack_lanes([lane[::-1]])
+assert abs(frechet_distance_matrix(a, b)[0, 0] - 10.0) < 1e-9
+assert chamfer_distance_matrix(a, b)[0, 0] < 1e-9
+# 横向平移2.5m: 两种距离都为2.5m
+shifted = stack_lanes([[[x, 2.5, 0.0] for x in range(11)]])
+assert abs(frechet_distance_matrix(a, shifted)[0, 0] - 2.5) < 1e-9
+assert abs(chamfer_distance_matrix(a, shifted)[0, 0] - 2.5) < 1e-9
+
+# 三条首尾相连的车道和一个交通元素
+lanes = [[[x + 10.0 * i, 0.0, 0.0] for x in range(11)] for i in range(3)]
+gt = {'lanes': lanes, 'lclc': [[0, 1], [1, 2]], 'lcte': [[0, 0]],
+      'te_boxes': [[10.0, 10.0, 30.0, 40.0]], 'te_labels': [1]}
+pred = dict(gt, lane_scores=[0.9, 0.8, 0.7], te_scores=[0.9],
+            lclc=[[0, 1, 0.9], [1, 2, 0.9]], lcte=[[0, 0, 0.9]])
+
+for distance in ('frechet', 'chamfer'):
+    evaluator = TopologyEvaluator(distance=distance)
+    perfect = evaluator.evaluate([gt], [pred])
+    for key in ('DET_l', 'DET_t', 'TOP_ll', 'TOP_lt', 'OLS'):
+        assert abs(perfect[key] - 1.0) < 1e-9, (distance, perfect)
+
+    # 第3条车道横向偏移2.5m: 只在3m阈值下匹配，且超出拓扑匹配阈值，边1->2不再命中
+    moved = dict(pred, lanes=lanes[:2] + [[[p[0], p[1] + 2.5, p[2]] for p in lanes[2]]])
+    result = evaluator.evaluate([gt], [moved])
+    assert result['DET_l'] < perfect['DET_l'], (distance, result)
+    assert result['TOP_ll'] < perfect['TOP_ll'], (distance, result)
+    assert result['OLS'] < perfect['OLS'], (distance, result)
+    assert abs(result['DET_t'] - 1.0) < 1e-9 and abs(result['TOP_lt'] - 1.0) < 1e-9, (distance, result)
+
+print('✅ 车道拓扑评测测试通过')
+"
+
+    info "车道拓扑评测测试完成"
+}
+
+# 测试TFRecord帧扫描 (帧数、截断和CRC32C)
+test_tfrecord_scan() {
+    log "测试TFRecord扫描功能..."
+    
+    python3 -c "
+import sys
+import struct
+sys.path.append('$TOOLS_DIR')
+import tfrecord_scan
+from tfrecord_scan import scan_tfrecord, crc32c, masked_crc32c
+
+# CRC32C 标准测试向量
+assert crc32c(b'123456789') == 0xE3069283
+assert tfrecord_scan._crc32c_python(b'123456789') == 0xE3069283
+
+# 按TFRecord格式写入3条记录
+path = '$TEST_DIR/sample.tfrecord'
+payloads = [b'frame-0', b'frame-1' * 10, b'frame-2' * 100]
+with open(path, 'wb') as f:
+    for data in payloads:
+        length = struct.pack('<Q', len(data))
+        f.write(length + struct.pack('<I', masked_crc32c(length)))
+        f.write(data + struct.pack('<I', masked_crc32c(data)))
+for mode in ('none', 'header', 'full'):
+    stats = scan_tfrecord(path, crc_mode=mode)
+    assert stats.valid and stats.records == 3, stats
+    assert stats.data_bytes == sum(len(d) for d in payloads), stats
+
+# 篡改最后一条记录的数据: 只有 full 模式能发现
+with open(path, 'rb') as f:
+    content = f.read()
+damaged = bytearray(content)
+damaged[-10] ^= 0xFF
+with open(path, 'wb') as f:
+    f.write(bytes(damaged))
+assert scan_tfrecord(path).valid
+stats = scan_tfrecord(path, crc_mode='full')
+assert stats.corrupt and not stats.truncated and stats.records == 2, stats
+
+# 截断最后一条记录
+with open(path, 'wb') as f:
+    f.write(content[:-5])
+stats = scan_tfrecord(path)
+third = 2 * 16 + len(payloads[0]) + len(payloads[1])
+assert stats.truncated and not stats.valid, stats
+assert stats.records == 2 and stats.error_offset == third, stats
+
+print('✅ TFRecord扫描测试通过')
+"
+
+    info "TFRecord扫描测试完成"
+}
+
+# 测试Parquet文件尾扫描 (Thrift compact 解码)
+test_parquet_scan() {
+    log "测试Parquet文件尾扫描功能..."
+    
+    python3 -c "
+import sys
+sys.path.append('$TOOLS_DIR')
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    print('⚠️ 未安装 pyarrow，跳过Parquet扫描测试')
+    sys.exit(0)
+from parquet_scan import scan_parquet
+
+# av2 场景文件结构: scenario_id 为常量列，含一个嵌套的列表列，分为3个row group
+path = '$TEST_DIR/scenario.parquet'
+rows = 250
+table = pa.table({
+    'scenario_id': ['0a1b2c3d'] * rows,
+    'track_id': [str(i % 7) for i in range(rows)],
+    'timestep': list(range(rows)),
+    'position_x': [i * 0.5 for i in range(rows)],
+    'history': [[float(i), float(i + 1)] for i in range(rows)],
+})
+pq.write_table(table, path, row_group_size=100)
+
+stats = scan_parquet(path, constant_columns=['scenario_id', 'track_id'], distinct_columns=['track_id'])
+assert stats.valid, stats.error
+assert stats.num_rows == rows and stats.row_groups == 3, stats
+assert stats.columns == ['scenario_id', 'track_id', 'timestep', 'position_x', 'history'], stats.columns
+assert stats.constants == {'scenario_id': '0a1b2c3d'}, stats.constants
+assert stats.distinct == {'track_id': 7}, stats.distinct
+
+# 截掉文件尾部
+with open(path, 'rb') as f:
+    content = f.read()
+with open(path, 'wb') as f:
+    f.write(content[:-100])
+stats = scan_parquet(path, constant_columns=['scenario_id'])
+assert not stats.valid and 'PAR1' in stats.error, stats.error
+assert stats.num_rows == 0 and not stats.constants, stats
+
+print('✅ Parquet扫描测试通过')
+"
+
+    info "Parquet扫描测试完成"
+}
+
+# 测试内存准入控制 (FakeBackend 注入GPU遥测)
+test_admission_control() {
+    log "测试内存准入控制功能..."
+    
+    python3 -c "
+import os
+import sys
+import time
+import multiprocessing
+sys.path.append('$TOOLS_DIR')
+from gpu_telemetry import GPUTelemetry, GPUDevice, FakeBackend, set_telemetry
+from admission_control import AdmissionController, MemoryProfileStore
+
+path = '$TEST_DIR/admission/memory_profiles.json'
+store = MemoryProfileStore(path)
+# 两个模型的显存峰值各6000MB，10000MB的GPU扣除10%余量后只放得下一个 (主机内存不构成限制)
+for model in ('VAD', 'StreamPETR'):
+    store.record(model, host_mb=1.0, gpu_mb=6000.0)
+
+def slow_query():
+    # 模拟较慢的驱动查询，拉长判断与预留之间的窗口
+    time.sleep(0.2)
+    return [GPUDevice(index=0, name='Fake GPU', memory_total_mb=10000.0, memory_free_mb=10000.0)]
+set_telemetry(GPUTelemetry(FakeBackend(generator=slow_query)))
+
+# 两个共享账本的调度进程同时申请: 只能有一个放行，另一个排队直到超时
+def contend(model, barrier, results):
+    controller = AdmissionController(MemoryProfileStore(path), poll_interval=0.05)
+    barrier.wait()
+    try:
+        with controller.admit(model, timeout=1.0, verbose=False):
+            results.put('admitted')
+            time.sleep(2.0)
+    except TimeoutError:
+        results.put('timeout')
+
+ctx = multiprocessing.get_context('fork')
+barrier, results = ctx.Barrier(2), ctx.Queue()
+workers = [ctx.Process(target=contend, args=(model, barrier, results)) for model in ('VAD', 'StreamPETR')]
+for worker in workers:
+    worker.start()
+for worker in workers:
+    worker.join(10)
+outcomes = sorted(results.get(timeout=1) for _ in workers)
+assert outcomes == ['admitted', 'timeout'], outcomes
+assert store.reservations() == {}, store.reservations()
+
+# 单进程: 空闲时放行并预留，持有期间另一个模型排队直到超时，释放后放行
+gpu = {'free': 10000.0}
+set_telemetry(GPUTelemetry(FakeBackend(generator=lambda: [
+    GPUDevice(index=0, name='Fake GPU', memory_total_mb=10000.0, memory_free_mb=gpu['free'])])))
+controller = AdmissionController(store, poll_interval=0.05)
+assert controller.check('VAD').admitted
+with controller.admit('VAD', verbose=False) as decision:
+    assert decision.required_gpu_mb == 6000.0 and len(store.reservations()) == 1
+    held = controller.check('StreamPETR')
+    assert not held.admitted and held.reserved_gpu_mb == 6000.0 and '显存容量不足' in held.reason, held
+    start = time.monotonic()
+    try:
+        with controller.admit('StreamPETR', timeout=0.2, verbose=False):
+            raise AssertionError('显存容量不足时不应放行')
+    except TimeoutError:
+        pass
+    assert time.monotonic() - start >= 0.2
+
+    # 容量放得下的小模型: VAD 仍在启动期时按其预留扣减空闲显存
+    store.record('PETR', host_mb=1.0, gpu_mb=2000.0)
+    gpu['free'] = 4000.0
+    assert not controller.check('PETR').admitted
+    assert AdmissionController(store, ramp_up_s=0.0).check('PETR').admitted
+assert store.reservations() == {}
+assert controller.check('StreamPETR').admitted
+
+# 持有进程已退出的预留在下次检查时被清理
+dead = ctx.Process(target=time.sleep, args=(0,))
+dead.start()
+dead.join()
+with store._locked() as data:
+    data['reservations']['stale'] = {'model': 'VAD', 'host_mb': 1.0, 'gpu_mb': 6000.0,
+                                     'pid': dead.pid, 'started': time.time()}
+gpu['free'] = 10000.0
+assert controller.check('StreamPETR').admitted
+assert 'stale' not in store._read()['reservations']
+
+print('✅ 准入控制测试通过')
+"
+
+    info "准入控制测试完成"
+}
+
+# 测试启动容器前的 sample_token 检查
+test_token_filter() {
+    log "测试 sample_token 检查功能..."
+    
+    python3 -c "
+import os
+import sys
+import json
+sys.path.append('$TOOLS_DIR')
+sys.path.append('$SCRIPT_DIR')
+from sample_index import build_sample_index
+from run_comparison import filter_known_tokens
+
+dataroot = '$TEST_DIR/nuscenes'
+known, other = 'a' * 32, 'b' * 32
+
+def write_tables(version, tokens):
+    os.makedirs(os.path.join(dataroot, version), exist_ok=True)
+    tables = {
+        'sensor': [], 'calibrated_sensor': [], 'sample_data': [], 'ego_pose': [],
+        'scene': [{'token': 'c' * 32, 'name': 'scene-0001', 'description': 'Night, rain'}],
+        'sample': [{'token': token, 'scene_token': 'c' * 32, 'timestamp': i, 'prev': '', 'next': ''}
+                   for i, token in enumerate(tokens)],
+    }
+    for name, rows in tables.items():
+        with open(os.path.join(dataroot, version, name + '.json'), 'w') as f:
+            json.dump(rows, f)
+
+inputs = []
+for name, token in (('known.txt', known), ('unknown.txt', 'd' * 32)):
+    inputs.append(os.path.join('$TEST_DIR', name))
+    with open(inputs[-1], 'w') as f:
+        f.write(token + '\\n')
+
+# 没有索引时无法判断，原样返回
+write_tables('v1.0-mini', [known])
+assert filter_known_tokens(inputs, dataroot) == inputs
+
+# 有 mini 索引: 拒绝不在其中的token
+build_sample_index(dataroot, 'v1.0-mini', verbose=False)
+assert filter_known_tokens(inputs, dataroot) == inputs[:1]
+
+# 又出现了没有索引的 trainval: 未指定版本时不再拒绝，指定 mini 时仍按 mini 索引检查
+write_tables('v1.0-trainval', [other])
+assert filter_known_tokens(inputs, dataroot) == inputs
+assert filter_known_tokens(inputs, dataroot, version='v1.0-mini') == inputs[:1]
+assert filter_known_tokens(inputs, dataroot, version='v1.0-trainval') == inputs
+
+print('✅ sample_token 检查测试通过')
+"
+
+    info "sample_token 检查测试完成"
+}
+
+# 测试分块校验和 (记录、损坏块定位和截断)
+test_file_checksum() {
+    log "测试分块校验和功能..."
+    
+    python3 -c "
+import os
+import sys
+import json
+import hashlib
+import subprocess
+sys.path.append('$TOOLS_DIR')
+from file_checksum import combine_chunks
+
+work = '$TEST_DIR/checksum'
+os.makedirs(work, exist_ok=True)
+archive = os.path.join(work, 'archive.tgz')
+manifest = os.path.join(work, 'checksums.json')
+data = bytes(range(256)) * (4096 * 3 + 100)     # 3MB 多一点，按1MB分为4块
+with open(archive, 'wb') as f:
+    f.write(data)
+
+def run(*args):
+    cmd = [sys.executable, '$TOOLS_DIR/file_checksum.py', manifest, *args,
+           '--chunk-size-mb', '1', '--workers', '2', '--cache', os.path.join(work, 'cache.json'), '--json']
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    return result.returncode, result.stdout
+
+# 记录: 分块摘要与 hashlib 逐块计算一致
+code, _ = run(archive, '--record')
+assert code == 0
+with open(manifest) as f:
+    entry = json.load(f)['files']['archive.tgz']
+chunks = [hashlib.sha256(data[i:i + (1 << 20)]).hexdigest() for i in range(0, len(data), 1 << 20)]
+assert entry['size'] == len(data) and entry['chunks'] == chunks, entry
+assert entry['digest'] == combine_chunks(chunks, 'sha256')
+
+# 校验通过，第二次命中缓存
+code, out = run()
+assert code == 0 and json.loads(out)[0]['status'] == 'ok', out
+code, out = run()
+assert code == 0 and json.loads(out)[0]['cached'], out
+
+# 翻转第3块中的一个字节: 报告校验和不符并定位到该块
+damaged = bytearray(data)
+damaged[2 * (1 << 20) + 12345] ^= 0xFF
+with open(archive, 'wb') as f:
+    f.write(bytes(damaged))
+code, out = run()
+result = json.loads(out)[0]
+assert code == 1 and result['status'] == 'mismatch' and result['bad_chunks'] == [2], out
+
+# 截断: 只比较大小即可发现
+with open(archive, 'wb') as f:
+    f.write(data[:-1000])
+code, out = run()
+result = json.loads(out)[0]
+assert code == 1 and result['status'] == 'size_mismatch', out
+assert result['expected_size'] == len(data) and result['actual_size'] == len(data) - 1000, out
+
+# 清单中没有的文件默认算失败，--allow-unknown 时放过
+other = os.path.join(work, 'other.bin')
+open(other, 'wb').close()
+assert run(other)[0] == 1 and run(other, '--allow-unknown')[0] == 0
+
+print('✅ 分块校验和测试通过')
+"
+
+    info "分块校验和测试完成"
+}
+
+# 测试带缓存的目录大小统计
+test_directory_size() {
+    log "测试目录大小统计功能..."
+    
+    python3 -c "
+import os
+import sys
+sys.path.append('$TOOLS_DIR')
+from directory_size import DirectorySizer
+
+root = '$TEST_DIR/sizes'
+for sub in ('samples/CAM_FRONT', 'samples/LIDAR_TOP', 'downloads'):
+    os.makedirs(os.path.join(root, sub), exist_ok=True)
+def write(rel, size):
+    with open(os.path.join(root, rel), 'wb') as f:
+        f.write(b'x' * size)
+write('samples/CAM_FRONT/a.jpg', 1000)
+write('samples/CAM_FRONT/b.jpg', 2000)
+write('samples/LIDAR_TOP/c.bin', 3000)
+write('downloads/v1.0-mini.tgz', 500)
+cache = '$TEST_DIR/sizes_cache.json'
+
+result = DirectorySizer(cache).size(root)
+assert (result.total_bytes, result.files, result.directories) == (6500, 4, 5), result
+assert result.rescanned == 5
+
+# 新的统计器从缓存文件加载: 只重新扫描含压缩包的目录
+result = DirectorySizer(cache).size(root)
+assert result.total_bytes == 6500 and result.rescanned == 1, result
+
+# wget -c 续传向已有压缩包追加，目录 mtime 不变，仍能统计到新的大小
+downloads = os.path.join(root, 'downloads')
+mtime_ns = os.stat(downloads).st_mtime_ns
+with open(os.path.join(downloads, 'v1.0-mini.tgz'), 'ab') as f:
+    f.write(b'x' * 700)
+os.utime(downloads, ns=(mtime_ns, mtime_ns))
+result = DirectorySizer(cache).size(root)
+assert result.total_bytes == 7200 and result.rescanned == 1, result
+
+# 新增文件更新目录 mtime，只重新扫描该目录
+write('samples/LIDAR_TOP/d.bin', 400)
+result = DirectorySizer(cache).size(root)
+assert result.total_bytes == 7600 and result.files == 5 and result.rescanned == 2, result
+
+# 删除的目录从缓存中清理；refresh 全部重新扫描
+os.remove(os.path.join(root, 'samples/CAM_FRONT/a.jpg'))
+os.remove(os.path.join(root, 'samples/CAM_FRONT/b.jpg'))
+os.rmdir(os.path.join(root, 'samples/CAM_FRONT'))
+sizer = DirectorySizer(cache)
+result = sizer.size(root)
+assert result.total_bytes == 4600 and result.directories == 4, result
+assert not any(p.endswith('CAM_FRONT') for p in sizer._cache)
+assert sizer.size(root, refresh=True).rescanned == 4
+
+print('✅ 目录大小统计测试通过')
+"
+
+    info "目录大小统计测试完成"
+}
+
+# 测试数据集文件清单 (增量验证)
+test_dataset_manifest() {
+    log "测试数据集文件清单功能..."
+    
+    python3 -c "
+import os
+import sys
+sys.path.append('$TOOLS_DIR')
+from dataset_manifest import DatasetManifest, hash_file
+
+root = '$TEST_DIR/manifest_data'
+manifest_path = '$TEST_DIR/manifest.json'
+os.makedirs(os.path.join(root, 'v1.0-mini'), exist_ok=True)
+os.makedirs(os.path.join(root, 'samples/CAM_FRONT'), exist_ok=True)
+def write(rel, text):
+    with open(os.path.join(root, rel), 'w') as f:
+        f.write(text)
+write('v1.0-mini/sample.json', '[]')
+write('v1.0-mini/scene.json', '[]')
+write('samples/CAM_FRONT/a.jpg', 'jpeg')
+
+# 首次建立清单
+manifest = DatasetManifest(root, manifest_path, hash_files=True)
+diff = manifest.update()
+assert diff.baseline and diff.files == 3 and diff.hashed == 3 and len(diff.added) == 3, diff
+assert manifest.entries['samples/CAM_FRONT/a.jpg'][2] == hash_file(os.path.join(root, 'samples/CAM_FRONT/a.jpg'))
+calls = []
+def check():
+    calls.append(1)
+    return {'rows': 0}
+assert manifest.cached(os.path.join(root, 'v1.0-mini/sample.json'), 'stats', check) == {'rows': 0}
+manifest.save()
+
+# 未变化: 检查结果直接复用，不再调用 compute
+manifest = DatasetManifest(root, manifest_path)
+diff = manifest.update()
+assert not diff.baseline and not diff.changed and diff.unchanged == 3, diff
+assert manifest.cached(os.path.join(root, 'v1.0-mini/sample.json'), 'stats', check) == {'rows': 0}
+assert len(calls) == 1
+assert manifest.bytes_under(os.path.join(root, 'v1.0-mini')) == 4
+
+# 新增、删除、修改 (大小变化) 都能发现，修改过的文件重新检查
+write('v1.0-mini/sample.json', '[{}]')
+os.remove(os.path.join(root, 'v1.0-mini/scene.json'))
+write('samples/CAM_FRONT/b.jpg', 'jpeg2')
+diff = manifest.update()
+assert diff.modified == ['v1.0-mini/sample.json'], diff
+assert diff.removed == ['v1.0-mini/scene.json'], diff
+assert diff.added == ['samples/CAM_FRONT/b.jpg'], diff
+assert diff.unchanged == 1 and diff.files == 3, diff
+assert manifest.cached(os.path.join(root, 'v1.0-mini/sample.json'), 'stats', check) == {'rows': 0}
+assert len(calls) == 2
+manifest.save()
+
+# 大小不变、只有 mtime 变化也算修改
+path = os.path.join(root, 'samples/CAM_FRONT/a.jpg')
+st = os.stat(path)
+os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+diff = DatasetManifest(root, manifest_path).update()
+assert diff.modified == ['samples/CAM_FRONT/a.jpg'] and not diff.added and not diff.removed, diff
+
+print('✅ 数据集文件清单测试通过')
+"
+
+    info "数据集文件清单测试完成"
+}
+
+# 测试分层抽样生成评测样本列表
+test_sample_list() {
+    log "测试分层抽样功能..."
+    
+    python3 -c "
+import os
+import sys
+import json
+sys.path.append('$TOOLS_DIR')
+from sample_index import SampleIndex, build_sample_index
+from sample_list import _allocate, select_samples, write_selection
+
+# 最大余数法按比例分配，分到0个的非空层从分配最多的层借1个
+assert _allocate([10, 5], 7) == [5, 2]
+assert _allocate([100, 1, 1], 10) == [8, 1, 1]
+assert _allocate([100, 1, 0], 10) == [9, 1, 0]
+assert _allocate([3, 2], 10) == [3, 2]
+assert sum(_allocate([37, 21, 9, 2], 25)) == 25
+
+# 4个场景 (2个夜间)，每个场景10个样本，标注数随样本递增
+dataroot = '$TEST_DIR/nuscenes_strata'
+os.makedirs(os.path.join(dataroot, 'v1.0-mini'), exist_ok=True)
+scenes = [{'token': f's{i:031d}', 'name': f'scene-{i:04d}',
+           'description': 'Night, parking lot' if i < 2 else 'Sunny, intersection'} for i in range(4)]
+samples = [{'token': f'{i * 10 + j:032x}', 'scene_token': scenes[i]['token'], 'timestamp': j, 'prev': '', 'next': ''}
+           for i in range(4) for j in range(10)]
+annotations = [{'sample_token': sample['token']} for k, sample in enumerate(samples) for _ in range(k % 10)]
+tables = {'sensor': [], 'calibrated_sensor': [], 'sample_data': [], 'ego_pose': [],
+          'scene': scenes, 'sample': samples, 'sample_annotation': annotations}
+for name, rows in tables.items():
+    with open(os.path.join(dataroot, 'v1.0-mini', name + '.json'), 'w') as f:
+        json.dump(rows, f)
+index = SampleIndex(str(build_sample_index(dataroot, 'v1.0-mini', verbose=False)))
+
+selection = select_samples(index, 12, shards=5, seed=3)
+tokens = selection.tokens
+assert len(tokens) == 12 and len(set(tokens)) == 12, tokens
+assert sorted(len(shard) for shard in selection.shards) == [2, 2, 2, 3, 3], selection.shards
+assert selection.population == 40 and selection.scenes_covered == 4, selection
+# 夜间/白天各占一半，各3个目标密度分箱
+assert sum(s.population for s in selection.summary) == 40
+assert sum(s.selected for s in selection.summary) == 12
+assert sum(s.selected for s in selection.summary if s.key.startswith('night')) == 6, selection.summary
+for stratum in selection.summary:
+    assert abs(stratum.weight - stratum.population / stratum.selected) < 1e-3, stratum
+
+# 相同种子结果相同；限定场景时只从这些场景中抽取
+assert select_samples(index, 12, shards=5, seed=3).shards == selection.shards
+subset = select_samples(index, 6, strata=('scene',), scene_names=['scene-0000', 'scene-0003'])
+scene_of = {sample['token']: sample['scene_token'] for sample in samples}
+assert {scene_of[t] for t in subset.tokens} == {scenes[0]['token'], scenes[3]['token']}, subset.tokens
+
+# 输出: 每个分片一个token文件目录，或一个token列表
+out = write_selection(selection, '$TEST_DIR/subset')
+assert sorted(os.listdir(out / 'shard_00')) == sorted(t + '.txt' for t in selection.shards[0])
+with open(out / 'selection.json') as f:
+    assert json.load(f)['selected'] == 12
+out = write_selection(selection, '$TEST_DIR/subset_list', fmt='list')
+assert (out / 'shard_04.txt').read_text().split() == selection.shards[4]
+
+print('✅ 分层抽样测试通过')
+"
+
+    info "分层抽样测试完成"
+}
+
+# 测试进程树资源统计 (短命worker的CPU时间)
+test_process_tree() {
+    log "测试进程树资源统计功能..."
+    
+    python3 -c "
+import sys
+sys.path.append('$TOOLS_DIR')
+from process_tree import JobTracker
+
+# 12个worker各消耗0.15s CPU，每个都在两次采样之间启动并退出
+script = '''
+import time
+import multiprocessing
+
+def burn():
+    end = time.process_time() + 0.15
+    while time.process_time() < end:
+        pass
+
+if __name__ == '__main__':
+    for _ in range(6):
+        workers = [multiprocessing.Process(target=burn) for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+'''
+tracker = JobTracker('cpu-test', interval=0.5, include_pss=False)
+result = tracker.run([sys.executable, '-c', script], check=True)
+usage = tracker.usage()
+assert result.returncode == 0 and usage.samples > 0, usage
+assert usage.cpu_seconds >= 12 * 0.15, usage
+assert usage.avg_cpu_percent > 0, usage
+
+print(f'✅ 进程树统计测试通过 (CPU {usage.cpu_seconds:.2f}s)')
+"
+
+    info "进程树资源统计测试完成"
+}
+
 # 测试健康检查
 test_health_check() {
     log "测试健康检查功能..."
     
     # 测试基础健康检查
-    python3 "$SCRIPT_DIR/../tools/health_check.py" --model MapTR --mode check > "$TEST_DIR/health_test.json"
+    python3 "$TOOLS_DIR/health_check.py" --model MapTR --mode check > "$TEST_DIR/health_test.json"
     
     # 验证输出
     if [ -f "$TEST_DIR/health_test.json" ]; then
@@ -302,13 +1000,90 @@ print(f'系统状态: {health[\"status\"]}')
     info "健康检查测试完成"
 }
 
+# 测试热就绪探针
+test_readiness_probe() {
+    log "测试热就绪探针功能..."
+    
+    python3 -c "
+import sys
+import json
+import time
+import threading
+import urllib.error
+import urllib.request
+import numpy as np
+sys.path.append('$TOOLS_DIR')
+from readiness_probe import ReadinessProbe
+from health_check import create_health_endpoint
+
+class FakeProbe(ReadinessProbe):
+    '''用休眠代替模型加载，不依赖 torch/mmcv'''
+    def __init__(self, load_s=0.0, fail=False, **kwargs):
+        super().__init__('MapTR', device='cpu', **kwargs)
+        self.load_s, self.fail, self.loads = load_s, fail, 0
+    def _load(self):
+        self.loads += 1
+        time.sleep(self.load_s)
+        if self.fail:
+            raise FileNotFoundError('模型检查点不存在')
+        self.model = object()
+        self._inputs = (np.zeros((1, 6, 3, 32, 32)), {})
+        self.load_time = self.load_s
+    def _forward(self):
+        return 0.001
+
+# 加载失败在 min_interval 内复用，force 也不重试
+failing = FakeProbe(fail=True, min_interval=60)
+first = failing.probe(force=True)
+second = failing.probe(force=True)
+assert not first['ready'] and first['state'] == 'failed', first
+assert second is first and failing.loads == 1, failing.loads
+failing.min_interval = 0
+assert not failing.probe()['ready'] and failing.loads == 2, failing.loads
+
+# /ready 在采样线程预热期间立即返回503 (warming)，加载完成后返回200
+probe = FakeProbe(load_s=1.0, min_interval=0.1)
+server_cls, handler = create_health_endpoint('MapTR', refresh_interval=0.2, readiness=probe)
+server = server_cls(('127.0.0.1', 0), handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+url = 'http://127.0.0.1:%d/ready' % server.server_address[1]
+
+def get_ready():
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+try:
+    start = time.monotonic()
+    status, body = get_ready()
+    assert time.monotonic() - start < 0.5, '请求被模型加载阻塞'
+    assert status == 503 and body['state'] == 'warming', (status, body)
+
+    deadline = time.monotonic() + 5
+    while status != 200 and time.monotonic() < deadline:
+        time.sleep(0.1)
+        status, body = get_ready()
+    assert status == 200 and body['state'] == 'ready', (status, body)
+    assert body['forward_mode'] == 'full' and probe.loads == 1, body
+finally:
+    server.shutdown()
+    handler.sampler.stop()
+
+print('✅ 热就绪探针测试通过')
+"
+
+    info "热就绪探针测试完成"
+}
+
 # 测试配置管理
 test_config_management() {
     log "测试配置管理功能..."
     
     # 测试配置列表
-    if [ -f "$SCRIPT_DIR/list_model_configs.sh" ]; then
-        bash "$SCRIPT_DIR/list_model_configs.sh" > "$TEST_DIR/config_list_test.txt"
+    if [ -f "$UTILS_DIR/list_model_configs.sh" ]; then
+        bash "$UTILS_DIR/list_model_configs.sh" > "$TEST_DIR/config_list_test.txt"
         
         if grep -q "MapTR" "$TEST_DIR/config_list_test.txt"; then
             info "✅ 配置列表测试通过"
@@ -320,7 +1095,7 @@ test_config_management() {
     fi
     
     # 测试脚本语法
-    if bash -n "$SCRIPT_DIR/run_model_with_mount.sh"; then
+    if bash -n "$UTILS_DIR/run_model_with_mount.sh"; then
         info "✅ 运行脚本语法检查通过"
     else
         error "运行脚本语法错误"
@@ -330,6 +1105,51 @@ test_config_management() {
     info "配置管理测试完成"
 }
 
+# 各项测试及摘要说明 (函数名|说明)
+TEST_CASES=(
+    "test_output_standardization|输出标准化功能正常"
+    "test_model_comparison|模型比较功能正常"
+    "test_import_budget|工具导入耗时达标"
+    "test_tracking_metrics|跟踪评测指标正确"
+    "test_planning_metrics|规划评测指标正确"
+    "test_topology_metrics|车道拓扑评测指标正确"
+    "test_tfrecord_scan|TFRecord扫描功能正常"
+    "test_parquet_scan|Parquet扫描功能正常"
+    "test_admission_control|内存准入控制功能正常"
+    "test_token_filter|sample_token 检查功能正常"
+    "test_file_checksum|分块校验和功能正常"
+    "test_directory_size|目录大小统计功能正常"
+    "test_dataset_manifest|数据集文件清单功能正常"
+    "test_sample_list|分层抽样功能正常"
+    "test_process_tree|进程树资源统计功能正常"
+    "test_health_check|健康检查功能正常"
+    "test_readiness_probe|热就绪探针功能正常"
+    "test_config_management|配置管理功能正常"
+)
+FAILED_TESTS=()
+
+on_error() {
+    error "测试过程中出现错误"
+    exit 1
+}
+
+# 在子shell中运行一项测试 (遇错即停)，失败时记录下来，继续运行其余各项
+# 注意不能写成 "run_case x || ..."，条件上下文中子shell的 set -e 不生效
+run_case() {
+    local name="$1"
+    local status
+    trap - ERR
+    set +e
+    ( set -e; "$name" )
+    status=$?
+    set -e
+    trap on_error ERR
+    if [ $status -ne 0 ]; then
+        error "$name 失败 (退出码 $status)"
+        FAILED_TESTS+=("$name")
+    fi
+}
+
 # 主测试函数
 run_tests() {
     log "🚀 开始多模型评测系统测试"
@@ -340,23 +1160,31 @@ run_tests() {
     
     # 运行各项测试
     create_test_data
-    test_output_standardization
-    test_model_comparison
-    test_health_check
-    test_config_management
-    
-    log "🎉 所有测试完成！"
+    local entry
+    for entry in "${TEST_CASES[@]}"; do
+        run_case "${entry%%|*}"
+    done
     
     # 显示测试结果摘要
     echo ""
     echo "📊 测试结果摘要:"
-    echo "  ✅ 输出标准化功能正常"
-    echo "  ✅ 模型比较功能正常"
-    echo "  ✅ 健康检查功能正常"
-    echo "  ✅ 配置管理功能正常"
+    for entry in "${TEST_CASES[@]}"; do
+        if [[ " ${FAILED_TESTS[*]} " == *" ${entry%%|*} "* ]]; then
+            echo "  ❌ ${entry#*|} (${entry%%|*} 失败)"
+        else
+            echo "  ✅ ${entry#*|}"
+        fi
+    done
     echo ""
     echo "📁 测试文件保存在: $TEST_DIR"
     
+    if [ ${#FAILED_TESTS[@]} -gt 0 ]; then
+        error "${#FAILED_TESTS[@]}/${#TEST_CASES[@]} 项测试失败: ${FAILED_TESTS[*]}"
+        exit 1
+    fi
+    
+    log "🎉 所有测试完成！"
+    
     # 列出生成的文件
     echo "生成的测试文件:"
     find "$TEST_DIR" -type f | head -10 | while read file; do
@@ -372,7 +1200,7 @@ run_tests() {
 }
 
 # 错误处理
-trap 'error "测试过程中出现错误"; exit 1' ERR
+trap on_error ERR
 
 # 运行测试
 run_tests
\ No newline at end of file
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+内存感知的任务准入控制
+从历史运行记录中学习每个模型的主机内存和显存峰值，启动任务前对照当前空闲内存
+(容器cgroup预算和GPU遥测) 判断能否放下；放不下的任务排队等待，
+避免多个模型 (如 VAD 与 StreamPETR) 同时运行时反复 OOM 被杀再重试。
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import psutil
+
+try:
+    import fcntl
+except ImportError:  # 非POSIX平台不加锁
+    fcntl = None
+
+from cgroup_limits import read_container_resources
+from gpu_telemetry import get_telemetry
+
+# 与 inference_metrics 使用同一共享目录，容器挂载该目录即可把运行记录回传给调度方
+PROFILE_PATH = os.environ.get(
+    'MEMORY_PROFILE_PATH',
+    os.path.join(os.environ.get('INFERENCE_METRICS_DIR', '/tmp/inference_metrics'), 'memory_profiles.json'),
+)
+
+# 没有历史记录的模型按保守值估计 (MB)
+DEFAULT_UNKNOWN_HOST_MB = 8192.0
+DEFAULT_UNKNOWN_GPU_MB = 8192.0
+
+# 同一进程内 (如调度方的多个线程) 判断与预留串行执行；跨进程由账本文件锁保证
+_ADMIT_LOCK = threading.Lock()
+
+
+@dataclass
+class MemoryEstimate:
+    """模型的内存峰值估计 (MB)"""
+    model: str
+    host_mb: float
+    gpu_mb: float
+    runs: int              # 参与估计的历史运行数，0 表示使用默认值
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class AdmissionDecision:
+    """一次准入判断的结果 (MB)"""
+    model: str
+    admitted: bool
+    reason: str
+    required_host_mb: float
+    required_gpu_mb: float
+    free_host_mb: float
+    free_gpu_mb: Optional[float]
+    reserved_host_mb: float
+    reserved_gpu_mb: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class MemoryProfileStore:
+    """模型内存峰值记录和运行中任务的预留账本
+
+    单个JSON文件，在文件锁内读取-修改-原子替换，多个进程 (包装脚本、调度方) 可同时使用：
+        {"profiles": {模型: [{"time", "host_mb", "gpu_mb"}, ...]},
+         "reservations": {预留ID: {"model", "host_mb", "gpu_mb", "pid", "started"}}}
+    每个模型只保留最近 history 次运行，估计值取其中的最大峰值。
+    """
+
+    def __init__(self, path: str = PROFILE_PATH, history: int = 20):
+        self.path = Path(path)
+        self.history = history
+
+    @contextmanager
+    def _locked(self) -> Iterator[Dict[str, Any]]:
+        """加锁读取数据，退出时写回"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_suffix('.lock'), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            data = self._read()
+            yield data
+            tmp = self.path.with_suffix('.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp, self.path)
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        data.setdefault('profiles', {})
+        data.setdefault('reservations', {})
+        return data
+
+    # ---- 峰值记录 ----
+
+    def record(self, model: str, host_mb: Optional[float], gpu_mb: Optional[float]):
+        """记录一次运行的峰值 (未测得的项记为None，不参与估计)"""
+        with self._locked() as data:
+            runs = data['profiles'].setdefault(model, [])
+            runs.append({'time': time.time(), 'host_mb': host_mb, 'gpu_mb': gpu_mb})
+            del runs[:-self.history]
+
+    def record_usage(self, model: str, usage):
+        """记录一个推理任务的资源使用 (process_tree.JobUsage)"""
+        if not usage.samples:
+            return
+        host_mb = usage.peak_pss_mb if usage.peak_pss_mb is not None else usage.peak_rss_mb
+        self.record(model, host_mb, usage.peak_gpu_mb)
+
+    def estimate(self, model: str,
+                 default_host_mb: float = DEFAULT_UNKNOWN_HOST_MB,
+                 default_gpu_mb: float = DEFAULT_UNKNOWN_GPU_MB,
+                 data: Optional[Dict[str, Any]] = None) -> MemoryEstimate:
+        """data: 调用方已在 _locked() 内读取的数据，为空时重新读取"""
+        runs = (data if data is not None else self._read())['profiles'].get(model, [])
+        host = [r['host_mb'] for r in runs if r.get('host_mb') is not None]
+        gpu = [r['gpu_mb'] for r in runs if r.get('gpu_mb') is not None]
+        return MemoryEstimate(
+            model=model,
+            host_mb=max(host) if host else default_host_mb,
+            gpu_mb=max(gpu) if gpu else default_gpu_mb,
+            runs=len(runs),
+        )
+
+    def profiles(self) -> Dict[str, List[Dict[str, Any]]]:
+        return self._read()['profiles']
+
+    # ---- 预留账本 ----
+
+    def reserve(self, model: str, host_mb: float, gpu_mb: float,
+                data: Optional[Dict[str, Any]] = None) -> str:
+        """写入一条预留；data 为调用方已在 _locked() 内读取的数据时直接写入，不再加锁"""
+        if data is None:
+            with self._locked() as data:
+                return self.reserve(model, host_mb, gpu_mb, data)
+        reservation_id = uuid.uuid4().hex[:12]
+        data['reservations'][reservation_id] = {
+            'model': model, 'host_mb': host_mb, 'gpu_mb': gpu_mb,
+            'pid': os.getpid(), 'started': time.time(),
+        }
+        return reservation_id
+
+    def release(self, reservation_id: str):
+        with self._locked() as data:
+            data['reservations'].pop(reservation_id, None)
+
+    def reservations(self, data: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+        """有效的预留 (顺带清理持有进程已退出的预留)
+
+        data 为调用方已在 _locked() 内读取的数据时直接在其上清理，不再加锁。
+        """
+        if data is None:
+            with self._locked() as data:
+                return self.reservations(data)
+        reservations = data['reservations']
+        for key in [k for k, r in reservations.items() if not psutil.pid_exists(r['pid'])]:
+            del reservations[key]
+        return dict(reservations)
+
+
+class AdmissionController:
+    """内存感知的准入控制
+
+    新任务需同时满足两个条件才放行:
+      1. 容量: 所有运行中任务的峰值估计之和加上新任务，不超过总量的 (1 - safety_margin)，
+         保证各任务峰值即使同时出现也放得下；
+      2. 空闲: 新任务峰值不超过当前空闲量减去安全余量，再减去仍在启动期
+         (ramp_up_s 内，内存尚未分配到位) 的任务的预留。
+    主机内存取容器cgroup预算，显存取 device 号GPU；无GPU时只检查主机内存。
+    """
+
+    def __init__(self, store: Optional[MemoryProfileStore] = None,
+                 safety_margin: float = 0.1, ramp_up_s: float = 120.0,
+                 device: int = 0, poll_interval: float = 5.0):
+        self.store = store or MemoryProfileStore()
+        self.safety_margin = safety_margin
+        self.ramp_up_s = ramp_up_s
+        self.device = device
+        self.poll_interval = poll_interval
+
+    def _free_memory(self) -> Tuple[float, float, Optional[float], Optional[float]]:
+        """(主机总量, 主机空闲, GPU总量, GPU空闲)，单位MB；无GPU时后两项为None"""
+        resources = read_container_resources()
+        host_total = resources.memory_total_bytes / (1024 ** 2)
+        host_free = resources.memory_available_bytes / (1024 ** 2)
+        snapshot = get_telemetry().snapshot(include_processes=False, max_age=0)
+        for device in snapshot.devices:
+            if device.index == self.device:
+                return host_total, host_free, device.memory_total_mb, device.memory_free_mb
+        return host_total, host_free, None, None
+
+    def check(self, model: str, data: Optional[Dict[str, Any]] = None) -> AdmissionDecision:
+        """判断模型现在能否启动 (不阻塞、不预留)
+
+        data: 已在 store._locked() 内读取的账本数据 (admit 在同一把文件锁内判断并预留)；
+        为空时自行加锁读取。
+        """
+        if data is None:
+            with self.store._locked() as data:
+                return self.check(model, data)
+        estimate = self.store.estimate(model, data=data)
+        host_total, host_free, gpu_total, gpu_free = self._free_memory()
+        reservations = self.store.reservations(data).values()
+        now = time.time()
+
+        reserved_host = sum(r['host_mb'] for r in reservations)
+        reserved_gpu = sum(r['gpu_mb'] for r in reservations)
+        ramping = [r for r in reservations if now - r['started'] < self.ramp_up_s]
+        ramping_host = sum(r['host_mb'] for r in ramping)
+        ramping_gpu = sum(r['gpu_mb'] for r in ramping)
+
+        reasons = []
+        if reserved_host + estimate.host_mb > host_total * (1 - self.safety_margin):
+            reasons.append(f"主机内存容量不足: 运行中预留 {reserved_host:.0f}MB + "
+                           f"需要 {estimate.host_mb:.0f}MB > 总量 {host_total:.0f}MB 的 "
+                           f"{(1 - self.safety_margin) * 100:.0f}%")
+        elif estimate.host_mb > host_free - host_total * self.safety_margin - ramping_host:
+            reasons.append(f"主机空闲内存不足: 需要 {estimate.host_mb:.0f}MB, 空闲 {host_free:.0f}MB "
+                           f"(启动中任务预留 {ramping_host:.0f}MB)")
+
+        if gpu_total is not None:
+            if reserved_gpu + estimate.gpu_mb > gpu_total * (1 - self.safety_margin):
+                reasons.append(f"GPU{self.device} 显存容量不足: 运行中预留 {reserved_gpu:.0f}MB + "
+                               f"需要 {estimate.gpu_mb:.0f}MB > 总量 {gpu_total:.0f}MB 的 "
+                               f"{(1 - self.safety_margin) * 100:.0f}%")
+            elif estimate.gpu_mb > gpu_free - gpu_total * self.safety_margin - ramping_gpu:
+                reasons.append(f"GPU{self.device} 空闲显存不足: 需要 {estimate.gpu_mb:.0f}MB, "
+                               f"空闲 {gpu_free:.0f}MB (启动中任务预留 {ramping_gpu:.0f}MB)")
+
+        # 没有任何运行中任务时总是放行，单个任务本身放不下属于配置问题，排队也无济于事
+        admitted = not reasons or not reservations
+        return AdmissionDecision(
+            model=model,
+            admitted=admitted,
+            reason='; '.join(reasons) if reasons else 'ok',
+            required_host_mb=estimate.host_mb,
+            required_gpu_mb=estimate.gpu_mb,
+            free_host_mb=host_free,
+            free_gpu_mb=gpu_free,
+            reserved_host_mb=reserved_host,
+            reserved_gpu_mb=reserved_gpu,
+        )
+
+    @contextmanager
+    def admit(self, model: str, timeout: Optional[float] = None,
+              verbose: bool = True) -> Iterator[AdmissionDecision]:
+        """等待准入后预留内存，代码块结束时释放预留
+
+        判断和预留在同一把账本文件锁内完成，共享账本的多个调度进程不会同时通过检查。
+        超过 timeout 仍未放行时抛出 TimeoutError。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waiting = False
+        while True:
+            with _ADMIT_LOCK, self.store._locked() as data:
+                decision = self.check(model, data)
+                if decision.admitted:
+                    reservation_id = self.store.reserve(
+                        model, decision.required_host_mb, decision.required_gpu_mb, data)
+                    break
+            if verbose and not waiting:
+                print(f"⏳ {model} 等待内存: {decision.reason}")
+                waiting = True
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"{model} 等待内存超时: {decision.reason}")
+            time.sleep(self.poll_interval)
+
+        if verbose:
+            print(f"✅ {model} 准入: 预留主机内存 {decision.required_host_mb:.0f}MB, "
+                  f"显存 {decision.required_gpu_mb:.0f}MB")
+        try:
+            yield decision
+        finally:
+            self.store.release(reservation_id)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='内存感知的任务准入控制')
+    parser.add_argument('--path', type=str, default=PROFILE_PATH, help='内存记录文件')
+    parser.add_argument('--show', action='store_true', help='显示各模型的峰值估计和当前预留')
+    parser.add_argument('--check', type=str, metavar='MODEL', help='检查模型现在能否启动')
+    parser.add_argument('--record', type=str, metavar='MODEL', help='手动记录一次运行的峰值')
+    parser.add_argument('--host-mb', type=float, help='记录的主机内存峰值 (MB)')
+    parser.add_argument('--gpu-mb', type=float, help='记录的显存峰值 (MB)')
+    parser.add_argument('--safety-margin', type=float, default=0.1, help='安全余量 (占总量比例)')
+    parser.add_argument('--device', type=int, default=0, help='GPU编号')
+
+    args = parser.parse_args()
+    store = MemoryProfileStore(args.path)
+
+    if args.record:
+        store.record(args.record, args.host_mb, args.gpu_mb)
+        print(f"📝 已记录 {args.record}: 主机 {args.host_mb or '-'}MB, 显存 {args.gpu_mb or '-'}MB")
+
+    if args.check:
+        controller = AdmissionController(store, safety_margin=args.safety_margin, device=args.device)
+        decision = controller.check(args.check)
+        print(json.dumps(decision.to_dict(), indent=2, ensure_ascii=False))
+        raise SystemExit(0 if decision.admitted else 1)
+
+    if args.show or not args.record:
+        print("📋 模型内存峰值估计:")
+        for model in sorted(store.profiles()):
+            estimate = store.estimate(model)
+            print(f"   {model}: 主机 {estimate.host_mb:.0f}MB, 显存 {estimate.gpu_mb:.0f}MB "
+                  f"({estimate.runs} 次运行)")
+        reservations = store.reservations()
+        print(f"🔒 当前预留: {len(reservations)} 个")
+        for reservation in reservations.values():
+            print(f"   {reservation['model']} (PID {reservation['pid']}): "
+                  f"主机 {reservation['host_mb']:.0f}MB, 显存 {reservation['gpu_mb']:.0f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+容器资源限制 (cgroup v1/v2)
+容器内 psutil.virtual_memory() 返回的是宿主机内存，RunPod等平台的实际预算由cgroup决定。
+本模块读取 memory.max / memory.current / memory.stat 和 cpu.max (v1对应
+memory.limit_in_bytes / memory.usage_in_bytes / cpu.cfs_quota_us)，
+给出以容器预算为准的内存总量、可用量和CPU配额；无cgroup限制时回退到宿主机数值。
+"""
+
+import os
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Optional, Tuple
+
+import psutil
+
+CGROUP_ROOT = os.environ.get("CGROUP_ROOT", "/sys/fs/cgroup")
+
+# cgroup v1 未设置限制时 memory.limit_in_bytes 为接近 2^63 的页对齐值
+_V1_UNLIMITED = 1 << 62
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _read_int(path: str) -> Optional[int]:
+    value = _read(path)
+    if value is None or value == "max":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def _read_stat(path: str) -> Dict[str, int]:
+    """读取 "key value" 格式的统计文件 (memory.stat / cpu.stat)"""
+    stats = {}
+    content = _read(path)
+    for line in (content or "").splitlines():
+        parts = line.split()
+        if len(parts) == 2:
+            try:
+                stats[parts[0]] = int(parts[1])
+            except ValueError:
+                pass
+    return stats
+
+
+def _own_cgroups() -> Dict[str, str]:
+    """解析 /proc/self/cgroup: 控制器 -> cgroup路径 (v2 统一层级的键为 '')"""
+    groups = {}
+    content = _read("/proc/self/cgroup")
+    for line in (content or "").splitlines():
+        parts = line.split(":", 2)
+        if len(parts) != 3:
+            continue
+        for controller in parts[1].split(","):
+            groups[controller] = parts[2]
+    return groups
+
+
+def _controller_dir(root: str, controller: str, groups: Dict[str, str],
+                    probe: str) -> Optional[str]:
+    """定位控制器目录
+
+    开启cgroup命名空间的容器内，自身cgroup即挂载点根目录；
+    未开启时 /proc/self/cgroup 给出的是宿主机视角的路径，需拼接后查找。
+    """
+    base = os.path.join(root, controller) if controller else root
+    candidates = []
+    path = groups.get(controller, "/").lstrip("/")
+    if path:
+        candidates.append(os.path.join(base, path))
+    candidates.append(base)
+    for candidate in candidates:
+        if os.path.exists(os.path.join(candidate, probe)):
+            return candidate
+    return None
+
+
+def _find_v1_dir(root: str, groups: Dict[str, str], names: Tuple[str, ...],
+                 probe: str) -> Optional[str]:
+    """v1 各控制器单独挂载，cpu/cpuacct 可能合并挂载为 cpu,cpuacct"""
+    for name in names:
+        path = groups.get(name.split(",")[0], "/")
+        directory = _controller_dir(root, name, {name: path}, probe)
+        if directory:
+            return directory
+    return None
+
+
+@dataclass
+class ContainerResources:
+    """容器资源快照 (字节/核数)
+
+    memory_total_bytes / memory_available_bytes / memory_percent 已按容器预算计算，
+    可直接替代 psutil.virtual_memory() 的对应字段。
+    """
+    cgroup_version: Optional[int]
+    memory_limit_bytes: Optional[int]        # None 表示cgroup未限制
+    memory_usage_bytes: Optional[int]        # 含页缓存
+    memory_working_set_bytes: Optional[int]  # 用量减去可回收的非活跃文件页 (与kubelet口径一致)
+    memory_stat: Dict[str, int]
+    cpu_quota_cores: Optional[float]         # None 表示未设置CPU配额
+    cpu_usage_seconds: Optional[float]       # cgroup累计CPU时间
+    host_memory_total_bytes: int
+    host_memory_available_bytes: int
+    host_cpu_count: int
+
+    @property
+    def memory_limited(self) -> bool:
+        return self.memory_limit_bytes is not None
+
+    @property
+    def memory_total_bytes(self) -> int:
+        if self.memory_limit_bytes is None:
+            return self.host_memory_total_bytes
+        return min(self.memory_limit_bytes, self.host_memory_total_bytes)
+
+    @property
+    def memory_used_bytes(self) -> int:
+        if self.memory_limit_bytes is None or self.memory_working_set_bytes is None:
+            return self.host_memory_total_bytes - self.host_memory_available_bytes
+        return self.memory_working_set_bytes
+
+    @property
+    def memory_available_bytes(self) -> int:
+        available = self.memory_total_bytes - self.memory_used_bytes
+        # 宿主机本身内存紧张时，容器预算内的空间也未必拿得到
+        return max(0, min(available, self.host_memory_available_bytes))
+
+    @property
+    def memory_percent(self) -> float:
+        total = self.memory_total_bytes
+        return self.memory_used_bytes / total * 100 if total else 0.0
+
+    @property
+    def cpu_limit(self) -> float:
+        """可用CPU核数 (配额或宿主机核数中较小者)"""
+        if self.cpu_quota_cores is None:
+            return float(self.host_cpu_count)
+        return min(self.cpu_quota_cores, float(self.host_cpu_count))
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.update({
+            'memory_limited': self.memory_limited,
+            'memory_total_bytes': self.memory_total_bytes,
+            'memory_used_bytes': self.memory_used_bytes,
+            'memory_available_bytes': self.memory_available_bytes,
+            'memory_percent': self.memory_percent,
+            'cpu_limit': self.cpu_limit,
+        })
+        return data
+
+
+def _read_v2(directory: str) -> Dict[str, Any]:
+    memory_max = _read_int(os.path.join(directory, "memory.max"))
+    usage = _read_int(os.path.join(directory, "memory.current"))
+    stat = _read_stat(os.path.join(directory, "memory.stat"))
+
+    quota = None
+    cpu_max = _read(os.path.join(directory, "cpu.max"))
+    if cpu_max:
+        parts = cpu_max.split()
+        if len(parts) == 2 and parts[0] != "max":
+            try:
+                quota = int(parts[0]) / int(parts[1])
+            except (ValueError, ZeroDivisionError):
+                quota = None
+
+    cpu_stat = _read_stat(os.path.join(directory, "cpu.stat"))
+    cpu_seconds = cpu_stat["usage_usec"] / 1e6 if "usage_usec" in cpu_stat else None
+    return {
+        'memory_limit_bytes': memory_max,
+        'memory_usage_bytes': usage,
+        'memory_stat': stat,
+        'inactive_file': stat.get("inactive_file", 0),
+        'cpu_quota_cores': quota,
+        'cpu_usage_seconds': cpu_seconds,
+    }
+
+
+def _read_v1(root: str, groups: Dict[str, str]) -> Dict[str, Any]:
+    result = {
+        'memory_limit_bytes': None,
+        'memory_usage_bytes': None,
+        'memory_stat': {},
+        'inactive_file': 0,
+        'cpu_quota_cores': None,
+        'cpu_usage_seconds': None,
+    }
+
+    memory_dir = _find_v1_dir(root, groups, ("memory",), "memory.usage_in_bytes")
+    if memory_dir:
+        limit = _read_int(os.path.join(memory_dir, "memory.limit_in_bytes"))
+        stat = _read_stat(os.path.join(memory_dir, "memory.stat"))
+        # 父层级的限制体现在 hierarchical_memory_limit 中
+        hierarchical = stat.get("hierarchical_memory_limit")
+        if hierarchical is not None and (limit is None or hierarchical < limit):
+            limit = hierarchical
+        result.update({
+            'memory_limit_bytes': limit if limit is not None and limit < _V1_UNLIMITED else None,
+            'memory_usage_bytes': _read_int(os.path.join(memory_dir, "memory.usage_in_bytes")),
+            'memory_stat': stat,
+            'inactive_file': stat.get("total_inactive_file", stat.get("inactive_file", 0)),
+        })
+
+    cpu_dir = _find_v1_dir(root, groups, ("cpu,cpuacct", "cpu"), "cpu.cfs_quota_us")
+    if cpu_dir:
+        quota = _read_int(os.path.join(cpu_dir, "cpu.cfs_quota_us"))
+        period = _read_int(os.path.join(cpu_dir, "cpu.cfs_period_us"))
+        if quota is not None and quota > 0 and period:
+            result['cpu_quota_cores'] = quota / period
+
+    cpuacct_dir = _find_v1_dir(root, groups, ("cpu,cpuacct", "cpuacct"), "cpuacct.usage")
+    if cpuacct_dir:
+        usage_ns = _read_int(os.path.join(cpuacct_dir, "cpuacct.usage"))
+        if usage_ns is not None:
+            result['cpu_usage_seconds'] = usage_ns / 1e9
+    return result
+
+
+def read_container_resources(root: str = CGROUP_ROOT) -> ContainerResources:
+    """读取当前进程所在cgroup的资源限制和用量"""
+    groups = _own_cgroups()
+    version = None
+    values = None
+
+    v2_dir = _controller_dir(root, "", groups, "cgroup.controllers")
+    if v2_dir and os.path.exists(os.path.join(v2_dir, "memory.current")):
+        version = 2
+        values = _read_v2(v2_dir)
+    elif os.path.isdir(os.path.join(root, "memory")) or os.path.isdir(os.path.join(root, "cpu")):
+        version = 1
+        values = _read_v1(root, groups)
+
+    vm = psutil.virtual_memory()
+    working_set = None
+    if values and values['memory_usage_bytes'] is not None:
+        working_set = max(0, values['memory_usage_bytes'] - values['inactive_file'])
+
+    return ContainerResources(
+        cgroup_version=version,
+        memory_limit_bytes=values['memory_limit_bytes'] if values else None,
+        memory_usage_bytes=values['memory_usage_bytes'] if values else None,
+        memory_working_set_bytes=working_set,
+        memory_stat=values['memory_stat'] if values else {},
+        cpu_quota_cores=values['cpu_quota_cores'] if values else None,
+        cpu_usage_seconds=values['cpu_usage_seconds'] if values else None,
+        host_memory_total_bytes=vm.total,
+        host_memory_available_bytes=vm.available,
+        host_cpu_count=psutil.cpu_count() or 1,
+    )
+
+
+class ContainerCPUMeter:
+    """以容器CPU配额为分母的CPU使用率
+
+    语义与 psutil.cpu_percent 一致: interval>0 时阻塞采样，
+    None 时返回距上次调用以来的使用率 (首次调用返回0)。
+    无cgroup CPU统计时回退到 psutil.cpu_percent (宿主机口径)。
+    """
+
+    def __init__(self, root: str = CGROUP_ROOT):
+        self.root = root
+        self._last: Optional[Tuple[float, float]] = None
+
+    def _read(self) -> Tuple[Optional[float], float]:
+        resources = read_container_resources(self.root)
+        return resources.cpu_usage_seconds, resources.cpu_limit
+
+    def percent(self, interval: Optional[float] = None) -> float:
+        usage, limit = self._read()
+        if usage is None:
+            return psutil.cpu_percent(interval=interval)
+
+        now = time.monotonic()
+        if interval:
+            time.sleep(interval)
+            previous = (now, usage)
+            usage, limit = self._read()
+            now = time.monotonic()
+        else:
+            previous = self._last
+        self._last = (now, usage)
+
+        if previous is None or now <= previous[0]:
+            return 0.0
+        used = (usage - previous[1]) / (now - previous[0])
+        return max(0.0, min(100.0, used / limit * 100))
+
+
+def main():
+    import json
+
+    resources = read_container_resources()
+    gb = 1024 ** 3
+    print(f"📦 cgroup: {'v%d' % resources.cgroup_version if resources.cgroup_version else '未检测到'}")
+    if resources.memory_limited:
+        print(f"💾 内存限制: {resources.memory_limit_bytes / gb:.2f}GB "
+              f"(宿主机 {resources.host_memory_total_bytes / gb:.2f}GB)")
+    else:
+        print(f"💾 内存未限制，使用宿主机总量: {resources.host_memory_total_bytes / gb:.2f}GB")
+    print(f"   已用 (工作集): {resources.memory_used_bytes / gb:.2f}GB ({resources.memory_percent:.1f}%)")
+    print(f"   可用: {resources.memory_available_bytes / gb:.2f}GB")
+    if resources.cpu_quota_cores is not None:
+        print(f"🖥️ CPU配额: {resources.cpu_quota_cores:g} 核 (宿主机 {resources.host_cpu_count} 核)")
+    else:
+        print(f"🖥️ CPU未限制: {resources.host_cpu_count} 核")
+    print(json.dumps(resources.to_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,7 @@ import importlib
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional, Any
 import warnings
+from gpu_telemetry import get_telemetry
 import mmdet
 import mmdet3d
 import mmcv
@@ -186,23 +187,21 @@ class DependencyChecker:
             self.log_result("PyTorch", False, "PyTorch未安装，无法检查GPU")
             return False
         
-        # 检查nvidia-smi
-        try:
-            result = subprocess.run(['nvidia-smi'], capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                # 解析GPU信息
-                lines = result.stdout.split('\n')
-                driver_line = [line for line in lines if 'Driver Version' in line]
-                if driver_line:
-                    driver_info = driver_line[0].split()
-                    driver_version = next((item for item in driver_info if '.' in item and item.replace('.', '').isdigit()), "Unknown")
-                    self.log_result("NVIDIA驱动", True, f"版本 {driver_version}")
-                else:
-                    self.log_result("NVIDIA驱动", True, "已安装")
-            else:
-                self.log_result("NVIDIA驱动", False, "nvidia-smi命令失败", is_critical=False)
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            self.log_result("NVIDIA驱动", False, "nvidia-smi不可用", is_critical=False)
+        # 检查NVIDIA驱动 (NVML进程内查询，不可用时回退nvidia-smi)
+        snapshot = get_telemetry().snapshot(include_processes=False)
+        if snapshot.devices:
+            self.log_result("NVIDIA驱动", True,
+                            f"版本 {snapshot.driver_version or 'Unknown'} ({snapshot.backend})")
+            for device in snapshot.devices:
+                self.log_result(
+                    f"GPU{device.index}", True,
+                    f"{device.name} - {device.memory_used_mb:.0f}/{device.memory_total_mb:.0f}MB"
+                )
+        elif snapshot.backend == 'none':
+            self.log_result("NVIDIA驱动", False, "NVML和nvidia-smi均不可用", is_critical=False)
+        else:
+            self.log_result("NVIDIA驱动", False,
+                            f"{snapshot.backend}查询失败: {snapshot.error or '未发现GPU'}", is_critical=False)
         
         return cuda_available if 'torch' in locals() else False
     
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+并行、带缓存的目录大小统计
+基于 os.scandir (文件大小直接取自目录项，不再逐文件 stat 路径)，用线程池并行扫描子目录，
+并按目录持久化缓存 (以目录 mtime 为键)。再次统计时每个目录只做一次 stat，
+只有 mtime 变化的目录才重新扫描，网络卷上的大型数据集也能快速复验。
+"""
+
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+CACHE_ENV = 'DIRECTORY_SIZE_CACHE'
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'runpod_det3d', 'directory_sizes.json')
+
+# 网络卷的延迟主要在元数据请求上，线程数可以远多于CPU核数
+DEFAULT_WORKERS = 16
+
+# 可能被原地追加的文件 (wget -c 续传的压缩包、gsutil/浏览器的下载临时文件)，
+# 追加写入不更新目录 mtime，含有这类文件的目录每次都重新扫描
+GROWABLE_SUFFIXES = ('.tgz', '.tar', '.gz', '.zip', '.part', '.partial', '.tmp', '.gstmp', '.crdownload')
+
+
+def walk_parallel(root: str, scan: Callable[[str], Tuple[Any, List[str]]],
+                  workers: int = DEFAULT_WORKERS) -> Iterator[Tuple[str, Any]]:
+    """并行遍历目录树
+
+    scan(目录) 返回 (该目录的结果, 需要继续遍历的子目录路径)，在线程池中执行；
+    按完成顺序产出 (目录, 结果)。scan 抛出 OSError 的目录产出 (目录, None)，不再向下遍历。
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = {executor.submit(scan, root): root}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                try:
+                    result, subdirs = future.result()
+                except OSError:
+                    yield path, None
+                    continue
+                for subdir in subdirs:
+                    pending[executor.submit(scan, subdir)] = subdir
+                yield path, result
+
+
+@dataclass
+class DirectorySize:
+    """目录统计结果"""
+    path: str
+    total_bytes: int = 0
+    files: int = 0
+    directories: int = 0
+    rescanned: int = 0      # 本次重新扫描的目录数 (其余命中缓存)
+    errors: int = 0
+    elapsed_s: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class DirectorySizer:
+    """目录大小统计器
+
+    缓存记录每个目录的 mtime、直接包含的文件总大小/数量和子目录名。
+    目录 mtime 只在其直接条目增删或改名时变化，原地改写已有文件不会更新目录 mtime。
+    解压后的数据集文件只增不改，满足这一前提；但下载脚本用 wget -c 续传时会向已有压缩包追加，
+    因此含有压缩包或下载临时文件 (GROWABLE_SUFFIXES) 的目录不使用缓存，每次重新扫描。
+    需要完全重算时使用 refresh=True。
+    与 Path.rglob 一致，符号链接文件计入其目标大小，不进入符号链接目录。
+    """
+
+    def __init__(self, cache_path: Optional[str] = None, workers: int = DEFAULT_WORKERS,
+                 use_cache: bool = True):
+        self.cache_path = Path(cache_path or os.environ.get(CACHE_ENV, DEFAULT_CACHE_PATH))
+        self.workers = workers
+        self.use_cache = use_cache
+        self._cache: Dict[str, Dict[str, Any]] = self._load() if use_cache else {}
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f).get('directories', {})
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_path.with_suffix(f'.{os.getpid()}.tmp')
+            with open(tmp, 'w') as f:
+                json.dump({'time': time.time(), 'directories': self._cache}, f)
+            os.replace(tmp, self.cache_path)
+        except OSError:
+            pass  # 缓存只是加速手段，写不了不影响结果
+
+    def _scan(self, path: str, refresh: bool) -> Tuple[Tuple[int, int, bool], List[str]]:
+        """返回目录的 ((直接文件总大小, 直接文件数, 是否重新扫描), 子目录路径)"""
+        mtime_ns = os.stat(path).st_mtime_ns
+        cached = None if refresh else self._cache.get(path)
+        # 旧版本缓存没有 growable 字段，按需要重新扫描处理
+        if cached is not None and cached['mtime_ns'] == mtime_ns and not cached.get('growable', True):
+            return (cached['bytes'], cached['files'], False), [os.path.join(path, d) for d in cached['subdirs']]
+
+        size = files = 0
+        subdirs = []
+        growable = False
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif entry.is_file():
+                        size += entry.stat().st_size
+                        files += 1
+                        growable = growable or entry.name.lower().endswith(GROWABLE_SUFFIXES)
+                except OSError:
+                    continue    # 悬空链接或扫描期间被删除
+        with self._lock:
+            self._cache[path] = {'mtime_ns': mtime_ns, 'bytes': size, 'files': files,
+                                 'subdirs': subdirs, 'growable': growable}
+        return (size, files, True), [os.path.join(path, d) for d in subdirs]
+
+    def size(self, dir_path: str, refresh: bool = False) -> DirectorySize:
+        """统计目录总大小 (并行扫描各子目录)"""
+        start = time.perf_counter()
+        root = os.path.abspath(dir_path)
+        result = DirectorySize(path=root)
+        visited = set()
+
+        for path, scanned in walk_parallel(root, lambda p: self._scan(p, refresh), self.workers):
+            if scanned is None:
+                result.errors += 1
+                continue
+            size, files, rescanned = scanned
+            visited.add(path)
+            result.total_bytes += size
+            result.files += files
+            result.directories += 1
+            result.rescanned += int(rescanned)
+
+        if self.use_cache:
+            # 清理该目录树下已不存在的目录条目
+            prefix = root.rstrip(os.sep) + os.sep
+            with self._lock:
+                stale = [p for p in self._cache
+                         if (p == root or p.startswith(prefix)) and p not in visited]
+                for p in stale:
+                    del self._cache[p]
+            if result.rescanned or stale:
+                self._save()
+
+        result.elapsed_s = time.perf_counter() - start
+        return result
+
+
+_SIZER: Optional[DirectorySizer] = None
+
+
+def get_sizer() -> DirectorySizer:
+    """进程内共享的统计器 (缓存只加载一次)"""
+    global _SIZER
+    if _SIZER is None:
+        _SIZER = DirectorySizer()
+    return _SIZER
+
+
+def set_sizer(sizer: Optional[DirectorySizer]):
+    """替换共享统计器 (None 表示下次使用时按默认配置重建)"""
+    global _SIZER
+    _SIZER = sizer
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='并行、带缓存的目录大小统计')
+    parser.add_argument('paths', nargs='+', help='要统计的目录')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='扫描线程数')
+    parser.add_argument('--cache', type=str, default=None, help=f'缓存文件 (默认 {DEFAULT_CACHE_PATH})')
+    parser.add_argument('--no-cache', action='store_true', help='不读写缓存')
+    parser.add_argument('--refresh', action='store_true', help='忽略缓存，全部重新扫描')
+
+    args = parser.parse_args()
+    sizer = DirectorySizer(args.cache, workers=args.workers, use_cache=not args.no_cache)
+    for path in args.paths:
+        result = sizer.size(path, refresh=args.refresh)
+        print(f"📁 {result.path}: {result.total_bytes / (1024 ** 3):.2f}GB, "
+              f"{result.files} 个文件, {result.directories} 个目录 "
+              f"(重新扫描 {result.rescanned} 个, 耗时 {result.elapsed_s:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+并行分块校验和
+数据集压缩包和模型权重动辄数GB到数十GB，单线程 sha256 只能用满一个核 (约1-2GB/s)，
+远低于NVMe带宽。这里把文件切成固定大小的块，分发到进程池并行计算每块的摘要，
+文件摘要为各块摘要拼接后的 sha256，与清单比较即可发现截断 (大小不符，无需读数据) 和损坏
+(并能定位到具体块)。结果按 (大小, mtime) 缓存，未变化的文件复验不再读取数据。
+
+也可读取 sha256sum 格式的外部清单 (整文件摘要，chunk_size=0)，此时每个文件只能由一个进程计算。
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+CACHE_ENV = 'CHECKSUM_CACHE'
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'runpod_det3d', 'checksums.json')
+MANIFEST_VERSION = 1
+
+DEFAULT_ALGORITHM = 'sha256'
+DEFAULT_CHUNK_SIZE = 64 << 20
+READ_SIZE = 4 << 20
+
+# sha256sum / md5sum 格式: "<hex>  <name>" 或 "<hex> *<name>"
+_SUMFILE_LINE = re.compile(r'^([0-9a-fA-F]+) [ *](.+)$')
+_SUMFILE_ALGORITHMS = {32: 'md5', 40: 'sha1', 64: 'sha256', 128: 'sha512'}
+
+
+def default_workers() -> int:
+    """按容器CPU配额决定进程数 (读不到cgroup时用CPU核数)"""
+    try:
+        from cgroup_limits import read_container_resources
+        cpus = read_container_resources().cpu_limit
+    except (ImportError, OSError):
+        cpus = os.cpu_count() or 1
+    return max(1, min(16, int(cpus)))
+
+
+def _hash_range(path: str, offset: int, length: Optional[int], algorithm: str) -> bytes:
+    """计算文件 [offset, offset+length) 的摘要 (length=None 表示到文件末尾)，在工作进程中执行"""
+    digest = hashlib.new(algorithm)
+    buf = bytearray(READ_SIZE)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        f.seek(offset)
+        remaining = length
+        while remaining is None or remaining > 0:
+            size = READ_SIZE if remaining is None else min(READ_SIZE, remaining)
+            n = f.readinto(view[:size])
+            if not n:
+                if remaining is not None:
+                    raise OSError(f"{path}: 文件在计算校验和期间被截断")
+                break
+            digest.update(view[:n])
+            if remaining is not None:
+                remaining -= n
+    return digest.digest()
+
+
+def combine_chunks(chunks: List[str], algorithm: str) -> str:
+    """分块摘要 -> 文件摘要"""
+    digest = hashlib.new(algorithm)
+    for chunk in chunks:
+        digest.update(bytes.fromhex(chunk))
+    return digest.hexdigest()
+
+
+@dataclass
+class FileChecksum:
+    """单个文件的校验和"""
+    path: str
+    size: int
+    mtime_ns: int
+    algorithm: str = DEFAULT_ALGORITHM
+    chunk_size: int = DEFAULT_CHUNK_SIZE    # 0 表示整文件摘要
+    digest: str = ''
+    chunks: List[str] = field(default_factory=list)
+    cached: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class VerifyResult:
+    """清单中一个条目的校验结果"""
+    path: str
+    status: str                             # ok / mismatch / size_mismatch / missing / unknown / error
+    expected_size: Optional[int] = None
+    actual_size: Optional[int] = None
+    bad_chunks: List[int] = field(default_factory=list)
+    cached: bool = False
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 'ok'
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class ChecksumManifest:
+    """校验和清单: 相对路径 -> {size, algorithm, chunk_size, digest, chunks}
+
+    路径相对于清单所在目录 (或显式指定的 root)。保存格式为JSON；
+    读取时也接受 sha256sum/md5sum 格式的文本清单 (没有大小信息，按整文件摘要比较)。
+    """
+
+    def __init__(self, path: str, root: Optional[str] = None):
+        self.path = Path(path)
+        self.root = Path(root) if root else self.path.parent
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if self.path.exists():
+            self._load()
+
+    def _load(self):
+        with open(self.path) as f:
+            text = f.read()
+        try:
+            data = json.loads(text)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            self.entries = data.get('files', {})
+            return
+        for line in text.splitlines():
+            match = _SUMFILE_LINE.match(line.strip())
+            if not match:
+                continue
+            digest, name = match.group(1).lower(), match.group(2)
+            algorithm = _SUMFILE_ALGORITHMS.get(len(digest))
+            if algorithm:
+                self.entries[name] = {'size': None, 'algorithm': algorithm, 'chunk_size': 0, 'digest': digest}
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'files': self.entries}, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def relpath(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), os.path.abspath(self.root))
+
+    def abspath(self, rel: str) -> str:
+        return os.path.join(os.path.abspath(self.root), rel)
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(self.relpath(path))
+
+    def record(self, checksum: FileChecksum):
+        self.entries[self.relpath(checksum.path)] = {
+            'size': checksum.size,
+            'algorithm': checksum.algorithm,
+            'chunk_size': checksum.chunk_size,
+            'digest': checksum.digest,
+            'chunks': checksum.chunks,
+        }
+
+
+class ChecksumVerifier:
+    """分块并行计算和校验文件摘要"""
+
+    def __init__(self, workers: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 algorithm: str = DEFAULT_ALGORITHM, cache_path: Optional[str] = None,
+                 use_cache: bool = True):
+        hashlib.new(algorithm)      # 不支持的算法尽早报错
+        self.workers = workers or default_workers()
+        self.chunk_size = chunk_size
+        self.algorithm = algorithm
+        self.use_cache = use_cache
+        self.cache_path = Path(cache_path or os.environ.get(CACHE_ENV, DEFAULT_CACHE_PATH))
+        self._cache: Dict[str, Dict[str, Any]] = self._load_cache() if use_cache else {}
+        self._cache_dirty = False
+
+    def _load_cache(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f).get('files', {})
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self):
+        if not (self.use_cache and self._cache_dirty):
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_path.with_suffix(f'.{os.getpid()}.tmp')
+            with open(tmp, 'w') as f:
+                json.dump({'time': time.time(), 'files': self._cache}, f)
+            os.replace(tmp, self.cache_path)
+            self._cache_dirty = False
+        except OSError:
+            pass    # 缓存只是加速手段
+
+    def _from_cache(self, path: str, st: os.stat_result, algorithm: str,
+                    chunk_size: int) -> Optional[FileChecksum]:
+        cached = self._cache.get(path)
+        if (cached is None or cached['size'] != st.st_size or cached['mtime_ns'] != st.st_mtime_ns
+                or cached['algorithm'] != algorithm or cached['chunk_size'] != chunk_size):
+            return None
+        return FileChecksum(path=path, size=st.st_size, mtime_ns=st.st_mtime_ns, algorithm=algorithm,
+                            chunk_size=chunk_size, digest=cached['digest'],
+                            chunks=cached.get('chunks', []), cached=True)
+
+    def checksum_files(self, paths: Iterable[str],
+                       specs: Optional[Dict[str, Tuple[str, int]]] = None) -> Dict[str, Any]:
+        """计算多个文件的摘要
+
+        specs 可为个别文件指定 (算法, 块大小) (校验外部清单时使用)，其余用本实例的默认值。
+        返回 绝对路径 -> FileChecksum，读取失败的文件对应 OSError。
+        """
+        specs = specs or {}
+        results: Dict[str, Any] = {}
+        jobs = []   # (路径, stat, 算法, 块大小)
+        for path in paths:
+            path = os.path.abspath(path)
+            algorithm, chunk_size = specs.get(path, (self.algorithm, self.chunk_size))
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                results[path] = e
+                continue
+            cached = self._from_cache(path, st, algorithm, chunk_size) if self.use_cache else None
+            if cached is not None:
+                results[path] = cached
+            else:
+                jobs.append((path, st, algorithm, chunk_size))
+        if not jobs:
+            return results
+
+        # 大文件先提交，避免最后只剩一个大文件在单个进程里计算
+        jobs.sort(key=lambda job: job[1].st_size, reverse=True)
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {}
+            chunk_digests: Dict[str, List[Optional[bytes]]] = {}
+            for path, st, algorithm, chunk_size in jobs:
+                if chunk_size:
+                    count = max(1, -(-st.st_size // chunk_size))
+                    ranges = [(i * chunk_size, min(chunk_size, st.st_size - i * chunk_size)) for i in range(count)]
+                else:
+                    ranges = [(0, None)]
+                chunk_digests[path] = [None] * len(ranges)
+                for i, (offset, length) in enumerate(ranges):
+                    futures[executor.submit(_hash_range, path, offset, length, algorithm)] = (path, i)
+
+            for future in as_completed(futures):
+                path, i = futures[future]
+                if isinstance(results.get(path), OSError):
+                    continue
+                try:
+                    chunk_digests[path][i] = future.result()
+                except OSError as e:
+                    results[path] = e
+
+        for path, st, algorithm, chunk_size in jobs:
+            if isinstance(results.get(path), OSError):
+                continue
+            parts = chunk_digests[path]
+            if chunk_size:
+                chunks = [part.hex() for part in parts]
+                digest = combine_chunks(chunks, algorithm)
+            else:
+                chunks = []
+                digest = parts[0].hex()
+            checksum = FileChecksum(path=path, size=st.st_size, mtime_ns=st.st_mtime_ns, algorithm=algorithm,
+                                    chunk_size=chunk_size, digest=digest, chunks=chunks)
+            results[path] = checksum
+            if self.use_cache:
+                self._cache[path] = {k: v for k, v in checksum.to_dict().items() if k not in ('path', 'cached')}
+                self._cache_dirty = True
+        self._save_cache()
+        return results
+
+    def checksum(self, path: str) -> FileChecksum:
+        result = self.checksum_files([path])[os.path.abspath(path)]
+        if isinstance(result, OSError):
+            raise result
+        return result
+
+    def verify(self, manifest: ChecksumManifest, paths: Optional[Iterable[str]] = None) -> List[VerifyResult]:
+        """按清单校验文件 (paths 为空时校验清单中的全部条目)
+
+        大小不符的文件直接判定为截断/损坏，不再读取数据。
+        """
+        if paths is None:
+            targets = [manifest.abspath(rel) for rel in manifest.entries]
+        else:
+            targets = [os.path.abspath(p) for p in paths]
+
+        results: Dict[str, VerifyResult] = {}
+        specs = {}
+        for path in targets:
+            entry = manifest.get(path)
+            rel = manifest.relpath(path)
+            if entry is None:
+                results[path] = VerifyResult(path=rel, status='unknown', error='清单中没有该文件')
+                continue
+            try:
+                size = os.stat(path).st_size
+            except FileNotFoundError:
+                results[path] = VerifyResult(path=rel, status='missing', expected_size=entry.get('size'))
+                continue
+            except OSError as e:
+                results[path] = VerifyResult(path=rel, status='error', error=str(e))
+                continue
+            if entry.get('size') is not None and entry['size'] != size:
+                results[path] = VerifyResult(path=rel, status='size_mismatch',
+                                             expected_size=entry['size'], actual_size=size)
+                continue
+            specs[path] = (entry['algorithm'], entry['chunk_size'])
+
+        checksums = self.checksum_files(list(specs), specs)
+        for path in specs:
+            entry = manifest.get(path)
+            rel = manifest.relpath(path)
+            checksum = checksums[path]
+            if isinstance(checksum, OSError):
+                results[path] = VerifyResult(path=rel, status='error', error=str(checksum))
+                continue
+            result = VerifyResult(path=rel, status='ok', expected_size=entry.get('size'),
+                                  actual_size=checksum.size, cached=checksum.cached)
+            if checksum.digest != entry['digest']:
+                result.status = 'mismatch'
+                expected_chunks = entry.get('chunks') or []
+                result.bad_chunks = [i for i, (a, b) in enumerate(zip(checksum.chunks, expected_chunks)) if a != b]
+            results[path] = result
+        return [results[path] for path in targets]
+
+    def record(self, manifest: ChecksumManifest, paths: Iterable[str]) -> List[FileChecksum]:
+        """计算文件摘要并写入清单 (不保存清单文件)"""
+        recorded = []
+        for path, checksum in self.checksum_files(paths).items():
+            if isinstance(checksum, OSError):
+                raise checksum
+            manifest.record(checksum)
+            recorded.append(checksum)
+        return recorded
+
+
+def print_verify_results(results: List[VerifyResult]):
+    for result in results:
+        if result.ok:
+            note = ' (缓存)' if result.cached else ''
+            print(f"✅ {result.path}{note}")
+        elif result.status == 'size_mismatch':
+            print(f"❌ {result.path}: 大小不符 (期望 {result.expected_size}, 实际 {result.actual_size})，文件可能被截断")
+        elif result.status == 'mismatch':
+            chunks = f"，损坏的块: {result.bad_chunks[:10]}" if result.bad_chunks else ''
+            print(f"❌ {result.path}: 校验和不符{chunks}")
+        elif result.status == 'missing':
+            print(f"❌ {result.path}: 文件不存在")
+        elif result.status == 'unknown':
+            print(f"❓ {result.path}: 清单中没有该文件，跳过校验")
+        else:
+            print(f"❓ {result.path}: {result.error}")
+
+
+def main():
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description='并行分块计算/校验文件校验和')
+    parser.add_argument('manifest', help='校验和清单 (JSON，校验时也接受 sha256sum 格式)')
+    parser.add_argument('paths', nargs='*', help='要记录/校验的文件 (校验时默认为清单中的全部文件)')
+    parser.add_argument('--record', action='store_true', help='计算摘要并写入清单 (而不是校验)')
+    parser.add_argument('--root', type=str, default=None, help='清单路径的根目录 (默认: 清单所在目录)')
+    parser.add_argument('--workers', type=int, default=None, help='进程数 (默认: CPU配额)')
+    parser.add_argument('--chunk-size-mb', type=int, default=DEFAULT_CHUNK_SIZE >> 20, help='分块大小 (MB)')
+    parser.add_argument('--cache', type=str, default=None, help=f'结果缓存文件 (默认 {DEFAULT_CACHE_PATH})')
+    parser.add_argument('--no-cache', action='store_true', help='不读写缓存，全部重新计算')
+    parser.add_argument('--allow-unknown', action='store_true', help='清单中没有的文件不算校验失败')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+
+    args = parser.parse_intermixed_args()
+    manifest = ChecksumManifest(args.manifest, root=args.root)
+    verifier = ChecksumVerifier(workers=args.workers, chunk_size=args.chunk_size_mb << 20,
+                                cache_path=args.cache, use_cache=not args.no_cache)
+
+    start = time.perf_counter()
+    if args.record:
+        if not args.paths:
+            parser.error('--record 需要指定文件')
+        recorded = verifier.record(manifest, args.paths)
+        manifest.save()
+        total = sum(c.size for c in recorded)
+        elapsed = time.perf_counter() - start
+        print(f"📝 已记录 {len(recorded)} 个文件 ({total / (1024 ** 3):.2f}GB, 耗时 {elapsed:.2f}s) -> {manifest.path}")
+        return
+
+    results = verifier.verify(manifest, args.paths or None)
+    if args.json:
+        print(json.dumps([r.to_dict() for r in results], indent=2))
+    else:
+        print_verify_results(results)
+        passed = sum(1 for r in results if r.ok)
+        unknown = sum(1 for r in results if r.status == 'unknown')
+        note = f", {unknown} 个不在清单中" if unknown else ''
+        print(f"📊 {passed}/{len(results) - unknown} 个文件通过校验{note} (耗时 {time.perf_counter() - start:.2f}s)")
+    success = all(r.ok or (args.allow_unknown and r.status == 'unknown') for r in results)
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+GPU遥测
+进程内通过NVML查询所有GPU的显存、利用率、温度和各进程显存占用；
+NVML不可用时回退到 nvidia-smi，并提供用于测试的假后端。
+"""
+
+import os
+import copy
+import time
+import shutil
+import threading
+import subprocess
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, List, Optional
+
+# 后端选择: auto / nvml / nvidia-smi / fake / none
+BACKEND_ENV = 'GPU_TELEMETRY_BACKEND'
+
+# 共享提供者的快照缓存时长 (秒)
+TTL_ENV = 'GPU_TELEMETRY_TTL'
+DEFAULT_TTL = 1.0
+
+
+@dataclass
+class GPUProcess:
+    """占用GPU显存的进程"""
+    pid: int
+    used_mb: float
+
+
+@dataclass
+class GPUDevice:
+    """单个GPU设备状态"""
+    index: int
+    name: str
+    uuid: str = ''
+    memory_total_mb: float = 0.0
+    memory_used_mb: float = 0.0
+    memory_free_mb: float = 0.0
+    utilization_pct: Optional[float] = None
+    memory_utilization_pct: Optional[float] = None
+    temperature_c: Optional[float] = None
+    processes: List[GPUProcess] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class GPUSnapshot:
+    """一次采样的所有设备状态"""
+    timestamp: float
+    backend: str
+    driver_version: str = ''
+    devices: List[GPUDevice] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def available(self) -> bool:
+        return bool(self.devices)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class TelemetryBackend:
+    """遥测后端基类"""
+    name = 'none'
+
+    def driver_version(self) -> str:
+        return ''
+
+    def query(self, include_processes: bool = True) -> List[GPUDevice]:
+        return []
+
+    def close(self):
+        pass
+
+
+class NVMLBackend(TelemetryBackend):
+    """NVML后端 (pynvml，由 nvidia-ml-py 提供)
+
+    初始化一次并缓存设备句柄和静态信息，每次查询只读取动态值，
+    单设备开销为数十微秒量级，可在推理期间以10Hz轮询。
+    """
+    name = 'nvml'
+
+    def __init__(self):
+        try:
+            import pynvml
+        except ImportError as e:
+            raise RuntimeError("pynvml 未安装: pip install nvidia-ml-py") from e
+        self._nvml = pynvml
+        try:
+            pynvml.nvmlInit()
+        except pynvml.NVMLError as e:
+            raise RuntimeError(f"NVML初始化失败: {e}") from e
+
+        self._handles = []
+        self._static = []
+        for i in range(pynvml.nvmlDeviceGetCount()):
+            handle = pynvml.nvmlDeviceGetHandleByIndex(i)
+            self._handles.append(handle)
+            self._static.append((_decode(pynvml.nvmlDeviceGetName(handle)),
+                                 _decode(pynvml.nvmlDeviceGetUUID(handle))))
+        self._driver = _decode(pynvml.nvmlSystemGetDriverVersion())
+
+    def driver_version(self) -> str:
+        return self._driver
+
+    def query(self, include_processes: bool = True) -> List[GPUDevice]:
+        nvml = self._nvml
+        devices = []
+        for i, handle in enumerate(self._handles):
+            name, uuid = self._static[i]
+            memory = nvml.nvmlDeviceGetMemoryInfo(handle)
+            device = GPUDevice(
+                index=i, name=name, uuid=uuid,
+                memory_total_mb=memory.total / (1024 ** 2),
+                memory_used_mb=memory.used / (1024 ** 2),
+                memory_free_mb=memory.free / (1024 ** 2),
+            )
+            # 以下字段部分设备/驱动不支持，单独容错
+            try:
+                rates = nvml.nvmlDeviceGetUtilizationRates(handle)
+                device.utilization_pct = float(rates.gpu)
+                device.memory_utilization_pct = float(rates.memory)
+            except nvml.NVMLError:
+                pass
+            try:
+                device.temperature_c = float(nvml.nvmlDeviceGetTemperature(handle, nvml.NVML_TEMPERATURE_GPU))
+            except nvml.NVMLError:
+                pass
+            if include_processes:
+                try:
+                    for proc in nvml.nvmlDeviceGetComputeRunningProcesses(handle):
+                        used = proc.usedGpuMemory
+                        device.processes.append(GPUProcess(
+                            pid=int(proc.pid),
+                            used_mb=used / (1024 ** 2) if used is not None else 0.0
+                        ))
+                except nvml.NVMLError:
+                    pass
+            devices.append(device)
+        return devices
+
+    def close(self):
+        try:
+            self._nvml.nvmlShutdown()
+        except Exception:
+            pass
+
+
+class NvidiaSmiBackend(TelemetryBackend):
+    """nvidia-smi 后端 (回退方案，每次查询会启动子进程)"""
+    name = 'nvidia-smi'
+
+    GPU_FIELDS = ['index', 'name', 'uuid', 'memory.total', 'memory.used', 'memory.free',
+                  'utilization.gpu', 'utilization.memory', 'temperature.gpu', 'driver_version']
+
+    def __init__(self, timeout: float = 10.0):
+        if shutil.which('nvidia-smi') is None:
+            raise RuntimeError("nvidia-smi 不可用")
+        self.timeout = timeout
+        self._driver = ''
+
+    def _run(self, args: List[str]) -> List[List[str]]:
+        result = subprocess.run(['nvidia-smi'] + args + ['--format=csv,nounits,noheader'],
+                                capture_output=True, text=True, timeout=self.timeout)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or "nvidia-smi 执行失败")
+        return [[v.strip() for v in line.split(',')]
+                for line in result.stdout.strip().splitlines() if line.strip()]
+
+    def driver_version(self) -> str:
+        if not self._driver:
+            rows = self._run(['--query-gpu=driver_version'])
+            self._driver = rows[0][0] if rows else ''
+        return self._driver
+
+    def query(self, include_processes: bool = True) -> List[GPUDevice]:
+        devices = []
+        by_uuid = {}
+        for row in self._run([f"--query-gpu={','.join(self.GPU_FIELDS)}"]):
+            if len(row) < len(self.GPU_FIELDS):
+                continue
+            values = dict(zip(self.GPU_FIELDS, row))
+            device = GPUDevice(
+                index=int(values['index']), name=values['name'], uuid=values['uuid'],
+                memory_total_mb=_to_float(values['memory.total']) or 0.0,
+                memory_used_mb=_to_float(values['memory.used']) or 0.0,
+                memory_free_mb=_to_float(values['memory.free']) or 0.0,
+                utilization_pct=_to_float(values['utilization.gpu']),
+                memory_utilization_pct=_to_float(values['utilization.memory']),
+                temperature_c=_to_float(values['temperature.gpu']),
+            )
+            self._driver = values['driver_version']
+            devices.append(device)
+            by_uuid[device.uuid] = device
+
+        if include_processes and devices:
+            try:
+                for gpu_uuid, pid, used in self._run(['--query-compute-apps=gpu_uuid,pid,used_memory']):
+                    if gpu_uuid in by_uuid:
+                        by_uuid[gpu_uuid].processes.append(
+                            GPUProcess(pid=int(pid), used_mb=_to_float(used) or 0.0)
+                        )
+            except (RuntimeError, ValueError):
+                pass
+        return devices
+
+
+class FakeBackend(TelemetryBackend):
+    """测试用假后端: 返回预设设备状态，或由回调按调用生成"""
+    name = 'fake'
+
+    def __init__(self, devices: Optional[List[GPUDevice]] = None,
+                 generator: Optional[Callable[[], List[GPUDevice]]] = None,
+                 driver_version: str = 'fake'):
+        self.devices = devices if devices is not None else [
+            GPUDevice(index=0, name='Fake GPU', uuid='GPU-fake-0',
+                      memory_total_mb=24576.0, memory_used_mb=0.0, memory_free_mb=24576.0,
+                      utilization_pct=0.0, memory_utilization_pct=0.0, temperature_c=40.0)
+        ]
+        self.generator = generator
+        self._driver = driver_version
+        self.calls = 0
+
+    def driver_version(self) -> str:
+        return self._driver
+
+    def query(self, include_processes: bool = True) -> List[GPUDevice]:
+        self.calls += 1
+        devices = self.generator() if self.generator is not None else self.devices
+        # 返回副本，避免调用方修改预设状态
+        devices = copy.deepcopy(devices)
+        if not include_processes:
+            for device in devices:
+                device.processes = []
+        return devices
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+def _to_float(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def create_backend(name: Optional[str] = None) -> TelemetryBackend:
+    """按名称创建后端；auto 依次尝试 NVML、nvidia-smi，都不可用时返回空后端"""
+    name = (name or os.environ.get(BACKEND_ENV, 'auto')).lower()
+    if name == 'fake':
+        return FakeBackend()
+    if name == 'none':
+        return TelemetryBackend()
+    if name == 'nvml':
+        return NVMLBackend()
+    if name == 'nvidia-smi':
+        return NvidiaSmiBackend()
+
+    for backend_cls in (NVMLBackend, NvidiaSmiBackend):
+        try:
+            return backend_cls()
+        except RuntimeError:
+            continue
+    return TelemetryBackend()
+
+
+class GPUTelemetry:
+    """GPU遥测提供者，所有GPU查询的统一入口
+
+    快照按TTL缓存: 同一TTL内的重复查询 (健康检查、日志、各处的显存统计)
+    直接复用上次结果，不再重复访问驱动。ttl=0 表示不缓存。
+    """
+
+    def __init__(self, backend: Optional[TelemetryBackend] = None, ttl: float = 0.0):
+        self.backend = backend if backend is not None else create_backend()
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cached: Optional[GPUSnapshot] = None
+        self._cached_at = 0.0
+        self._cached_processes = False
+
+    @property
+    def backend_name(self) -> str:
+        return self.backend.name
+
+    def snapshot(self, include_processes: bool = True, max_age: Optional[float] = None) -> GPUSnapshot:
+        """采样所有设备；后端出错时返回带 error 的空快照而不抛出
+
+        Args:
+            include_processes: 是否查询各进程显存占用
+            max_age: 可接受的缓存时长 (秒)，默认使用提供者的TTL；0 表示强制重新采样
+        """
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            now = time.monotonic()
+            if (self._cached is not None and now - self._cached_at < max_age
+                    and (self._cached_processes or not include_processes)):
+                return self._cached
+            try:
+                devices = self.backend.query(include_processes=include_processes)
+                snapshot = GPUSnapshot(time.time(), self.backend.name,
+                                       self.backend.driver_version(), devices)
+            except Exception as e:
+                snapshot = GPUSnapshot(time.time(), self.backend.name, error=str(e))
+            self._cached = snapshot
+            self._cached_at = now
+            self._cached_processes = include_processes
+            return snapshot
+
+    def invalidate(self):
+        """丢弃缓存快照"""
+        with self._lock:
+            self._cached = None
+
+    def devices(self) -> List[GPUDevice]:
+        return self.snapshot().devices
+
+    def close(self):
+        self.backend.close()
+
+
+_default_telemetry: Optional[GPUTelemetry] = None
+_default_lock = threading.Lock()
+
+
+def get_telemetry() -> GPUTelemetry:
+    """进程级共享的遥测提供者 (首次调用时选择后端，快照按 GPU_TELEMETRY_TTL 缓存)"""
+    global _default_telemetry
+    with _default_lock:
+        if _default_telemetry is None:
+            _default_telemetry = GPUTelemetry(ttl=float(os.environ.get(TTL_ENV, DEFAULT_TTL)))
+        return _default_telemetry
+
+
+def set_telemetry(telemetry: Optional[GPUTelemetry]):
+    """替换共享提供者 (测试时注入 FakeBackend)"""
+    global _default_telemetry
+    with _default_lock:
+        _default_telemetry = telemetry
+
+
+def main():
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description='GPU遥测')
+    parser.add_argument('--backend', type=str, default=None,
+                        choices=['auto', 'nvml', 'nvidia-smi', 'fake', 'none'], help='遥测后端')
+    parser.add_argument('--interval', type=float, default=0, help='轮询间隔秒数 (0为只采样一次)')
+    parser.add_argument('--count', type=int, default=10, help='轮询次数')
+
+    args = parser.parse_args()
+
+    telemetry = GPUTelemetry(create_backend(args.backend))
+    if args.interval <= 0:
+        print(json.dumps(telemetry.snapshot().to_dict(), indent=2))
+        return
+
+    for _ in range(args.count):
+        start = time.perf_counter()
+        snapshot = telemetry.snapshot()
+        cost_ms = (time.perf_counter() - start) * 1000
+        summary = ', '.join(f"GPU{d.index} {d.memory_used_mb:.0f}/{d.memory_total_mb:.0f}MB "
+                            f"{d.utilization_pct}% {d.temperature_c}°C" for d in snapshot.devices)
+        print(f"[{snapshot.backend} {cost_ms:.2f}ms] {summary or snapshot.error or '无GPU'}")
+        time.sleep(max(0.0, args.interval - cost_ms / 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+GPU Memory Monitoring and Cleanup Utilities for RunPod Deployment
+Provides functions to monitor GPU memory usage and clean up resources.
+Single shared module for all model containers (images put /app/tools on PYTHONPATH).
+"""
+
+import gc
+import sys
+import time
+import threading
+import psutil
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+try:
+    import torch
+    HAS_TORCH = True
+except ImportError:
+    HAS_TORCH = False
+
+from cgroup_limits import read_container_resources
+from gpu_telemetry import get_telemetry
+from process_tree import ProcessTree
+
+@lru_cache(maxsize=None)
+def _device_total_memory(device: int) -> int:
+    """Total memory of a CUDA device (static, queried once per process)"""
+    return torch.cuda.get_device_properties(device).total_memory
+
+def _torch_cuda_ready() -> bool:
+    """True if CUDA is usable without creating a new context as a side effect"""
+    if not (HAS_TORCH and torch.cuda.is_available()):
+        return False
+    is_initialized = getattr(torch.cuda, 'is_initialized', None)
+    return is_initialized() if is_initialized is not None else True
+
+def get_gpu_memory_info(max_age: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Get current GPU memory usage information
+    
+    Args:
+        max_age: Acceptable age in seconds of the cached device snapshot
+                 (default: the shared provider TTL, 0 forces a fresh query)
+    
+    Returns:
+        Dict containing GPU memory stats in MB
+    """
+    gpu_info = {
+        'total_mb': 0.0,
+        'used_mb': 0.0, 
+        'free_mb': 0.0,
+        'utilization_pct': 0.0
+    }
+    
+    if HAS_TORCH and torch.cuda.is_available():
+        try:
+            # Get GPU memory info from PyTorch (allocator counters, no device sync)
+            total_memory = _device_total_memory(0)
+            allocated_memory = torch.cuda.memory_allocated(0)
+            cached_memory = torch.cuda.memory_reserved(0)
+            
+            gpu_info['total_mb'] = total_memory / (1024 * 1024)
+            gpu_info['used_mb'] = allocated_memory / (1024 * 1024)
+            gpu_info['cached_mb'] = cached_memory / (1024 * 1024)
+            gpu_info['free_mb'] = (total_memory - cached_memory) / (1024 * 1024)
+            gpu_info['utilization_pct'] = (cached_memory / total_memory) * 100
+            
+        except Exception as e:
+            print(f"Warning: Could not get GPU memory info via PyTorch: {e}")
+    
+    # Device-level stats for all GPUs via the shared telemetry provider (TTL-cached)
+    snapshot = get_telemetry().snapshot(max_age=max_age)
+    if snapshot.error:
+        print(f"Warning: Could not get GPU telemetry via {snapshot.backend}: {snapshot.error}")
+    gpu_info['devices'] = [d.to_dict() for d in snapshot.devices]
+    
+    # Only update if we don't have PyTorch info
+    if snapshot.devices and gpu_info['total_mb'] == 0:
+        first = snapshot.devices[0]
+        gpu_info.update({
+            'total_mb': first.memory_total_mb,
+            'used_mb': first.memory_used_mb,
+            'free_mb': first.memory_free_mb,
+            'utilization_pct': (first.memory_used_mb / first.memory_total_mb) * 100
+            if first.memory_total_mb > 0 else 0
+        })
+    
+    return gpu_info
+
+def cleanup_gpu_memory() -> None:
+    """
+    Clean up GPU memory by clearing PyTorch cache and running garbage collection
+    """
+    if HAS_TORCH and torch.cuda.is_available():
+        try:
+            # Clear PyTorch GPU cache
+            torch.cuda.empty_cache()
+            torch.cuda.synchronize()
+            print("GPU cache cleared")
+        except Exception as e:
+            print(f"Warning: Could not clear GPU cache: {e}")
+    
+    # Run Python garbage collection
+    gc.collect()
+
+def _log_memory_usage(stage: str, gpu_info: Dict[str, Any]) -> None:
+    # Container budget (cgroup limit), host memory when unlimited
+    resources = read_container_resources()
+    
+    print(f"=== Memory Usage - {stage} ===")
+    print(f"GPU Memory: {gpu_info['used_mb']:.1f}MB / {gpu_info['total_mb']:.1f}MB "
+          f"({gpu_info['utilization_pct']:.1f}% used)")
+    if 'cached_mb' in gpu_info:
+        print(f"GPU Cached: {gpu_info['cached_mb']:.1f}MB")
+    print(f"System RAM: {resources.memory_used_bytes / (1024**3):.1f}GB / "
+          f"{resources.memory_total_bytes / (1024**3):.1f}GB ({resources.memory_percent:.1f}% used)")
+    print("=" * 40)
+
+class MemoryMonitor:
+    """
+    Records peak memory usage across a code block
+    
+    A background thread samples device memory (NVML, no subprocess) and the
+    memory of this process plus its children (e.g. dataloader workers) every
+    `interval` seconds; the PyTorch allocator peak is read
+    from torch's own counters, so the monitored code is never synchronized.
+    
+    Attributes (valid after the block exits):
+        peak_device_used_mb: Peak used memory per GPU index
+        peak_torch_allocated_mb: Peak PyTorch allocation in this process
+        peak_rss_mb: Peak resident memory of the process tree
+        peak_pss_mb: Peak proportional memory of the process tree (shared
+                     pages split between processes, None if unavailable)
+        duration: Wall time of the block in seconds
+        samples: Number of background samples taken
+    """
+    
+    # nvidia-smi forks a process per query, so it is never polled faster than this
+    MIN_SUBPROCESS_INTERVAL = 1.0
+    
+    def __init__(self, stage: str, interval: float = 0.1, verbose: bool = True):
+        self.stage = stage
+        self.interval = interval
+        self.verbose = verbose
+        self.peak_device_used_mb: Dict[int, float] = {}
+        self.peak_torch_allocated_mb = 0.0
+        self.peak_rss_mb = 0.0
+        self.peak_pss_mb: Optional[float] = None
+        self.duration = 0.0
+        self.samples = 0
+        self._telemetry = get_telemetry()
+        self._tree = ProcessTree()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start = 0.0
+    
+    def __enter__(self) -> 'MemoryMonitor':
+        if _torch_cuda_ready():
+            torch.cuda.reset_peak_memory_stats()
+        self._start = time.perf_counter()
+        self._sample()
+        
+        interval = self.interval
+        if self._telemetry.backend_name == 'nvidia-smi':
+            interval = max(interval, self.MIN_SUBPROCESS_INTERVAL)
+        self._thread = threading.Thread(target=self._run, args=(interval,),
+                                        name="memory-monitor", daemon=True)
+        self._thread.start()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._start
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        if _torch_cuda_ready():
+            self.peak_torch_allocated_mb = torch.cuda.max_memory_allocated() / (1024 * 1024)
+        if self.verbose:
+            print(f"=== Peak Memory - {self.stage} ({self.duration:.2f}s, {self.samples} samples) ===")
+            for index, used_mb in sorted(self.peak_device_used_mb.items()):
+                print(f"GPU{index} Peak Used: {used_mb:.1f}MB")
+            if self.peak_torch_allocated_mb:
+                print(f"PyTorch Peak Allocated: {self.peak_torch_allocated_mb:.1f}MB")
+            print(f"Process Tree Peak RSS: {self.peak_rss_mb:.1f}MB")
+            if self.peak_pss_mb is not None:
+                print(f"Process Tree Peak PSS: {self.peak_pss_mb:.1f}MB")
+            print("=" * 40)
+        return False
+    
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            self._sample()
+    
+    def _sample(self):
+        snapshot = self._telemetry.snapshot(include_processes=False, max_age=0)
+        for device in snapshot.devices:
+            previous = self.peak_device_used_mb.get(device.index, 0.0)
+            self.peak_device_used_mb[device.index] = max(previous, device.memory_used_mb)
+        try:
+            tree = self._tree.sample()
+        except psutil.Error:
+            tree = None
+        if tree is not None:
+            self.peak_rss_mb = max(self.peak_rss_mb, tree.rss_mb)
+            if tree.pss_mb is not None:
+                self.peak_pss_mb = max(self.peak_pss_mb or 0.0, tree.pss_mb)
+        self.samples += 1
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'stage': self.stage,
+            'duration_s': self.duration,
+            'samples': self.samples,
+            'peak_device_used_mb': dict(self.peak_device_used_mb),
+            'peak_torch_allocated_mb': self.peak_torch_allocated_mb,
+            'peak_rss_mb': self.peak_rss_mb,
+            'peak_pss_mb': self.peak_pss_mb,
+        }
+
+def monitor_memory_usage(stage: str, interval: float = 0.1, verbose: bool = True) -> MemoryMonitor:
+    """
+    Monitor and log memory usage at different stages
+    
+    Logs the current usage immediately. The returned monitor can also be used
+    as a context manager to record peak usage across a block:
+    
+        with monitor_memory_usage("inference") as mem:
+            result = model(data)
+        print(mem.to_dict())
+    
+    Args:
+        stage: Description of current stage (e.g., "before_inference", "after_inference")
+        interval: Background sampling interval in seconds when used as a context manager
+        verbose: Print usage on call and peak summary on exit
+    """
+    if verbose:
+        _log_memory_usage(stage, get_gpu_memory_info())
+    return MemoryMonitor(stage, interval=interval, verbose=verbose)
+
+def check_gpu_availability() -> bool:
+    """
+    Check if GPU is available and accessible
+    
+    Returns:
+        True if GPU is available, False otherwise
+    """
+    if not HAS_TORCH:
+        print("Warning: PyTorch not available")
+        return False
+        
+    if not torch.cuda.is_available():
+        print("Warning: CUDA not available")
+        return False
+        
+    gpu_count = torch.cuda.device_count()
+    if gpu_count == 0:
+        print("Warning: No GPU devices found")
+        return False
+        
+    print(f"GPU available: {torch.cuda.get_device_name(0)} (Count: {gpu_count})")
+    return True
+
+def setup_gpu_monitoring() -> None:
+    """
+    Setup GPU monitoring for inference
+    """
+    print("=== GPU Monitoring Setup ===")
+    
+    if check_gpu_availability():
+        monitor_memory_usage("startup")
+    else:
+        print("GPU monitoring disabled - no GPU available")
+
+def cleanup_and_monitor() -> None:
+    """
+    Cleanup GPU memory and monitor final state
+    """
+    print("=== Cleaning up GPU resources ===")
+    cleanup_gpu_memory()
+    
+    if HAS_TORCH and torch.cuda.is_available():
+        monitor_memory_usage("after_cleanup")
+
+if __name__ == "__main__":
+    # Test the GPU monitoring functions
+    setup_gpu_monitoring()
+    cleanup_and_monitor()
\ No newline at end of file
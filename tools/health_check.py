@@ -8,12 +8,136 @@ import os
 import sys
 import time
 import json
+import site
 import psutil
+import threading
 import subprocess
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable
 from pathlib import Path
 import argparse
 
+from gpu_telemetry import get_telemetry
+from cgroup_limits import ContainerCPUMeter, read_container_resources
+
+try:
+    import inference_metrics
+    HAS_METRICS = True
+except ImportError:
+    HAS_METRICS = False
+
+# 支持的模型 (CLI choices 和 /health/detailed?model= 的取值)
+SUPPORTED_MODELS = ['MapTR', 'PETR', 'StreamPETR', 'TopoMLP', 'VAD']
+
+# 关键依赖: 包名 -> 导入模块名
+CRITICAL_DEPENDENCIES = {
+    "torch": "torch",
+    "torchvision": "torchvision",
+    "numpy": "numpy",
+    "opencv-python": "cv2",
+    "mmcv": "mmcv",
+    "mmdet": "mmdet",
+    "mmsegmentation": "mmseg",
+}
+
+# 在独立子进程中逐项导入，每项开始/结束各输出一行JSON，超时或崩溃时可定位到具体依赖
+_DEPENDENCY_PROBE_SCRIPT = r"""
+import sys, json, time, importlib
+for dep, module in json.loads(sys.argv[1]):
+    print(json.dumps({"dep": dep}), flush=True)
+    start = time.time()
+    try:
+        mod = importlib.import_module(module)
+        info = {"available": True, "error": None, "version": getattr(mod, "__version__", None)}
+        if module == "torch":
+            info["cuda_available"] = mod.cuda.is_available()
+    except Exception as e:
+        info = {"available": False, "error": "%s: %s" % (type(e).__name__, e)}
+    info["import_time_s"] = time.time() - start
+    print(json.dumps({"dep": dep, "result": info}), flush=True)
+"""
+
+
+def _site_packages_fingerprint() -> tuple:
+    """site-packages 目录的修改时间 (安装/卸载包会改变目录项，从而改变mtime)"""
+    paths = list(getattr(site, "getsitepackages", lambda: [])())
+    paths.append(site.getusersitepackages())
+    fingerprint = []
+    for path in paths:
+        try:
+            fingerprint.append((path, os.stat(path).st_mtime_ns))
+        except OSError:
+            continue
+    return tuple(fingerprint)
+
+
+class DependencyProbe:
+    """缓存的依赖探测
+    
+    在子进程中带超时导入依赖 (首次导入可能耗时数秒，损坏的扩展可能卡死)，
+    结果在进程内缓存，仅当 site-packages 变化时重新探测；并发调用只探测一次。
+    """
+    
+    def __init__(self, dependencies: Dict[str, str], timeout: float = 120.0):
+        self.dependencies = dependencies
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._fingerprint: Optional[tuple] = None
+        self._results: Optional[Dict[str, Any]] = None
+        self.probe_count = 0
+    
+    def results(self) -> Dict[str, Any]:
+        """各依赖的探测结果 (返回副本)"""
+        fingerprint = _site_packages_fingerprint()
+        with self._lock:
+            if self._results is None or fingerprint != self._fingerprint:
+                self._results = self._probe()
+                self._fingerprint = fingerprint
+            return {dep: dict(info) for dep, info in self._results.items()}
+    
+    def invalidate(self):
+        with self._lock:
+            self._results = None
+    
+    def _probe(self) -> Dict[str, Any]:
+        self.probe_count += 1
+        args = [sys.executable, "-c", _DEPENDENCY_PROBE_SCRIPT,
+                json.dumps(list(self.dependencies.items()))]
+        failure = None
+        try:
+            completed = subprocess.run(args, capture_output=True, text=True, timeout=self.timeout)
+            output = completed.stdout
+            if completed.returncode != 0:
+                failure = f"探测进程异常退出 (返回码 {completed.returncode})"
+        except subprocess.TimeoutExpired as e:
+            output = e.output or ""
+            if isinstance(output, bytes):
+                output = output.decode(errors="replace")
+            failure = f"导入超时 (>{self.timeout:.0f}s)"
+        
+        results: Dict[str, Any] = {}
+        started = None
+        for line in output.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "result" in record:
+                results[record["dep"]] = record["result"]
+                started = None
+            else:
+                started = record.get("dep")
+        
+        # 已开始但未完成的依赖即为卡住/崩溃的那一项，其余未探测
+        for dep in self.dependencies:
+            if dep not in results:
+                error = failure if dep == started else "未探测 (探测进程提前结束)"
+                results[dep] = {"available": False, "error": error or "未知错误"}
+        return results
+
+
+# 进程内共享，所有检查器复用同一份探测结果
+_DEPENDENCY_PROBE = DependencyProbe(CRITICAL_DEPENDENCIES)
+
 class ModelHealthChecker:
     """模型健康检查器"""
     
@@ -21,9 +145,14 @@ class ModelHealthChecker:
         self.model_name = model_name.upper()
         self.model_path = Path(model_path)
         self.start_time = time.time()
+        self.cpu_meter = ContainerCPUMeter()
     
-    def check_system_health(self) -> Dict[str, Any]:
-        """检查系统基础健康状态"""
+    def check_system_health(self, cpu_interval: Optional[float] = 1) -> Dict[str, Any]:
+        """检查系统基础健康状态
+        
+        Args:
+            cpu_interval: CPU采样阻塞时长 (秒)；None表示返回距上次调用以来的使用率，不阻塞
+        """
         health = {
             "timestamp": time.time(),
             "uptime": time.time() - self.start_time,
@@ -34,12 +163,17 @@ class ModelHealthChecker:
         }
         
         try:
-            # CPU和内存信息
+            # CPU和内存信息 (以容器cgroup限制为准，未限制时为宿主机数值)
+            resources = read_container_resources()
             health["system"] = {
-                "cpu_percent": psutil.cpu_percent(interval=1),
-                "memory_percent": psutil.virtual_memory().percent,
-                "memory_available_gb": psutil.virtual_memory().available / (1024**3),
-                "memory_total_gb": psutil.virtual_memory().total / (1024**3),
+                "cpu_percent": self.cpu_meter.percent(interval=cpu_interval),
+                "cpu_limit": resources.cpu_limit,
+                "memory_percent": resources.memory_percent,
+                "memory_available_gb": resources.memory_available_bytes / (1024**3),
+                "memory_total_gb": resources.memory_total_bytes / (1024**3),
+                "memory_limited": resources.memory_limited,
+                "cgroup_version": resources.cgroup_version,
+                "host_memory_total_gb": resources.host_memory_total_bytes / (1024**3),
                 "disk_usage_percent": psutil.disk_usage('/').percent,
                 "load_average": os.getloadavg() if hasattr(os, 'getloadavg') else [0, 0, 0]
             }
@@ -70,24 +204,22 @@ class ModelHealthChecker:
         }
         
         try:
-            # 尝试使用nvidia-smi
-            result = subprocess.run([
-                'nvidia-smi', 
-                '--query-gpu=memory.total,memory.used,utilization.gpu',
-                '--format=csv,nounits,noheader'
-            ], capture_output=True, text=True, timeout=10)
-            
-            if result.returncode == 0:
-                lines = result.stdout.strip().split('\n')
+            # 进程内NVML查询所有设备 (无NVML时回退nvidia-smi)
+            snapshot = get_telemetry().snapshot()
+            gpu_info["backend"] = snapshot.backend
+            if snapshot.error:
+                gpu_info["telemetry_error"] = snapshot.error
+            if snapshot.devices:
                 gpu_info["available"] = True
-                gpu_info["count"] = len(lines)
+                gpu_info["count"] = len(snapshot.devices)
+                gpu_info["driver_version"] = snapshot.driver_version
+                gpu_info["devices"] = [d.to_dict() for d in snapshot.devices]
                 
-                if lines:
-                    # 使用第一个GPU的信息
-                    memory_total, memory_used, utilization = lines[0].split(',')
-                    gpu_info["memory_total_mb"] = float(memory_total.strip())
-                    gpu_info["memory_used_mb"] = float(memory_used.strip())
-                    gpu_info["utilization_percent"] = float(utilization.strip())
+                # 汇总字段沿用第一个GPU的信息
+                first = snapshot.devices[0]
+                gpu_info["memory_total_mb"] = first.memory_total_mb
+                gpu_info["memory_used_mb"] = first.memory_used_mb
+                gpu_info["utilization_percent"] = first.utilization_pct or 0
             
             # 尝试使用PyTorch
             try:
@@ -236,37 +368,8 @@ class ModelHealthChecker:
         return files_status
     
     def _check_dependencies(self) -> Dict[str, Any]:
-        """检查Python依赖项"""
-        deps_status = {}
-        
-        # 检查关键依赖项
-        critical_deps = [
-            "torch", "torchvision", "numpy", "opencv-python", 
-            "mmcv", "mmdet", "mmsegmentation"
-        ]
-        
-        for dep in critical_deps:
-            try:
-                __import__(dep.replace("-", "_"))
-                deps_status[dep] = {"available": True, "error": None}
-            except ImportError as e:
-                deps_status[dep] = {"available": False, "error": str(e)}
-        
-        # 检查特定版本要求
-        try:
-            import torch
-            deps_status["torch"]["version"] = torch.__version__
-            deps_status["torch"]["cuda_available"] = torch.cuda.is_available()
-        except:
-            pass
-        
-        try:
-            import mmcv
-            deps_status["mmcv"]["version"] = mmcv.__version__
-        except:
-            pass
-        
-        return deps_status
+        """检查Python依赖项 (子进程探测，进程内缓存)"""
+        return _DEPENDENCY_PROBE.results()
     
     def _evaluate_model_health(self, model_health: Dict[str, Any]) -> str:
         """评估模型健康状态"""
@@ -310,11 +413,13 @@ class ModelHealthChecker:
             test_result["details"]["import_torch"] = self._test_torch_import()
             test_result["details"]["import_mmcv"] = self._test_mmcv_import()
             
-            # 尝试创建简单的tensor操作
-            test_result["details"]["tensor_ops"] = self._test_tensor_operations()
-            
-            # 检查GPU tensor操作
-            test_result["details"]["gpu_ops"] = self._test_gpu_operations()
+            # 子进程探测未通过时不在本进程导入torch (避免损坏的扩展卡住服务线程)
+            if test_result["details"]["import_torch"]["passed"]:
+                # 尝试创建简单的tensor操作
+                test_result["details"]["tensor_ops"] = self._test_tensor_operations()
+                
+                # 检查GPU tensor操作
+                test_result["details"]["gpu_ops"] = self._test_gpu_operations()
             
             # 评估测试结果
             passed_tests = sum(1 for test in test_result["details"].values() 
@@ -336,26 +441,17 @@ class ModelHealthChecker:
     
     def _test_torch_import(self) -> Dict[str, Any]:
         """测试PyTorch导入"""
-        try:
-            import torch
-            return {
-                "passed": True,
-                "version": torch.__version__,
-                "cuda_available": torch.cuda.is_available()
-            }
-        except Exception as e:
-            return {"passed": False, "error": str(e)}
+        return self._probe_import("torch")
     
     def _test_mmcv_import(self) -> Dict[str, Any]:
         """测试MMCV导入"""
-        try:
-            import mmcv
-            return {
-                "passed": True,
-                "version": mmcv.__version__
-            }
-        except Exception as e:
-            return {"passed": False, "error": str(e)}
+        return self._probe_import("mmcv")
+    
+    def _probe_import(self, dep: str) -> Dict[str, Any]:
+        info = _DEPENDENCY_PROBE.results().get(dep, {})
+        result = {"passed": info.get("available", False)}
+        result.update({k: v for k, v in info.items() if k != "available"})
+        return result
     
     def _test_tensor_operations(self) -> Dict[str, Any]:
         """测试基础tensor操作"""
@@ -404,62 +500,245 @@ class ModelHealthChecker:
             "functionality_test": self.run_quick_test()
         }
 
-def create_health_endpoint():
-    """创建简单的HTTP健康检查端点"""
+class HealthSampler:
+    """后台健康快照采样器
+    
+    按固定间隔在后台线程刷新系统健康状态，并预先序列化为JSON，
+    请求处理只返回最近一次快照，不做任何采样。
+    传入 readiness (ReadinessProbe) 时同一后台线程先完成模型加载预热，
+    之后每轮按探针的 min_interval 执行热就绪探测，/ready 只读取探针状态。
+    """
+    
+    def __init__(self, checker: ModelHealthChecker, interval: float = 5.0, readiness=None):
+        self.checker = checker
+        self.interval = interval
+        self.readiness = readiness
+        self._payload = b'{}'
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        """启动采样线程 (同步完成第一次采样，保证启动后即有快照)"""
+        self.checker.cpu_meter.percent(interval=None)  # 初始化CPU计数基准
+        self._refresh()
+        self._thread = threading.Thread(target=self._run, name="health-sampler", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """停止采样线程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+    
+    def payload(self) -> bytes:
+        """最近一次快照 (已序列化)"""
+        return self._payload
+    
+    def _refresh(self):
+        status = self.checker.check_system_health(cpu_interval=None)
+        status["refresh_interval"] = self.interval
+        self._payload = json.dumps(status, indent=2).encode()
+        if HAS_METRICS:
+            self._update_gauges(status)
+    
+    @staticmethod
+    def _update_gauges(status: Dict[str, Any]):
+        """用同一份快照更新 /metrics 的主机/GPU内存仪表"""
+        system = status.get("system", {})
+        gpu = status.get("gpu", {})
+        if "memory_total_gb" in system:
+            total = system["memory_total_gb"] * 1024**3
+            inference_metrics.HOST_MEMORY_TOTAL.set(total)
+            inference_metrics.HOST_MEMORY_USED.set(total - system["memory_available_gb"] * 1024**3)
+        for device in gpu.get("devices", []):
+            index = str(device["index"])
+            inference_metrics.GPU_MEMORY_TOTAL.set(device["memory_total_mb"] * 1024**2, device=index)
+            inference_metrics.GPU_MEMORY_USED.set(device["memory_used_mb"] * 1024**2, device=index)
+    
+    def _probe_readiness(self):
+        if self.readiness is None:
+            return
+        try:
+            self.readiness.probe()
+        except Exception as e:
+            print(f"热就绪探测失败: {e}", file=sys.stderr)
+    
+    def _run(self):
+        self._probe_readiness()  # 首次加载预热，不阻塞 start()
+        while not self._stop.wait(self.interval):
+            try:
+                self._refresh()
+            except Exception as e:
+                print(f"健康快照刷新失败: {e}", file=sys.stderr)
+            self._probe_readiness()
+
+
+class SingleFlight:
+    """相同键的并发调用合并为一次执行，结果在TTL内复用"""
+    
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result: Any = None
+            self.error: Optional[BaseException] = None
+    
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._calls: Dict[str, "SingleFlight._Call"] = {}
+        self._cache: Dict[str, tuple] = {}
+    
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """执行 fn，同一时刻同一键只有一个调用真正执行"""
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and time.time() - cached[0] < self.ttl:
+                return cached[1]
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = SingleFlight._Call()
+        
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    if call.error is None:
+                        self._cache[key] = (time.time(), call.result)
+                    del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+        
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+def create_health_endpoint(model_name: str = "UNKNOWN", refresh_interval: float = 5.0,
+                           detailed_ttl: float = 30.0, readiness=None):
+    """创建多线程HTTP健康检查端点
+    
+    /health 返回后台采样器的缓存快照；/health/detailed 按模型单飞执行并缓存；
+    /metrics 以Prometheus文本格式输出本进程及推理包装脚本写入的指标；
+    /ready 在热就绪探针通过时返回200，否则返回503，调度器据此只向就绪容器分发任务。
+    readiness 为 ReadinessProbe 时由采样线程完成首次加载和后续探测，加载完成前 /ready 返回503 (state=warming)；
+    为 None 时 /ready 退化为静态的文件/依赖检查。
+    处理类的 sampler 属性为已启动的采样器，停止服务时需调用其 stop()。
+    """
     try:
-        from http.server import HTTPServer, BaseHTTPRequestHandler
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
         import urllib.parse
         
+        sampler = HealthSampler(ModelHealthChecker(model_name), interval=refresh_interval,
+                                readiness=readiness)
+        detailed = SingleFlight(ttl=detailed_ttl)
+        checkers: Dict[str, ModelHealthChecker] = {}
+        checkers_lock = threading.Lock()
+        
+        supported = {name.upper(): name for name in SUPPORTED_MODELS + [model_name]}
+        
+        def get_checker(name: str) -> Optional[ModelHealthChecker]:
+            """只为支持的模型创建检查器，避免任意 ?model= 取值让缓存无限增长"""
+            name = supported.get(name.upper())
+            if name is None:
+                return None
+            with checkers_lock:
+                if name not in checkers:
+                    checkers[name] = ModelHealthChecker(name)
+                return checkers[name]
+        
         class HealthHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
             def do_GET(self):
                 # 解析请求路径
                 parsed_path = urllib.parse.urlparse(self.path)
                 
                 if parsed_path.path == "/health":
-                    # 基础健康检查
-                    model_name = urllib.parse.parse_qs(parsed_path.query).get('model', ['UNKNOWN'])[0]
-                    checker = ModelHealthChecker(model_name)
-                    status = checker.check_system_health()
-                    
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(status, indent=2).encode())
+                    # 基础健康检查 (缓存快照)
+                    self._send_json(HealthHandler.sampler.payload())
                     
                 elif parsed_path.path == "/health/detailed":
-                    # 详细健康检查
-                    model_name = urllib.parse.parse_qs(parsed_path.query).get('model', ['UNKNOWN'])[0]
-                    checker = ModelHealthChecker(model_name)
-                    status = checker.get_comprehensive_status()
+                    # 详细健康检查 (并发请求合并)
+                    name = urllib.parse.parse_qs(parsed_path.query).get('model', [model_name])[0]
+                    checker = get_checker(name)
+                    if checker is None:
+                        body = json.dumps({"error": f"unknown model: {name}",
+                                           "supported": SUPPORTED_MODELS}).encode()
+                        self._send_json(body, status=404)
+                        return
+                    body = detailed.do(
+                        checker.model_name,
+                        lambda: json.dumps(checker.get_comprehensive_status(), indent=2).encode()
+                    )
+                    self._send_json(body)
+                    
+                elif parsed_path.path == "/ready":
+                    if readiness is not None:
+                        # 探测在采样线程执行，请求只读取最近状态
+                        result = readiness.status()
+                    else:
+                        model_health = get_checker(model_name).check_model_health()
+                        result = {"model": model_name, "ready": model_health["status"] == "ready",
+                                  "warm": False, "model_health": model_health}
+                    self._send_json(json.dumps(result, indent=2).encode(),
+                                    status=200 if result.get("ready") else 503)
                     
+                elif parsed_path.path == "/metrics" and HAS_METRICS:
+                    body = inference_metrics.REGISTRY.render(inference_metrics.METRICS_DIR).encode()
                     self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
+                    self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
                     self.end_headers()
-                    self.wfile.write(json.dumps(status, indent=2).encode())
+                    self.wfile.write(body)
                     
                 else:
                     self.send_response(404)
+                    self.send_header('Content-Length', '9')
                     self.end_headers()
                     self.wfile.write(b'Not Found')
             
+            def _send_json(self, body: bytes, status: int = 200):
+                self.send_response(status)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
             def log_message(self, format, *args):
                 # 简化日志输出
                 pass
         
-        return HTTPServer, HealthHandler
+        HealthHandler.sampler = sampler
+        sampler.start()
+        return ThreadingHTTPServer, HealthHandler
     except ImportError:
         return None, None
 
 def main():
     parser = argparse.ArgumentParser(description='模型健康检查工具')
     parser.add_argument('--model', type=str, required=True,
-                       choices=['MapTR', 'PETR', 'StreamPETR', 'TopoMLP', 'VAD'],
+                       choices=SUPPORTED_MODELS,
                        help='模型名称')
     parser.add_argument('--mode', type=str, default='check',
-                       choices=['check', 'test', 'comprehensive', 'server'],
+                       choices=['check', 'test', 'comprehensive', 'ready', 'server'],
                        help='运行模式')
     parser.add_argument('--port', type=int, default=8080,
                        help='HTTP服务器端口 (仅server模式)')
+    parser.add_argument('--interval', type=float, default=5.0,
+                       help='健康快照刷新间隔秒数 (仅server模式)')
+    parser.add_argument('--warm', action='store_true',
+                       help='server模式下常驻加载模型，/ready 执行热就绪探测')
+    parser.add_argument('--config', type=str, default=None,
+                       help='模型配置文件 (ready模式/--warm，默认取 models_config.json)')
+    parser.add_argument('--checkpoint', type=str, default=None,
+                       help='模型检查点 (ready模式/--warm，默认 /app/checkpoints/<weight_file>)')
+    parser.add_argument('--device', type=str, default='cuda:0',
+                       help='热就绪探测使用的设备')
     
     args = parser.parse_args()
     
@@ -480,18 +759,40 @@ def main():
         status = checker.get_comprehensive_status()
         print(json.dumps(status, indent=2))
         
+    elif args.mode == 'ready':
+        # 热就绪探测: 加载模型一次，冷启动后再测一次热延迟
+        from readiness_probe import ReadinessProbe
+        probe = ReadinessProbe(args.model, config_path=args.config,
+                               checkpoint=args.checkpoint, device=args.device)
+        cold = probe.probe(force=True)
+        result = cold
+        if cold.get("ready"):
+            result = probe.probe(force=True)
+            result["cold_latency_ms"] = cold["warm_latency_ms"]
+        print(json.dumps(result, indent=2))
+        sys.exit(0 if result["ready"] else 1)
+        
     elif args.mode == 'server':
         # HTTP服务器模式
-        HTTPServer, HealthHandler = create_health_endpoint()
+        readiness = None
+        if args.warm:
+            from readiness_probe import ReadinessProbe
+            readiness = ReadinessProbe(args.model, config_path=args.config,
+                                       checkpoint=args.checkpoint, device=args.device)
+        HTTPServer, HealthHandler = create_health_endpoint(args.model, refresh_interval=args.interval,
+                                                           readiness=readiness)
         if HTTPServer and HealthHandler:
             server = HTTPServer(('0.0.0.0', args.port), HealthHandler)
             print(f"健康检查服务器运行在端口 {args.port}")
             print(f"访问 http://localhost:{args.port}/health?model={args.model}")
             print(f"访问 http://localhost:{args.port}/health/detailed?model={args.model}")
+            print(f"访问 http://localhost:{args.port}/ready")
+            print(f"访问 http://localhost:{args.port}/metrics")
             try:
                 server.serve_forever()
             except KeyboardInterrupt:
-                server.shutdown()
+                server.server_close()
+                HealthHandler.sampler.stop()
                 print("\n服务器已停止")
         else:
             print("HTTP服务器不可用，请检查Python环境")
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+推理指标注册表
+进程内的低开销计数器/仪表/直方图，输出Prometheus文本格式。
+推理包装脚本是独立的短生命周期进程，可将快照写入共享目录，
+由健康检查服务在 /metrics 抓取时合并。
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # 非POSIX平台不加锁
+    fcntl = None
+
+# 多进程快照目录
+METRICS_DIR = os.environ.get('INFERENCE_METRICS_DIR', '/tmp/inference_metrics')
+
+# 默认延迟直方图分桶 (秒)，覆盖毫秒级预处理到分钟级推理
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# 内存直方图分桶 (字节)，256MB 到 64GB
+MEMORY_BUCKETS = tuple(float(2 ** i * 1024 ** 2) for i in range(8, 17))
+
+LabelKey = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelKey, extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """指标基类: 按标签值元组保存样本"""
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def snapshot(self) -> Dict[LabelKey, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self, values: Dict[LabelKey, float]) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}"
+                for k, v in sorted(values.items())]
+
+
+class Gauge(Counter):
+    """可增可减的仪表"""
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """累积分桶直方图"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签: [各桶计数..., 总和, 总数]
+        self._values: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """计时上下文"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> Dict[LabelKey, List[float]]:
+        with self._lock:
+            return {k: list(v) for k, v in self._values.items()}
+
+    def render(self, values: Dict[LabelKey, List[float]]) -> List[str]:
+        lines = []
+        inf_label = 'le="+Inf"'
+        for key, state in sorted(values.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, inf_label)} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(state[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """所有指标的当前值"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: m.snapshot() for m in metrics}
+
+    def persist(self, directory: str = METRICS_DIR, name: Optional[str] = None) -> Path:
+        """将快照合并写入共享目录 (供独立进程的包装脚本使用)
+
+        同名快照文件在文件锁内读取-合并-原子替换，短生命周期进程按模型名写入同一文件，
+        目录中的文件数不随请求数增长。计数器和直方图合并为累加，每个进程只应在退出前调用一次；
+        仪表取最新值，只更新仪表的进程 (如调度方) 可以反复调用。未指定名称时按PID写入 (覆盖)。
+        """
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        target = path / f"{name or os.getpid()}.json"
+        with open(path / f"{target.stem}.lock", 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            merged: Dict[str, Dict] = {}
+            if name is not None:
+                self._merge_file(target, merged)
+            self._merge_snapshot(self.snapshot(), merged)
+            data = {
+                metric_name: [[list(k), v] for k, v in values.items()]
+                for metric_name, values in merged.items()
+            }
+            tmp = target.with_suffix('.tmp')
+            with open(tmp, 'w') as f:
+                json.dump({'time': time.time(), 'metrics': data}, f)
+            os.replace(tmp, target)
+        return target
+
+    def _merge_file(self, snapshot_file: Path, merged: Dict[str, Dict]):
+        """将快照文件中的值合并到 merged (文件损坏或不存在时忽略)"""
+        try:
+            with open(snapshot_file) as f:
+                data = json.load(f)['metrics']
+        except (OSError, ValueError, KeyError):
+            return
+        self._merge_snapshot(
+            {metric_name: {tuple(k): v for k, v in items} for metric_name, items in data.items()},
+            merged
+        )
+
+    def _merge_snapshot(self, snapshot: Dict[str, Dict], merged: Dict[str, Dict]):
+        for metric_name, items in snapshot.items():
+            metric = self._metrics.get(metric_name)
+            if metric is None:
+                continue
+            values = merged.setdefault(metric_name, {})
+            for key, value in items.items():
+                self._merge_value(metric, values, key, value)
+
+    def render(self, directory: Optional[str] = None) -> str:
+        """输出Prometheus文本格式；指定目录时合并其中各进程的快照
+
+        计数器和直方图求和，仪表取最新写入的值。
+        """
+        merged = self.snapshot()
+        if directory and os.path.isdir(directory):
+            snapshot_files = sorted(Path(directory).glob('*.json'), key=lambda p: p.stat().st_mtime)
+            for snapshot_file in snapshot_files:
+                self._merge_file(snapshot_file, merged)
+
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render(merged.get(name, {})))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _merge_value(metric: _Metric, values: Dict, key: LabelKey, value):
+        if isinstance(metric, Gauge):
+            values[key] = value
+        elif isinstance(metric, Histogram):
+            current = values.get(key)
+            values[key] = list(value) if current is None else [a + b for a, b in zip(current, value)]
+        else:
+            values[key] = values.get(key, 0.0) + value
+
+
+# 默认注册表及推理指标
+REGISTRY = MetricsRegistry()
+
+INFERENCE_REQUESTS = REGISTRY.counter(
+    'inference_requests_total', '推理请求数', ('model', 'status'))
+INFERENCE_ERRORS = REGISTRY.counter(
+    'inference_errors_total', '推理错误数', ('model', 'error'))
+STAGE_LATENCY = REGISTRY.histogram(
+    'inference_stage_latency_seconds', '各推理阶段耗时 (秒)', ('model', 'stage'))
+QUEUE_DEPTH = REGISTRY.gauge(
+    'inference_queue_depth', '等待准入的推理任务数 (由调度方 run_comparison.py 维护)', ('model',))
+GPU_MEMORY_USED = REGISTRY.gauge(
+    'gpu_memory_used_bytes', 'GPU显存使用 (字节)', ('device',))
+GPU_MEMORY_TOTAL = REGISTRY.gauge(
+    'gpu_memory_total_bytes', 'GPU显存总量 (字节)', ('device',))
+HOST_MEMORY_USED = REGISTRY.gauge(
+    'host_memory_used_bytes', '主机内存使用 (字节，容器内按cgroup限制统计)', ())
+HOST_MEMORY_TOTAL = REGISTRY.gauge(
+    'host_memory_total_bytes', '主机内存总量 (字节，容器内为cgroup内存限制)', ())
+JOB_PEAK_PSS = REGISTRY.histogram(
+    'inference_job_peak_pss_bytes', '推理任务进程树峰值PSS (字节)', ('model',), MEMORY_BUCKETS)
+JOB_CPU_SECONDS = REGISTRY.counter(
+    'inference_job_cpu_seconds_total', '推理任务进程树CPU时间 (秒)', ('model',))
+
+
+def record_job_usage(model: str, usage) -> None:
+    """记录一个推理任务的进程树资源使用 (process_tree.JobUsage)"""
+    peak_mb = usage.peak_pss_mb if usage.peak_pss_mb is not None else usage.peak_rss_mb
+    if usage.samples:
+        JOB_PEAK_PSS.observe(peak_mb * 1024 ** 2, model=model)
+    JOB_CPU_SECONDS.inc(usage.cpu_seconds, model=model)
+
+
+@contextmanager
+def track_inference(model: str, stage: str = 'total') -> Iterator[None]:
+    """记录一次推理: 请求计数、阶段耗时和错误计数
+
+    排队深度 (QUEUE_DEPTH) 不在这里记录: 包装脚本是单次运行的进程，
+    由调度方在任务等待准入期间维护。
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        INFERENCE_REQUESTS.inc(model=model, status='error')
+        INFERENCE_ERRORS.inc(model=model, error=type(e).__name__)
+        raise
+    else:
+        INFERENCE_REQUESTS.inc(model=model, status='success')
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, model=model, stage=stage)
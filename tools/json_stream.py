@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+流式JSON数组扫描
+nuScenes 等数据集的表文件是一个巨大的JSON数组 (trainval 的 sample_data.json 达数百MB)，
+json.load 需要把整个文件和全部对象放进内存。这里按块读取文件，用 JSONDecoder.raw_decode
+逐条解码数组元素，内存占用只与块大小和单条记录大小有关，与文件大小无关。
+"""
+
+import re
+import json
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_SCALAR_LOOKAHEAD = 64
+
+
+class JSONStreamError(ValueError):
+    """文件不是合法的顶层JSON数组"""
+
+
+def iter_json_array(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Any]:
+    """逐条产出顶层JSON数组的元素"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buf = ''
+        pos = 0
+        eof = False
+
+        def fill() -> bool:
+            """读入下一块 (丢弃已解码部分)，文件结束时返回False"""
+            nonlocal buf, pos, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buf = buf[pos:] + chunk
+            pos = 0
+            return True
+
+        def skip_whitespace():
+            nonlocal pos
+            while True:
+                pos = _WHITESPACE.match(buf, pos).end()
+                if pos < len(buf) or not fill():
+                    return
+
+        skip_whitespace()
+        if pos >= len(buf) or buf[pos] != '[':
+            raise JSONStreamError(f"{path}: 顶层不是JSON数组")
+        pos += 1
+
+        expect_value = True     # 数组开头或逗号之后
+        empty = True
+        while True:
+            skip_whitespace()
+            if pos >= len(buf):
+                raise JSONStreamError(f"{path}: 文件在数组结束前截断")
+            char = buf[pos]
+            if char == ']':
+                if expect_value and not empty:
+                    raise JSONStreamError(f"{path}: 数组末尾多余的逗号")
+                return
+            if char == ',' and not expect_value:
+                pos += 1
+                expect_value = True
+                continue
+            if not expect_value:
+                raise JSONStreamError(f"{path}: 位置附近缺少逗号: {buf[pos:pos + 40]!r}")
+
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError as e:
+                    # 记录跨越了块边界: 读入更多数据后重试；已到文件末尾则为真实错误
+                    if eof or not fill():
+                        raise JSONStreamError(f"{path}: {e}") from e
+                    continue
+                # 对象/数组/字符串自带结束符；数字和字面量可能在块边界被截断
+                # (如 "1.|5e10" 会先解码出 1)，靠近缓冲区末尾时补读后重新解码
+                if (not isinstance(value, (dict, list, str)) and len(buf) - end < _SCALAR_LOOKAHEAD
+                        and not eof and fill()):
+                    continue
+                break
+            pos = end
+            expect_value = False
+            empty = False
+            yield value
+
+
+@dataclass
+class JSONArrayStats:
+    """数组扫描统计"""
+    path: str
+    records: int = 0
+    non_object_records: int = 0
+    missing_keys: Dict[str, int] = field(default_factory=dict)  # 键 -> 缺失该键的记录数
+    first_record: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+    @property
+    def valid(self) -> bool:
+        return self.error is None and not self.missing_keys and not self.non_object_records
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data['valid'] = self.valid
+        return data
+
+
+def scan_json_array(path: str, required_keys: Iterable[str] = (),
+                    on_record: Optional[Callable[[Dict[str, Any]], None]] = None,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> JSONArrayStats:
+    """流式统计数组记录数并检查每条记录的必需键
+
+    on_record 对每条对象记录调用一次，可用于累计跨表校验所需的少量字段。
+    解析错误记录在 error 中，已扫描部分的统计仍然有效。
+    """
+    required: List[str] = list(required_keys)
+    stats = JSONArrayStats(path=str(path))
+    try:
+        for record in iter_json_array(path, chunk_size=chunk_size):
+            stats.records += 1
+            if not isinstance(record, dict):
+                stats.non_object_records += 1
+                continue
+            if stats.first_record is None:
+                stats.first_record = record
+            for key in required:
+                if key not in record:
+                    stats.missing_keys[key] = stats.missing_keys.get(key, 0) + 1
+            if on_record is not None:
+                on_record(record)
+    except (OSError, UnicodeDecodeError, JSONStreamError) as e:
+        stats.error = str(e)
+    return stats
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='流式扫描JSON数组文件')
+    parser.add_argument('paths', nargs='+', help='JSON数组文件')
+    parser.add_argument('--keys', type=str, default='', help='必需键，逗号分隔')
+
+    args = parser.parse_args()
+    keys = [k for k in args.keys.split(',') if k]
+    for path in args.paths:
+        stats = scan_json_array(path, keys)
+        status = '✅' if stats.valid else '❌'
+        print(f"{status} {path}: {stats.records} 条记录")
+        if stats.missing_keys:
+            print(f"   缺失键: {stats.missing_keys}")
+        if stats.error:
+            print(f"   错误: {stats.error}")
+
+
+if __name__ == "__main__":
+    main()
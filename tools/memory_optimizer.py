@@ -9,37 +9,68 @@ import gc
 import sys
 import psutil
 import subprocess
-from typing import Dict, List, Tuple
+import tracemalloc
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import time
 
+import numpy as np
+
+from memory_recorder import MemoryRecorder
+from process_tree import ProcessTree
+from cgroup_limits import read_container_resources
+
 class MemoryOptimizer:
     """内存优化器"""
     
-    def __init__(self):
-        self.process = psutil.Process()
+    def __init__(self, pid: Optional[int] = None):
+        # 统计目标进程 (默认本进程) 及其全部子孙进程
+        self.process = psutil.Process(pid)
+        self.tree = ProcessTree(pid)
         
     def get_memory_info(self) -> Dict[str, float]:
-        """获取详细内存信息"""
-        # 系统内存
-        vm = psutil.virtual_memory()
+        """获取详细内存信息
+        
+        system_* 字段以容器cgroup内存限制为准 (未限制时为宿主机内存)，
+        宿主机数值另见 host_* 字段。
+        """
+        # 容器内存 (cgroup限制)，未限制时即宿主机内存
+        resources = read_container_resources()
+        total_mb = resources.memory_total_bytes / (1024**2)
+        used_mb = resources.memory_used_bytes / (1024**2)
+        percent = resources.memory_percent
         
         # 进程内存
         process_memory = self.process.memory_info()
+        tree = self.tree.sample()
         
         info = {
             # 系统内存 (MB)
-            'system_total_mb': vm.total / (1024**2),
-            'system_used_mb': vm.used / (1024**2),
-            'system_available_mb': vm.available / (1024**2),
-            'system_percent': vm.percent,
+            'system_total_mb': total_mb,
+            'system_used_mb': used_mb,
+            'system_available_mb': resources.memory_available_bytes / (1024**2),
+            'system_percent': percent,
+            
+            # 容器限制
+            'cgroup_version': resources.cgroup_version,
+            'memory_limited': resources.memory_limited,
+            'host_total_mb': resources.host_memory_total_bytes / (1024**2),
+            'host_available_mb': resources.host_memory_available_bytes / (1024**2),
+            'cpu_limit': resources.cpu_limit,
             
             # 进程内存 (MB)
             'process_rss_mb': process_memory.rss / (1024**2),
             'process_vms_mb': process_memory.vms / (1024**2),
             
+            # 进程树内存 (MB)，PSS按共享页面分摊，不重复计算fork出的worker
+            'process_tree_count': tree.num_processes,
+            'process_tree_rss_mb': tree.rss_mb,
+            'process_tree_pss_mb': tree.pss_mb if tree.pss_mb is not None else tree.rss_mb,
+            'process_tree_cpu_percent': tree.cpu_percent,
+            
             # 计算值
-            'recommended_total_mb': max(1024, vm.used / (1024**2) * 1.5),  # 推荐总内存
-            'memory_pressure': vm.percent > 80,  # 内存压力指标
+            'recommended_total_mb': max(1024, used_mb * 1.5),  # 推荐总内存
+            'memory_pressure': percent > 80,  # 内存压力指标 (相对容器预算)
         }
         
         return info
@@ -80,6 +111,13 @@ class MemoryOptimizer:
                 f"AI模型推荐至少1GB内存"
             )
         
+        # 使用率按容器限制计算，宿主机空闲内存不代表容器可用
+        if info['memory_limited'] and suggestions:
+            suggestions.append(
+                f"📦 以上按容器内存限制 {info['system_total_mb']:.0f}MB 计算 "
+                f"(宿主机 {info['host_total_mb']:.0f}MB)"
+            )
+        
         return status, suggestions
     
     def cleanup_memory(self) -> Dict[str, float]:
@@ -118,24 +156,52 @@ class MemoryOptimizer:
             'after_percent': after['system_percent']
         }
     
-    def monitor_memory(self, duration: int = 60, interval: int = 5):
-        """持续监控内存使用"""
-        print(f"📊 开始监控内存使用 ({duration}秒, 每{interval}秒检查)")
+    def monitor_memory(self, duration: int = 60, interval: int = 5, rate_hz: float = 10.0,
+                       pid: Optional[int] = None, export: Optional[str] = None) -> MemoryRecorder:
+        """持续监控内存使用
+        
+        后台以 rate_hz (最高20Hz) 记录系统、进程树和GPU内存时间序列，每 interval 秒打印一行；
+        结束时输出峰值汇总和推荐内存档位，可导出为CSV/Parquet。
+        """
+        recorder = MemoryRecorder(pid=pid or self.process.pid, rate_hz=rate_hz,
+                                  capacity=int(duration * min(rate_hz, 20.0)) + 100)
+        print(f"📊 开始监控内存使用 ({duration}秒, 采样{recorder.rate_hz:g}Hz, 每{interval}秒输出)")
         print("时间\t\t使用率\t已用内存\t可用内存")
         print("-" * 50)
         
         start_time = time.time()
-        while time.time() - start_time < duration:
-            info = self.get_memory_info()
-            timestamp = time.strftime("%H:%M:%S")
-            
-            print(f"{timestamp}\t{info['system_percent']:.1f}%\t\t"
-                  f"{info['system_used_mb']:.0f}MB\t\t{info['system_available_mb']:.0f}MB")
-            
-            if info['memory_pressure']:
-                print("⚠️ 检测到内存压力!")
+        with recorder:
+            while time.time() - start_time < duration:
+                info = self.get_memory_info()
+                timestamp = time.strftime("%H:%M:%S")
+                
+                print(f"{timestamp}\t{info['system_percent']:.1f}%\t\t"
+                      f"{info['system_used_mb']:.0f}MB\t\t{info['system_available_mb']:.0f}MB")
                 
-            time.sleep(interval)
+                if info['memory_pressure']:
+                    print("⚠️ 检测到内存压力!")
+                    
+                time.sleep(min(interval, max(0, duration - (time.time() - start_time))))
+        
+        overall = recorder.summary().get('all', {})
+        if overall:
+            print(f"\n📈 峰值 ({overall['samples']} 个样本):")
+            for name in recorder.columns:
+                print(f"   {name}: 峰值 {overall[name]['peak']:.0f}MB, 均值 {overall[name]['mean']:.0f}MB")
+            tier = recorder.recommend_memory_tier()
+            if tier:
+                print(f"   推荐内存档位 (进程树PSS峰值 ×1.25): {tier}GB")
+        
+        if export:
+            recorder.export(export)
+            print(f"💾 时间序列已导出: {export}")
+        
+        return recorder
+    
+    def check_leak(self, fn: Callable[[], Any], iterations: int = 100,
+                   name: str = "", **kwargs) -> 'LeakReport':
+        """重复执行 fn 检测内存泄漏 (参数见 LeakDetector)"""
+        return LeakDetector(self, **kwargs).run(fn, iterations=iterations, name=name)
     
     def get_top_memory_processes(self, limit: int = 5) -> List[Dict]:
         """获取内存使用最高的进程"""
@@ -150,6 +216,172 @@ class MemoryOptimizer:
         processes.sort(key=lambda x: x['memory_percent'], reverse=True)
         return processes[:limit]
 
+@dataclass
+class LeakCheckpoint:
+    """泄漏检测的一个检查点"""
+    iteration: int
+    elapsed_s: float
+    rss_mb: float
+    traced_mb: float
+
+
+@dataclass
+class AllocationSite:
+    """两次tracemalloc快照之间增长的分配位置"""
+    location: str
+    size_diff_kb: float
+    count_diff: int
+    size_kb: float
+
+
+@dataclass
+class LeakReport:
+    """泄漏检测结果 (斜率单位: KB/次迭代)"""
+    name: str
+    iterations: int
+    warmup: int
+    budget_kb_per_iter: float
+    rss_budget_kb_per_iter: float
+    traced_slope_kb_per_iter: float = 0.0
+    rss_slope_kb_per_iter: float = 0.0
+    passed: bool = True
+    checkpoints: List[LeakCheckpoint] = field(default_factory=list)
+    top_sites: List[AllocationSite] = field(default_factory=list)
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _slope(xs: List[float], ys: List[float]) -> float:
+    """最小二乘斜率 (少于两个点时为0)"""
+    if len(xs) < 2:
+        return 0.0
+    return float(np.polyfit(np.asarray(xs, dtype=float), np.asarray(ys, dtype=float), 1)[0])
+
+
+class LeakDetector:
+    """重复推理的内存泄漏检测
+    
+    先执行 warmup 次预热 (填充缓存、完成懒加载)，之后每 snapshot_every 次迭代
+    做一次GC并记录 tracemalloc 已追踪内存和进程RSS，用最小二乘拟合每次迭代的增长斜率。
+    tracemalloc 斜率反映Python对象的泄漏，RSS斜率还包含原生分配 (如CPU张量)；
+    任一斜率超出预算即判定失败。最终快照与预热后基线对比，列出增长最多的分配位置。
+    """
+    
+    def __init__(self, optimizer: Optional['MemoryOptimizer'] = None,
+                 budget_kb_per_iter: float = 16.0,
+                 rss_budget_kb_per_iter: Optional[float] = None,
+                 snapshot_every: int = 10, warmup: int = 5, top: int = 10,
+                 trace_frames: int = 1):
+        self.optimizer = optimizer or MemoryOptimizer()
+        self.budget_kb_per_iter = budget_kb_per_iter
+        # RSS受分配器缓存影响噪声较大，默认预算放宽到4倍
+        self.rss_budget_kb_per_iter = (rss_budget_kb_per_iter if rss_budget_kb_per_iter is not None
+                                       else budget_kb_per_iter * 4)
+        self.snapshot_every = max(1, snapshot_every)
+        self.warmup = warmup
+        self.top = top
+        self.trace_frames = trace_frames
+    
+    def _checkpoint(self, iteration: int, start: float) -> LeakCheckpoint:
+        gc.collect()
+        traced, _ = tracemalloc.get_traced_memory()
+        # 只读目标进程RSS，检查点本身不做额外分配 (不读取cgroup/进程树)
+        rss = self.optimizer.process.memory_info().rss
+        return LeakCheckpoint(
+            iteration=iteration,
+            elapsed_s=time.perf_counter() - start,
+            rss_mb=rss / (1024**2),
+            traced_mb=traced / (1024**2),
+        )
+    
+    def _top_sites(self, baseline: tracemalloc.Snapshot,
+                   final: tracemalloc.Snapshot) -> List[AllocationSite]:
+        # 排除tracemalloc、psutil和本模块自身的分配
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, os.path.join(os.path.dirname(psutil.__file__), '*')),
+        ]
+        stats = final.filter_traces(filters).compare_to(baseline.filter_traces(filters), 'lineno')
+        sites = []
+        for stat in stats:
+            if stat.size_diff <= 0:
+                continue
+            frame = stat.traceback[0]
+            sites.append(AllocationSite(
+                location=f"{frame.filename}:{frame.lineno}",
+                size_diff_kb=stat.size_diff / 1024,
+                count_diff=stat.count_diff,
+                size_kb=stat.size / 1024,
+            ))
+            if len(sites) >= self.top:
+                break
+        return sites
+    
+    def run(self, fn: Callable[[], Any], iterations: int = 100, name: str = "") -> LeakReport:
+        """执行 iterations 次 fn 并给出泄漏检测报告"""
+        report = LeakReport(
+            name=name or getattr(fn, '__name__', 'callable'),
+            iterations=iterations,
+            warmup=self.warmup,
+            budget_kb_per_iter=self.budget_kb_per_iter,
+            rss_budget_kb_per_iter=self.rss_budget_kb_per_iter,
+        )
+        
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start(self.trace_frames)
+        try:
+            for _ in range(self.warmup):
+                fn()
+            
+            start = time.perf_counter()
+            report.checkpoints.append(self._checkpoint(0, start))
+            baseline = tracemalloc.take_snapshot()
+            for i in range(1, iterations + 1):
+                fn()
+                if i % self.snapshot_every == 0 or i == iterations:
+                    report.checkpoints.append(self._checkpoint(i, start))
+            final = tracemalloc.take_snapshot()
+            report.top_sites = self._top_sites(baseline, final)
+        except Exception as e:
+            report.error = f"{type(e).__name__}: {e}"
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+        
+        xs = [c.iteration for c in report.checkpoints]
+        report.traced_slope_kb_per_iter = _slope(xs, [c.traced_mb * 1024 for c in report.checkpoints])
+        report.rss_slope_kb_per_iter = _slope(xs, [c.rss_mb * 1024 for c in report.checkpoints])
+        report.passed = (report.error is None
+                         and report.traced_slope_kb_per_iter <= self.budget_kb_per_iter
+                         and report.rss_slope_kb_per_iter <= self.rss_budget_kb_per_iter)
+        return report
+
+
+def print_leak_report(report: LeakReport):
+    """打印泄漏检测报告"""
+    print("=" * 60)
+    print(f"🔍 内存泄漏检测: {report.name} ({report.iterations} 次迭代, 预热 {report.warmup} 次)")
+    print("=" * 60)
+    if report.error:
+        print(f"❌ 执行失败: {report.error}")
+    if report.checkpoints:
+        first, last = report.checkpoints[0], report.checkpoints[-1]
+        print(f"📈 tracemalloc: {first.traced_mb:.2f}MB → {last.traced_mb:.2f}MB, "
+              f"斜率 {report.traced_slope_kb_per_iter:.2f}KB/次 (预算 {report.budget_kb_per_iter:g}KB/次)")
+        print(f"📈 进程RSS: {first.rss_mb:.1f}MB → {last.rss_mb:.1f}MB, "
+              f"斜率 {report.rss_slope_kb_per_iter:.2f}KB/次 (预算 {report.rss_budget_kb_per_iter:g}KB/次)")
+    if report.top_sites:
+        print(f"\n🔝 增长最多的分配位置:")
+        for site in report.top_sites:
+            print(f"   +{site.size_diff_kb:.1f}KB ({site.count_diff:+d} 个对象) {site.location}")
+    print(f"\n{'✅ 未检测到泄漏' if report.passed else '🚨 内存增长超出预算'}")
+    print("=" * 60)
+
+
 def print_memory_report():
     """打印详细内存报告"""
     optimizer = MemoryOptimizer()
@@ -164,7 +396,13 @@ def print_memory_report():
     print(f"💾 系统内存: {info['system_used_mb']:.1f}MB / {info['system_total_mb']:.1f}MB "
           f"({info['system_percent']:.1f}%)")
     print(f"🆓 可用内存: {info['system_available_mb']:.1f}MB")
+    if info['memory_limited']:
+        print(f"📦 容器内存限制 (cgroup v{info['cgroup_version']}): {info['system_total_mb']:.1f}MB, "
+              f"宿主机 {info['host_total_mb']:.1f}MB")
+    print(f"🖥️ 可用CPU: {info['cpu_limit']:g} 核")
     print(f"🔄 进程内存: RSS={info['process_rss_mb']:.1f}MB, VMS={info['process_vms_mb']:.1f}MB")
+    print(f"🌲 进程树 ({info['process_tree_count']}个进程): RSS={info['process_tree_rss_mb']:.1f}MB, "
+          f"PSS={info['process_tree_pss_mb']:.1f}MB")
     
     # 状态评估
     status_emoji = {
@@ -193,6 +431,45 @@ def print_memory_report():
     
     return optimizer, status
 
+def run_leak_check(args) -> int:
+    """命令行泄漏检测，超出预算时返回1"""
+    import json
+    
+    if not args.model:
+        print("❌ 泄漏检测需要 --model")
+        return 2
+    
+    if args.leak_check == 'standardize':
+        from model_output_standard import create_standardizer
+        if not args.raw_output:
+            print("❌ 标准化泄漏检测需要 --raw-output")
+            return 2
+        with open(args.raw_output) as f:
+            raw_output = json.load(f)
+        standardizer = create_standardizer(args.model)
+        metadata = {'model_version': 'leak-check'}
+        fn = lambda: standardizer.standardize(raw_output, metadata).to_dict()
+    else:
+        from readiness_probe import ReadinessProbe
+        probe = ReadinessProbe(args.model, min_interval=0)
+        result = probe.probe(force=True)
+        if not result['ready']:
+            print(f"❌ 模型加载失败: {result.get('error')}")
+            return 1
+        fn = lambda: probe.probe(force=True)
+    
+    report = MemoryOptimizer().check_leak(
+        fn, iterations=args.iterations, name=f"{args.model} {args.leak_check}",
+        budget_kb_per_iter=args.leak_budget, warmup=args.warmup,
+        snapshot_every=args.snapshot_every,
+    )
+    print_leak_report(report)
+    if args.export:
+        with open(args.export, 'w') as f:
+            json.dump(report.to_dict(), f, indent=2)
+        print(f"💾 报告已导出: {args.export}")
+    return 0 if report.passed else 1
+
 def main():
     """主函数"""
     import argparse
@@ -201,9 +478,24 @@ def main():
     parser.add_argument('--cleanup', action='store_true', help='执行内存清理')
     parser.add_argument('--monitor', type=int, metavar='SECONDS', help='监控指定秒数')
     parser.add_argument('--report', action='store_true', help='显示内存报告')
+    parser.add_argument('--rate', type=float, default=10.0, help='监控采样频率Hz (最高20)')
+    parser.add_argument('--pid', type=int, help='监控的目标进程 (含子进程)，默认本进程')
+    parser.add_argument('--export', type=str, help='导出时间序列 (.csv 或 .parquet)；泄漏检测时导出JSON报告')
+    parser.add_argument('--leak-check', choices=['standardize', 'inference'],
+                        help='重复执行标准化或热推理，检测内存泄漏')
+    parser.add_argument('--model', type=str, help='泄漏检测的模型名称')
+    parser.add_argument('--raw-output', type=str, help='标准化泄漏检测使用的原始输出JSON')
+    parser.add_argument('--iterations', type=int, default=100, help='泄漏检测迭代次数')
+    parser.add_argument('--warmup', type=int, default=5, help='泄漏检测预热次数')
+    parser.add_argument('--snapshot-every', type=int, default=10, help='每N次迭代记录一次快照')
+    parser.add_argument('--leak-budget', type=float, default=16.0,
+                        help='tracemalloc增长斜率预算 (KB/次迭代)，RSS预算为其4倍')
     
     args = parser.parse_args()
     
+    if args.leak_check:
+        sys.exit(run_leak_check(args))
+    
     # 默认显示报告
     if not any([args.cleanup, args.monitor]):
         args.report = True
@@ -217,7 +509,8 @@ def main():
     
     if args.monitor:
         print()
-        optimizer.monitor_memory(duration=args.monitor)
+        optimizer.monitor_memory(duration=args.monitor, rate_hz=args.rate,
+                                 pid=args.pid, export=args.export)
     
     # 根据状态提供操作建议
     if status in ["警告", "严重"]:
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+高频内存时间序列记录器
+以最高20Hz采样系统内存 (容器cgroup口径)、目标进程树内存和各GPU显存，写入预分配的NumPy环形缓冲区；
+支持按阶段 (load / warmup / inference 等) 标注，计算各阶段峰值和面积 (MB·s)，
+并导出为CSV或Parquet，用于确定Pod内存档位。
+"""
+
+import os
+import csv
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+import psutil
+
+from cgroup_limits import read_container_resources
+from gpu_telemetry import get_telemetry
+from process_tree import ProcessTree
+
+MAX_RATE_HZ = 20.0
+
+# 常见Pod内存档位 (GB)
+DEFAULT_MEMORY_TIERS_GB = (4, 8, 16, 24, 32, 48, 64, 96, 128)
+
+
+class MemoryRecorder:
+    """内存时间序列记录器
+
+    每个采样行: 时间戳、阶段ID、系统已用内存、进程树RSS/PSS、各GPU已用显存 (MB)。
+    缓冲区写满后覆盖最旧的样本，内存占用固定为 capacity 行。
+    """
+
+    def __init__(self, pid: Optional[int] = None, rate_hz: float = 10.0,
+                 capacity: int = 72000, gpu: bool = True):
+        self.pid = pid or os.getpid()
+        self.rate_hz = min(rate_hz, MAX_RATE_HZ)
+        self.interval = 1.0 / self.rate_hz
+        self.capacity = capacity
+
+        self._telemetry = get_telemetry() if gpu else None
+        num_gpus = len(self._telemetry.snapshot(include_processes=False).devices) if gpu else 0
+        self.columns = ['system_used_mb', 'process_tree_rss_mb', 'process_tree_pss_mb'] + \
+            [f'gpu{i}_used_mb' for i in range(num_gpus)]
+        # nvidia-smi 每次查询都会启动子进程，GPU列降频到每秒一次
+        self._gpu_interval = 1.0 if (gpu and self._telemetry.backend_name == 'nvidia-smi') else 0.0
+        self._last_gpu: List[float] = [0.0] * num_gpus
+        self._last_gpu_at = 0.0
+
+        self._times = np.zeros(capacity, dtype=np.float64)
+        self._phases = np.zeros(capacity, dtype=np.int16)
+        self._values = np.zeros((capacity, len(self.columns)), dtype=np.float64)
+        self._next = 0
+        self._count = 0
+
+        self.phase_labels: List[str] = ['']
+        self._phase_stack: List[int] = [0]
+        self._tree = ProcessTree(self.pid)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- 采样 ----
+
+    def start(self) -> 'MemoryRecorder':
+        """启动后台采样线程"""
+        self._stop.clear()
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name="memory-recorder", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止采样 (并补采最后一个样本)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.sample()
+
+    def __enter__(self) -> 'MemoryRecorder':
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def _run(self):
+        # 按固定节拍采样，避免采样耗时累积造成漂移
+        next_tick = time.monotonic() + self.interval
+        while not self._stop.wait(max(0.0, next_tick - time.monotonic())):
+            self.sample()
+            next_tick += self.interval
+            now = time.monotonic()
+            if next_tick < now:
+                next_tick = now + self.interval
+
+    def sample(self):
+        """采集一个样本写入环形缓冲区"""
+        now = time.time()
+        try:
+            tree = self._tree.sample()
+            tree_mb = [tree.rss_mb, tree.pss_mb if tree.pss_mb is not None else tree.rss_mb]
+        except psutil.Error:
+            tree_mb = [0.0, 0.0]
+        # 容器内 psutil.virtual_memory() 是宿主机口径，系统内存取cgroup工作集 (未限制时为宿主机)
+        row = [read_container_resources().memory_used_bytes / (1024 ** 2)] + tree_mb
+        if self._telemetry is not None:
+            row.extend(self._gpu_used_mb())
+
+        with self._lock:
+            i = self._next
+            self._times[i] = now
+            self._phases[i] = self._phase_stack[-1]
+            self._values[i, :len(row)] = row[:len(self.columns)]
+            self._next = (i + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def _gpu_used_mb(self) -> List[float]:
+        now = time.monotonic()
+        if now - self._last_gpu_at >= self._gpu_interval:
+            snapshot = self._telemetry.snapshot(include_processes=False, max_age=0)
+            used = {d.index: d.memory_used_mb for d in snapshot.devices}
+            self._last_gpu = [used.get(i, 0.0) for i in range(len(self._last_gpu))]
+            self._last_gpu_at = now
+        return self._last_gpu
+
+    # ---- 阶段标注 ----
+
+    @contextmanager
+    def phase(self, label: str) -> Iterator[None]:
+        """标注代码块所属阶段 (可嵌套，样本归属最内层阶段)"""
+        if label not in self.phase_labels:
+            self.phase_labels.append(label)
+        self._phase_stack.append(self.phase_labels.index(label))
+        self.sample()
+        try:
+            yield
+        finally:
+            self.sample()
+            self._phase_stack.pop()
+
+    # ---- 数据访问 ----
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """按时间顺序返回缓冲区内容的副本"""
+        with self._lock:
+            if self._count < self.capacity:
+                order = np.arange(self._count)
+            else:
+                order = np.roll(np.arange(self.capacity), -self._next)
+            data = {
+                'timestamp': self._times[order].copy(),
+                'phase_id': self._phases[order].copy(),
+            }
+            values = self._values[order].copy()
+        for j, name in enumerate(self.columns):
+            data[name] = values[:, j]
+        return data
+
+    def summary(self) -> Dict[str, Any]:
+        """各阶段的样本数、时长，以及每列的峰值、均值和面积 (MB·s)"""
+        data = self.arrays()
+        times = data['timestamp']
+        if len(times) == 0:
+            return {}
+
+        # 每个样本代表到下一个样本为止的时间段 (最后一个样本取名义间隔)
+        dt = np.diff(times, append=times[-1] + self.interval)
+        dt = np.minimum(dt, 4 * self.interval + 1.0)   # 采样间断时不把空白计入面积
+
+        result = {}
+        phase_ids = data['phase_id']
+        groups = [('all', np.ones(len(times), dtype=bool))]
+        groups += [(label, phase_ids == i) for i, label in enumerate(self.phase_labels) if label]
+        for label, mask in groups:
+            if not mask.any():
+                continue
+            stats = {
+                'samples': int(mask.sum()),
+                'duration_s': float(dt[mask].sum()),
+            }
+            for name in self.columns:
+                values = data[name][mask]
+                stats[name] = {
+                    'peak': float(values.max()),
+                    'mean': float(values.mean()),
+                    'auc_mb_s': float((values * dt[mask]).sum()),
+                }
+            result[label] = stats
+        return result
+
+    def recommend_memory_tier(self, column: str = 'process_tree_pss_mb', headroom: float = 1.25,
+                              tiers_gb=DEFAULT_MEMORY_TIERS_GB) -> Optional[int]:
+        """按记录到的峰值乘以余量，选择能容纳的最小内存档位 (GB)"""
+        data = self.arrays()
+        if column not in data or len(data[column]) == 0:
+            return None
+        required_gb = data[column].max() * headroom / 1024
+        for tier in tiers_gb:
+            if tier >= required_gb:
+                return tier
+        return None
+
+    # ---- 导出 ----
+
+    def _rows(self) -> Dict[str, Any]:
+        data = self.arrays()
+        labels = np.asarray(self.phase_labels, dtype=object)
+        data['phase'] = labels[data.pop('phase_id')]
+        return data
+
+    def to_csv(self, path: str):
+        data = self._rows()
+        names = ['timestamp', 'phase'] + self.columns
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(names)
+            writer.writerows(zip(*(data[name].tolist() for name in names)))
+
+    def to_parquet(self, path: str):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError("导出Parquet需要 pyarrow: pip install pyarrow") from e
+        data = self._rows()
+        table = pyarrow.table({
+            'timestamp': data['timestamp'],
+            'phase': data['phase'].tolist(),
+            **{name: data[name] for name in self.columns},
+        })
+        pyarrow.parquet.write_table(table, path)
+
+    def export(self, path: str):
+        """按扩展名导出 (.parquet 为Parquet，其余为CSV)"""
+        if path.endswith('.parquet'):
+            self.to_parquet(path)
+        else:
+            self.to_csv(path)
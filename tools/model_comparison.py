@@ -4,15 +4,29 @@
 用于比较不同模型在相同数据上的表现
 """
 
+import csv
 import json
-import pandas as pd
 import numpy as np
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
 from pathlib import Path
-import matplotlib.pyplot as plt
-import seaborn as sns
 from model_output_standard import StandardOutput
+from performance_store import PerformanceStore, new_run_id
+
+# 自车距离分箱边界 (米) 及标签
+DISTANCE_BIN_EDGES = [20.0, 40.0]
+DISTANCE_BIN_LABELS = ['0-20m', '20-40m', '40m+']
+
+# matplotlib 只在图表路径中按需导入，报告和CSV不依赖pandas，
+# 仅调用 add_result 或生成JSON报告时不承担重量级库的导入开销
+
+
+def _load_pyplot():
+    """按需加载matplotlib (无界面Agg后端)"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
 
 @dataclass
 class ModelPerformance:
@@ -29,16 +43,47 @@ class ModelPerformance:
 class ModelComparator:
     """多模型比较器"""
     
-    def __init__(self, output_dir: str = "./comparison_results"):
+    def __init__(self, output_dir: str = "./comparison_results",
+                 store_dir: Optional[str] = None, run_id: Optional[str] = None):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
         self.results: List[StandardOutput] = []
         self.performances: List[ModelPerformance] = []
+        
+        # 可选的列式性能存储 (逐样本追加写入Parquet)，缺少pyarrow时禁用，不影响比较本身
+        self.store = None
+        if store_dir:
+            try:
+                self.store = PerformanceStore(store_dir)
+            except ImportError as e:
+                print(f"⚠️ 性能存储已禁用: {e}")
+        self.run_id = run_id or new_run_id()
+        
+        # 逐检测的列式记录，用于分组统计
+        self._model_index: Dict[str, int] = {}
+        self._class_index: Dict[str, int] = {}
+        self._scene_index: Dict[str, int] = {}
+        self._sample_models: List[int] = []
+        self._det_columns: List[Dict[str, np.ndarray]] = []
     
-    def add_result(self, result: StandardOutput):
+    def add_result(self, result: StandardOutput, sample_token: Optional[str] = None):
         """添加模型结果"""
         self.results.append(result)
-        self._calculate_performance(result)
+        performance = self._calculate_performance(result)
+        self._collect_detections(result)
+        
+        if self.store is not None:
+            self.store.append(performance.model_name, self.run_id, {
+                'sample_token': sample_token,
+                'timestamp': result.metadata.timestamp,
+                'inference_time': performance.inference_time,
+                'gpu_memory_used': performance.gpu_memory_used,
+                'detection_count': performance.detection_count,
+                'map_element_count': performance.map_element_count,
+                'avg_confidence': float(performance.avg_confidence),
+                'high_conf_ratio': performance.high_conf_ratio,
+                'has_error': performance.error_status is not None
+            })
     
     def _calculate_performance(self, result: StandardOutput) -> ModelPerformance:
         """计算模型性能指标"""
@@ -74,81 +119,213 @@ class ModelComparator:
         self.performances.append(performance)
         return performance
     
+    def _collect_detections(self, result: StandardOutput):
+        """将单个结果的检测追加为列式记录 (模型、类别、距离、场景、置信度)"""
+        model_idx = self._model_index.setdefault(result.metadata.model_name, len(self._model_index))
+        self._sample_models.append(model_idx)
+        
+        detections = result.detections_3d or []
+        if not detections:
+            return
+        
+        sample_info = getattr(result, 'sample_info', None) or {}
+        scene = str(sample_info.get('scene_token', 'unknown'))
+        scene_idx = self._scene_index.setdefault(scene, len(self._scene_index))
+        
+        centers = np.array([det.bbox_3d.center[:2] for det in detections], dtype=np.float64)
+        self._det_columns.append({
+            'model': np.full(len(detections), model_idx, dtype=np.int64),
+            'class': np.array([self._class_index.setdefault(det.class_name, len(self._class_index))
+                               for det in detections], dtype=np.int64),
+            'distance': np.hypot(centers[:, 0], centers[:, 1]),
+            'scene': np.full(len(detections), scene_idx, dtype=np.int64),
+            'confidence': np.array([det.confidence for det in detections], dtype=np.float64)
+        })
+    
+    def generate_breakdowns(self) -> Dict[str, Any]:
+        """按类别、自车距离分箱和场景分组统计各模型的检测"""
+        if not self._det_columns:
+            return {}
+        
+        columns = {key: np.concatenate([c[key] for c in self._det_columns]) for key in self._det_columns[0]}
+        models = sorted(self._model_index, key=self._model_index.get)
+        samples_per_model = np.bincount(self._sample_models, minlength=len(models))
+        distance_bin = np.digitize(columns['distance'], DISTANCE_BIN_EDGES)
+        
+        def by_group(group_idx: np.ndarray, labels: List[str]) -> Dict[str, Dict[str, Any]]:
+            return self._grouped_stats(columns['model'], group_idx, columns['confidence'],
+                                       models, labels, samples_per_model)
+        
+        return {
+            'by_class': by_group(columns['class'], sorted(self._class_index, key=self._class_index.get)),
+            'by_distance': by_group(distance_bin, DISTANCE_BIN_LABELS),
+            'by_scene': by_group(columns['scene'], sorted(self._scene_index, key=self._scene_index.get))
+        }
+    
+    @staticmethod
+    def _grouped_stats(model_idx: np.ndarray, group_idx: np.ndarray, confidence: np.ndarray,
+                       models: List[str], labels: List[str],
+                       samples_per_model: np.ndarray) -> Dict[str, Dict[str, Any]]:
+        """以 (模型, 分组) 组合键做 bincount 归约"""
+        n_models, n_groups = len(models), len(labels)
+        key = model_idx * n_groups + group_idx
+        size = n_models * n_groups
+        
+        count = np.bincount(key, minlength=size).reshape(n_models, n_groups)
+        conf_sum = np.bincount(key, weights=confidence, minlength=size).reshape(n_models, n_groups)
+        high_conf = np.bincount(key, weights=(confidence > 0.7).astype(np.float64),
+                                minlength=size).reshape(n_models, n_groups)
+        
+        safe_count = np.maximum(count, 1)
+        avg_conf = conf_sum / safe_count
+        high_ratio = high_conf / safe_count
+        per_sample = count / np.maximum(samples_per_model, 1)[:, None]
+        
+        stats = {}
+        for m, model in enumerate(models):
+            stats[model] = {
+                label: {
+                    'count': int(count[m, g]),
+                    'per_sample': float(per_sample[m, g]),
+                    'avg_confidence': float(avg_conf[m, g]),
+                    'high_conf_ratio': float(high_ratio[m, g])
+                }
+                for g, label in enumerate(labels) if count[:, g].any()
+            }
+        return stats
+    
+    def _breakdown_insights(self, breakdowns: Dict[str, Any], rows: List[Dict[str, Any]]) -> List[str]:
+        """找出最快模型相对检测最多模型损失检测的类别和距离段"""
+        insights = []
+        if len(rows) < 2 or not breakdowns:
+            return insights
+        
+        fastest = min(rows, key=lambda r: r['Inference_Time_s'])['Model']
+        for dimension, title in (('by_class', '类别'), ('by_distance', '距离')):
+            groups = breakdowns.get(dimension, {})
+            labels = {label for stats in groups.values() for label in stats}
+            for label in sorted(labels):
+                per_sample = {m: groups[m].get(label, {}).get('per_sample', 0.0) for m in groups}
+                best = max(per_sample, key=per_sample.get)
+                if best == fastest or per_sample[best] == 0:
+                    continue
+                loss = 1 - per_sample.get(fastest, 0.0) / per_sample[best]
+                if loss > 0.2:  # 损失超过20%
+                    insights.append(
+                        f"{title} {label}：最快模型 {fastest} 每样本检测数比 {best} 少 {loss * 100:.0f}%"
+                    )
+        return insights
+    
     def generate_comparison_report(self) -> Dict[str, Any]:
         """生成比较报告"""
         if not self.performances:
             return {"error": "No results to compare"}
         
-        # 创建性能数据框
-        df = pd.DataFrame([
-            {
-                'Model': p.model_name,
-                'Inference_Time_s': p.inference_time,
-                'GPU_Memory_MB': p.gpu_memory_used,
-                'Detection_Count': p.detection_count,
-                'Map_Element_Count': p.map_element_count,
-                'Avg_Confidence': p.avg_confidence,
-                'High_Conf_Ratio': p.high_conf_ratio,
-                'Has_Error': p.error_status is not None
-            }
-            for p in self.performances
-        ])
+        rows = self._performance_rows()
+        successful = sum(1 for p in self.performances if p.error_status is None)
+        report = self._build_report(rows, successful)
+        
+        # 分组细分统计
+        breakdowns = self.generate_breakdowns()
+        if breakdowns:
+            report["breakdowns"] = breakdowns
+            report["insights"].extend(self._breakdown_insights(breakdowns, rows))
+        
+        return report
+    
+    def generate_store_report(self, models: Optional[List[str]] = None,
+                              runs: Optional[List[str]] = None) -> Dict[str, Any]:
+        """基于列式存储生成比较报告 (默认覆盖全部历史运行)"""
+        if self.store is None:
+            return {"error": "Performance store not configured"}
+        
+        self.store.flush()
+        rows = self.store.summarize(models=models, runs=runs)
+        if not rows:
+            return {"error": "No results to compare"}
         
-        # 统计分析
+        successful = sum(1 for r in rows if r['Error_Count'] == 0)
+        report = self._build_report(rows, successful)
+        report["summary"]["runs"] = runs if runs else self.store.list_runs()
+        return report
+    
+    def _build_report(self, rows: List[Dict[str, Any]], successful: int) -> Dict[str, Any]:
+        """由按模型的行记录构建报告"""
         report = {
             "summary": {
-                "total_models": len(self.performances),
-                "successful_models": sum(1 for p in self.performances if p.error_status is None),
-                "failed_models": sum(1 for p in self.performances if p.error_status is not None)
+                "total_models": len(rows),
+                "successful_models": successful,
+                "failed_models": len(rows) - successful
             },
             "performance_ranking": {},
-            "detailed_comparison": df.to_dict('records'),
+            "detailed_comparison": rows,
             "insights": []
         }
         
         # 性能排名
-        if len(df) > 1:
+        if len(rows) > 1:
             report["performance_ranking"] = {
-                "fastest_inference": df.loc[df['Inference_Time_s'].idxmin(), 'Model'],
-                "lowest_memory": df.loc[df['GPU_Memory_MB'].idxmin(), 'Model'],
-                "most_detections": df.loc[df['Detection_Count'].idxmax(), 'Model'],
-                "highest_confidence": df.loc[df['Avg_Confidence'].idxmax(), 'Model']
+                "fastest_inference": min(rows, key=lambda r: r['Inference_Time_s'])['Model'],
+                "lowest_memory": min(rows, key=lambda r: r['GPU_Memory_MB'])['Model'],
+                "most_detections": max(rows, key=lambda r: r['Detection_Count'])['Model'],
+                "highest_confidence": max(rows, key=lambda r: r['Avg_Confidence'])['Model']
             }
             
             # 生成洞察
-            report["insights"] = self._generate_insights(df)
+            report["insights"] = self._generate_insights(rows)
         
         return report
     
-    def _generate_insights(self, df: pd.DataFrame) -> List[str]:
+    def _performance_rows(self) -> List[Dict[str, Any]]:
+        """将性能指标展开为按行记录 (报告和CSV共用)"""
+        return [
+            {
+                'Model': p.model_name,
+                'Inference_Time_s': p.inference_time,
+                'GPU_Memory_MB': p.gpu_memory_used,
+                'Detection_Count': p.detection_count,
+                'Map_Element_Count': p.map_element_count,
+                'Avg_Confidence': p.avg_confidence,
+                'High_Conf_Ratio': p.high_conf_ratio,
+                'Has_Error': p.error_status is not None
+            }
+            for p in self.performances
+        ]
+    
+    def _generate_insights(self, rows: List[Dict[str, Any]]) -> List[str]:
         """生成分析洞察"""
         insights = []
         
+        times = [r['Inference_Time_s'] for r in rows]
+        memories = [r['GPU_Memory_MB'] for r in rows]
+        detections = [r['Detection_Count'] for r in rows]
+        confidences = [r['Avg_Confidence'] for r in rows]
+        
         # 推理时间分析
-        time_range = df['Inference_Time_s'].max() - df['Inference_Time_s'].min()
-        if time_range > 0.1:  # 超过100ms差异
-            fastest = df.loc[df['Inference_Time_s'].idxmin(), 'Model']
-            slowest = df.loc[df['Inference_Time_s'].idxmax(), 'Model']
-            speedup = df['Inference_Time_s'].max() / df['Inference_Time_s'].min()
+        time_range = max(times) - min(times)
+        if time_range > 0.1 and min(times) > 0:  # 超过100ms差异
+            fastest = min(rows, key=lambda r: r['Inference_Time_s'])['Model']
+            slowest = max(rows, key=lambda r: r['Inference_Time_s'])['Model']
+            speedup = max(times) / min(times)
             insights.append(f"推理速度：{fastest} 比 {slowest} 快 {speedup:.1f}x")
         
         # 内存使用分析
-        memory_range = df['GPU_Memory_MB'].max() - df['GPU_Memory_MB'].min()
+        memory_range = max(memories) - min(memories)
         if memory_range > 500:  # 超过500MB差异
-            efficient = df.loc[df['GPU_Memory_MB'].idxmin(), 'Model']
-            hungry = df.loc[df['GPU_Memory_MB'].idxmax(), 'Model']
+            efficient = min(rows, key=lambda r: r['GPU_Memory_MB'])['Model']
+            hungry = max(rows, key=lambda r: r['GPU_Memory_MB'])['Model']
             insights.append(f"内存效率：{efficient} 比 {hungry} 节省 {memory_range:.0f}MB GPU内存")
         
         # 检测能力分析
-        if df['Detection_Count'].sum() > 0:
-            best_detector = df.loc[df['Detection_Count'].idxmax(), 'Model']
-            avg_detections = df['Detection_Count'].mean()
+        if sum(detections) > 0:
+            best_detector = max(rows, key=lambda r: r['Detection_Count'])['Model']
+            avg_detections = sum(detections) / len(detections)
             insights.append(f"检测能力：{best_detector} 检测到最多目标，平均检测数量 {avg_detections:.1f}")
         
         # 置信度分析
-        if df['Avg_Confidence'].max() > 0:
-            most_confident = df.loc[df['Avg_Confidence'].idxmax(), 'Model']
-            avg_conf = df['Avg_Confidence'].mean()
+        if max(confidences) > 0:
+            most_confident = max(rows, key=lambda r: r['Avg_Confidence'])['Model']
+            avg_conf = sum(confidences) / len(confidences)
             insights.append(f"置信度：{most_confident} 具有最高平均置信度，整体平均 {avg_conf:.3f}")
         
         return insights
@@ -159,6 +336,8 @@ class ModelComparator:
             print("需要至少2个模型结果才能创建比较图表")
             return
         
+        plt = _load_pyplot()
+        
         # 设置图表样式
         plt.style.use('seaborn-v0_8')
         fig, axes = plt.subplots(2, 2, figsize=(15, 12))
@@ -212,6 +391,7 @@ class ModelComparator:
         """创建雷达图比较"""
         try:
             from math import pi
+            plt = _load_pyplot()
             
             # 标准化数据 (0-1 范围，值越高越好)
             def normalize_metric(values, higher_better=True):
@@ -300,28 +480,26 @@ class ModelComparator:
             json.dump(report, f, indent=2, ensure_ascii=False)
         
         # 保存CSV格式的性能数据
+        csv_path = self.output_dir / "performance_comparison.csv"
         if self.performances:
-            df = pd.DataFrame([
-                {
-                    'Model': p.model_name,
-                    'Inference_Time_s': p.inference_time,
-                    'GPU_Memory_MB': p.gpu_memory_used,
-                    'Detection_Count': p.detection_count,
-                    'Map_Element_Count': p.map_element_count,
-                    'Avg_Confidence': p.avg_confidence,
-                    'High_Conf_Ratio': p.high_conf_ratio,
-                    'Has_Error': p.error_status is not None
-                }
-                for p in self.performances
-            ])
-            
-            csv_path = self.output_dir / "performance_comparison.csv"
-            df.to_csv(csv_path, index=False)
+            rows = self._performance_rows()
+            with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+                writer.writeheader()
+                writer.writerows(rows)
         
         print(f"📁 结果已保存至目录: {self.output_dir}")
         print(f"  - 详细结果: {results_path}")
         print(f"  - 比较报告: {report_path}")
         print(f"  - 性能CSV: {csv_path}")
+        
+        # 追加逐样本记录到列式存储
+        if self.store is not None:
+            try:
+                written = self.store.flush()
+                print(f"  - 性能存储: {self.store.root} (运行 {self.run_id}, 新增 {len(written)} 个分片)")
+            except ImportError as e:
+                print(f"  - 性能存储未写入: {e}")
 
 # 使用示例
 if __name__ == "__main__":
@@ -53,6 +53,12 @@ class PlanningTrajectory:
     total_distance: float        # 总距离
     safety_score: float          # 安全性评分
 
+@dataclass
+class LaneTopology:
+    """车道拓扑标准格式 (稀疏边表，索引为 map_elements 中的元素ID)"""
+    lane_lane: List[List[float]]     # 车道-车道连接 [[lane_id, lane_id, score], ...]
+    lane_traffic: List[List[float]]  # 车道-交通元素关联 [[lane_id, element_id, score], ...]
+
 @dataclass
 class ModelMetadata:
     """模型元数据"""
@@ -82,6 +88,12 @@ class StandardOutput:
     # 规划轨迹
     planning_trajectory: Optional[PlanningTrajectory] = None
     
+    # 车道拓扑
+    topology: Optional[LaneTopology] = None
+    
+    # 样本信息 (sample_token, scene_token, timestamp等时序上下文)
+    sample_info: Optional[Dict[str, Any]] = None
+    
     # 原始输出 (保留原始格式以备调试)
     raw_output: Optional[Dict[str, Any]] = None
     
@@ -231,13 +243,90 @@ class OutputStandardizer:
     
     def _standardize_streampetr(self, raw_output: Any, metadata: ModelMetadata) -> StandardOutput:
         """标准化StreamPETR输出"""
-        # StreamPETR输出格式类似PETR，但包含时序信息
-        return self._standardize_petr(raw_output, metadata)
+        # StreamPETR输出格式类似PETR，额外保留跟踪ID、速度和时序信息
+        output = self._standardize_petr(raw_output, metadata)
+        
+        if isinstance(raw_output, dict):
+            pts_bbox = raw_output.get('pts_bbox', {})
+            boxes_3d = pts_bbox.get('boxes_3d', [])
+            track_ids = pts_bbox.get('track_ids', pts_bbox.get('instance_ids'))
+            
+            for det in output.detections_3d or []:
+                box = boxes_3d[det.id]
+                if track_ids is not None and det.id < len(track_ids):
+                    det.attributes['track_id'] = int(track_ids[det.id])
+                # nuScenes框格式: [x, y, z, w, l, h, yaw, vx, vy]
+                if len(box) >= 9:
+                    det.attributes['velocity'] = [float(box[7]), float(box[8])]
+            
+            output.sample_info = self._extract_sample_info(raw_output)
+        
+        return output
+    
+    def _extract_sample_info(self, raw_output: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """提取样本时序上下文"""
+        keys = ['sample_token', 'scene_token', 'timestamp', 'frame_idx']
+        info = {key: raw_output[key] for key in keys if key in raw_output}
+        return info if info else None
     
     def _standardize_topomlp(self, raw_output: Any, metadata: ModelMetadata) -> StandardOutput:
         """标准化TopoMLP输出"""
-        # TopoMLP主要用于拓扑感知检测
-        return self._standardize_petr(raw_output, metadata)
+        # TopoMLP输出OpenLane-V2格式：车道中心线、交通元素及两类拓扑关系
+        if not isinstance(raw_output, dict) or 'lane_centerline' not in raw_output:
+            return self._standardize_petr(raw_output, metadata)
+        
+        map_elements = []
+        lanes = raw_output.get('lane_centerline', [])
+        traffic_elements = raw_output.get('traffic_element', [])
+        
+        for i, lane in enumerate(lanes):
+            points = lane.get('points', [])
+            map_elements.append(VectorElement(
+                id=i,
+                type='lane_centerline',
+                points=points.tolist() if hasattr(points, 'tolist') else points,
+                confidence=float(lane.get('confidence', 0.0)),
+                attributes={'source_id': lane.get('id', i)}
+            ))
+        
+        # 交通元素ID接在车道之后，拓扑边用元素ID引用
+        te_offset = len(lanes)
+        for i, te in enumerate(traffic_elements):
+            points = te.get('points', [])
+            map_elements.append(VectorElement(
+                id=te_offset + i,
+                type='traffic_element',
+                points=points.tolist() if hasattr(points, 'tolist') else points,
+                confidence=float(te.get('confidence', 0.0)),
+                attributes={'source_id': te.get('id', i), 'attribute': int(te.get('attribute', -1))}
+            ))
+        
+        topology = LaneTopology(
+            lane_lane=self._adjacency_to_edges(raw_output.get('topology_lclc'), 0, 0),
+            lane_traffic=self._adjacency_to_edges(raw_output.get('topology_lcte'), 0, te_offset)
+        )
+        
+        return StandardOutput(
+            metadata=metadata,
+            map_elements=map_elements if map_elements else None,
+            topology=topology,
+            sample_info=self._extract_sample_info(raw_output),
+            raw_output=raw_output
+        )
+    
+    def _adjacency_to_edges(self, adjacency: Any, row_offset: int, col_offset: int,
+                            min_score: float = 0.01) -> List[List[float]]:
+        """将稠密邻接概率矩阵转为稀疏边表 (丢弃低于 min_score 的边)"""
+        if adjacency is None:
+            return []
+        matrix = np.asarray(adjacency, dtype=np.float64)
+        if matrix.ndim != 2 or matrix.size == 0:
+            return []
+        rows, cols = np.nonzero(matrix >= min_score)
+        return [
+            [int(r) + row_offset, int(c) + col_offset, float(matrix[r, c])]
+            for r, c in zip(rows, cols)
+        ]
     
     def _standardize_vad(self, raw_output: Any, metadata: ModelMetadata) -> StandardOutput:
         """标准化VAD输出"""
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Parquet 文件尾扫描
+Parquet 文件以 "PAR1" 开头和结尾，结尾前4字节为文件尾 (FileMetaData，Thrift compact编码) 的长度。
+这里只读取文件尾并用纯Python解码，得到行数、row group、列名、各列统计信息，
+同时检查魔数、文件尾长度、各列数据块范围和行数是否一致，不读取任何列数据。
+av2 场景文件的 scenario_id 等常量列可直接从列统计 (min == max) 得到。
+
+统计轨迹数需要 track_id 列的不同值个数: 文件尾统计中有 distinct_count 时直接使用，
+否则在安装了 pyarrow 时只读取这一列计算。
+"""
+
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+MAGIC = b'PAR1'
+DEFAULT_WORKERS = 16
+
+# Thrift compact 协议的类型编号
+_STOP, _TRUE, _FALSE, _BYTE, _I16, _I32, _I64, _DOUBLE, _BINARY, _LIST, _SET, _MAP, _STRUCT = range(13)
+
+
+class ParquetFormatError(ValueError):
+    """文件不是完整的Parquet文件"""
+
+
+class _CompactReader:
+    """Thrift compact 协议解码: 结构体解为 {字段号: 值}"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def _byte(self) -> int:
+        if self.pos >= len(self.data):
+            raise ParquetFormatError("文件尾数据不完整")
+        value = self.data[self.pos]
+        self.pos += 1
+        return value
+
+    def _varint(self) -> int:
+        result = shift = 0
+        while True:
+            byte = self._byte()
+            result |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return result
+            shift += 7
+
+    def _zigzag(self) -> int:
+        n = self._varint()
+        return (n >> 1) ^ -(n & 1)
+
+    def _value(self, type_id: int) -> Any:
+        if type_id in (_TRUE, _FALSE):
+            return type_id == _TRUE
+        if type_id == _BYTE:
+            return self._byte()
+        if type_id in (_I16, _I32, _I64):
+            return self._zigzag()
+        if type_id == _DOUBLE:
+            end = self.pos + 8
+            if end > len(self.data):
+                raise ParquetFormatError("文件尾数据不完整")
+            value = struct.unpack_from('<d', self.data, self.pos)[0]
+            self.pos = end
+            return value
+        if type_id == _BINARY:
+            length = self._varint()
+            end = self.pos + length
+            if end > len(self.data):
+                raise ParquetFormatError("文件尾数据不完整")
+            value = self.data[self.pos:end]
+            self.pos = end
+            return value
+        if type_id in (_LIST, _SET):
+            header = self._byte()
+            size, elem_type = header >> 4, header & 0x0F
+            if size == 15:
+                size = self._varint()
+            if elem_type in (_TRUE, _FALSE):
+                # 集合中的布尔值各占一个字节
+                return [self._byte() == _TRUE for _ in range(size)]
+            return [self._value(elem_type) for _ in range(size)]
+        if type_id == _MAP:
+            size = self._varint()
+            if not size:
+                return {}
+            types = self._byte()
+            key_type, value_type = types >> 4, types & 0x0F
+            return {self._value(key_type): self._value(value_type) for _ in range(size)}
+        if type_id == _STRUCT:
+            return self.read_struct()
+        raise ParquetFormatError(f"未知的Thrift类型 {type_id}")
+
+    def read_struct(self) -> Dict[int, Any]:
+        fields = {}
+        last_id = 0
+        while True:
+            header = self._byte()
+            type_id = header & 0x0F
+            if type_id == _STOP:
+                return fields
+            delta = header >> 4
+            field_id = last_id + delta if delta else self._zigzag()
+            fields[field_id] = self._value(type_id)
+            last_id = field_id
+
+
+def read_footer(path: str) -> Tuple[Dict[int, Any], int]:
+    """读取并解码文件尾，同时检查魔数和长度
+
+    返回 (FileMetaData 的原始字段字典, 文件尾起始偏移)。
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < 12:
+            raise ParquetFormatError(f"文件过小 ({size} 字节)")
+        if f.read(4) != MAGIC:
+            raise ParquetFormatError("文件头魔数不是 PAR1")
+        f.seek(size - 8)
+        tail = f.read(8)
+        footer_len = struct.unpack('<I', tail[:4])[0]
+        if tail[4:] != MAGIC:
+            raise ParquetFormatError("文件尾魔数不是 PAR1 (文件可能被截断)")
+        if footer_len + 12 > size:
+            raise ParquetFormatError(f"文件尾长度 {footer_len} 超出文件大小")
+        f.seek(size - 8 - footer_len)
+        footer = f.read(footer_len)
+    return _CompactReader(footer).read_struct(), size - 8 - footer_len
+
+
+@dataclass
+class ParquetFileStats:
+    """单个Parquet文件的文件尾扫描结果"""
+    path: str
+    size: int = 0
+    num_rows: int = 0
+    row_groups: int = 0
+    columns: List[str] = field(default_factory=list)
+    created_by: Optional[str] = None
+    constants: Dict[str, Any] = field(default_factory=dict)     # 统计 min == max 的列
+    distinct: Dict[str, int] = field(default_factory=dict)      # 列的不同值个数
+    error: Optional[str] = None
+    elapsed_s: float = 0.0
+
+    @property
+    def valid(self) -> bool:
+        return self.error is None
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data['valid'] = self.valid
+        return data
+
+
+def _decode_stat(value: Optional[bytes]) -> Any:
+    """统计值按UTF-8字符串返回，不是合法字符串时返回十六进制"""
+    if value is None:
+        return None
+    try:
+        return value.decode('utf-8')
+    except UnicodeDecodeError:
+        return value.hex()
+
+
+def scan_parquet(path: str, constant_columns: Sequence[str] = (),
+                 distinct_columns: Sequence[str] = ()) -> ParquetFileStats:
+    """只读取文件尾统计行数、列名，并检查各列数据块范围
+
+    constant_columns: 从列统计中取出 min == max 的常量值 (如 scenario_id)；
+    distinct_columns: 统计不同值个数，文件尾没有 distinct_count 时用 pyarrow 只读取该列。
+    """
+    start = time.perf_counter()
+    stats = ParquetFileStats(path=str(path))
+    try:
+        stats.size = os.path.getsize(path)
+        meta, footer_start = read_footer(path)     # 各列数据块必须位于文件尾之前
+        schema = meta.get(2, [])
+        row_groups = meta.get(4, [])
+        stats.num_rows = meta.get(3, 0)
+        stats.row_groups = len(row_groups)
+        stats.created_by = _decode_stat(meta.get(6))
+        # schema[0] 为根节点，只取顶层列 (不展开嵌套结构)
+        stats.columns = [_decode_stat(element.get(4)) for element in _top_level(schema)]
+
+        chunk_stats: Dict[str, List[Dict[int, Any]]] = {}
+        group_rows = 0
+        for group in row_groups:
+            group_rows += group.get(3, 0)
+            for chunk in group.get(1, []):
+                column = chunk.get(3)
+                if column is None:
+                    continue
+                name = '.'.join(_decode_stat(p) for p in column.get(3, []))
+                begin = column.get(11) or column.get(9, 0)
+                end = begin + column.get(7, 0)
+                if begin < 4 or end > footer_start:
+                    raise ParquetFormatError(f"列 {name} 的数据块 [{begin}, {end}) 超出文件范围")
+                chunk_stats.setdefault(name, []).append(column.get(12, {}))
+        if group_rows != stats.num_rows:
+            raise ParquetFormatError(f"row group 行数之和 {group_rows} 与文件行数 {stats.num_rows} 不一致")
+
+        for name in constant_columns:
+            values = set()
+            for column_stats in chunk_stats.get(name, []):
+                low, high = column_stats.get(6, column_stats.get(2)), column_stats.get(5, column_stats.get(1))
+                if low is None or low != high or column_stats.get(3):
+                    values = None
+                    break
+                values.add(low)
+            if values is not None and len(values) == 1:
+                stats.constants[name] = _decode_stat(values.pop())
+
+        for name in distinct_columns:
+            counts = [column_stats.get(4) for column_stats in chunk_stats.get(name, [])]
+            if len(counts) == 1 and counts[0] is not None:
+                stats.distinct[name] = counts[0]
+            elif name in stats.columns and HAS_PYARROW:
+                table = pq.read_table(str(path), columns=[name])
+                stats.distinct[name] = len(table.column(name).unique())
+    except (OSError, ParquetFormatError) as e:
+        stats.error = str(e)
+    except Exception as e:  # pyarrow 读取列时的错误
+        stats.error = f"{type(e).__name__}: {e}"
+    stats.elapsed_s = time.perf_counter() - start
+    return stats
+
+
+def _top_level(schema: List[Dict[int, Any]]) -> List[Dict[int, Any]]:
+    """按 num_children 跳过嵌套子节点，返回根节点的直接子节点"""
+    if not schema:
+        return []
+    result = []
+    i = 1
+    for _ in range(schema[0].get(5, 0)):
+        if i >= len(schema):
+            raise ParquetFormatError("schema 节点数与 num_children 不一致")
+        result.append(schema[i])
+        i = _skip_subtree(schema, i)
+    return result
+
+
+def _skip_subtree(schema: List[Dict[int, Any]], i: int) -> int:
+    children = schema[i].get(5, 0)
+    i += 1
+    for _ in range(children):
+        i = _skip_subtree(schema, i)
+    return i
+
+
+def scan_parquet_files(paths: Iterable[str], constant_columns: Sequence[str] = (),
+                       distinct_columns: Sequence[str] = (),
+                       workers: int = DEFAULT_WORKERS) -> List[ParquetFileStats]:
+    """并行扫描多个文件 (每个文件只有两三次小读取，瓶颈在存储延迟)"""
+    paths = [str(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(lambda p: scan_parquet(p, constant_columns, distinct_columns), paths))
+
+
+def main():
+    import sys
+    import glob
+    import argparse
+
+    parser = argparse.ArgumentParser(description='只读取文件尾扫描Parquet文件')
+    parser.add_argument('paths', nargs='+', help='Parquet文件或目录 (递归查找 *.parquet)')
+    parser.add_argument('--constants', type=str, default='', help='取常量值的列，逗号分隔')
+    parser.add_argument('--distinct', type=str, default='', help='统计不同值个数的列，逗号分隔 (可能需要读取该列)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='并行扫描的线程数')
+
+    args = parser.parse_args()
+    files = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '**', '*.parquet'), recursive=True)))
+        else:
+            files.append(path)
+
+    constants = [c for c in args.constants.split(',') if c]
+    distinct = [c for c in args.distinct.split(',') if c]
+    start = time.perf_counter()
+    results = scan_parquet_files(files, constants, distinct, args.workers)
+    for stats in results:
+        status = '✅' if stats.valid else '❌'
+        extra = ''.join(f", {k}={v}" for k, v in {**stats.constants, **stats.distinct}.items())
+        print(f"{status} {os.path.relpath(stats.path)}: {stats.num_rows} 行, {stats.row_groups} 个row group{extra}")
+        if stats.error:
+            print(f"   错误: {stats.error}")
+    failed = sum(1 for s in results if not s.valid)
+    print(f"📊 {len(results) - failed}/{len(results)} 个文件完整, 共 {sum(s.num_rows for s in results)} 行 "
+          f"(耗时 {time.perf_counter() - start:.2f}s)")
+    sys.exit(0 if not failed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+列式性能数据存储
+按模型和运行批次分区，以追加方式写入逐样本的性能记录 (Parquet)
+"""
+
+import re
+import time
+import uuid
+import importlib.util
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# 文件内保存的列 (model / run 由分区目录表示，不重复写入文件)
+PERFORMANCE_COLUMNS = [
+    'sample_token',
+    'timestamp',
+    'inference_time',
+    'gpu_memory_used',
+    'detection_count',
+    'map_element_count',
+    'avg_confidence',
+    'high_conf_ratio',
+    'has_error',
+]
+
+# 分区列
+PARTITION_COLUMNS = ['model', 'run']
+
+
+def _require_pyarrow():
+    """按需导入pyarrow，未安装时给出明确提示"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError as e:
+        raise ImportError(
+            "PerformanceStore 需要 pyarrow: pip install pyarrow"
+        ) from e
+
+
+def pyarrow_available() -> bool:
+    """pyarrow 是否已安装 (只查找模块，不导入)"""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def partition_value(value: str) -> str:
+    """分区目录名中的值只保留字母、数字和 ._- ，其余字符 (含路径分隔符) 替换为下划线"""
+    value = re.sub(r'[^A-Za-z0-9._-]', '_', str(value))
+    return '_' if value in ('', '.', '..') else value
+
+
+def new_run_id() -> str:
+    """生成运行批次ID (时间戳 + 短随机后缀，保证可排序且不冲突)"""
+    return time.strftime('%Y%m%d-%H%M%S') + '-' + uuid.uuid4().hex[:6]
+
+
+class PerformanceStore:
+    """追加式Parquet性能存储
+
+    目录结构 (Hive分区):
+        <root>/model=<模型名>/run=<运行ID>/part-<序号>-<随机>.parquet
+
+    每次 flush 只写新文件，从不改写已有文件，历史运行可直接按列查询。
+    未安装 pyarrow 时构造即抛出 ImportError，而不是在之后自动落盘时失败。
+    """
+
+    def __init__(self, root: str, flush_rows: int = 1000):
+        if not pyarrow_available():
+            _require_pyarrow()
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.flush_rows = flush_rows
+        self._buffers: Dict[tuple, List[Dict[str, Any]]] = {}
+        self._buffered = 0
+        self._part_seq = 0
+
+    def append(self, model: str, run: str, row: Dict[str, Any]) -> None:
+        """缓冲一条逐样本记录，达到阈值时自动落盘"""
+        record = {col: row.get(col) for col in PERFORMANCE_COLUMNS}
+        self._buffers.setdefault((partition_value(model), partition_value(run)), []).append(record)
+        self._buffered += 1
+        if self._buffered >= self.flush_rows:
+            self.flush()
+
+    def flush(self) -> List[Path]:
+        """将缓冲记录写为新的Parquet分片"""
+        if not self._buffered:
+            return []
+
+        pa = _require_pyarrow()
+        written = []
+        for (model, run), records in self._buffers.items():
+            if not records:
+                continue
+            partition_dir = self.root / f"model={model}" / f"run={run}"
+            partition_dir.mkdir(parents=True, exist_ok=True)
+
+            table = pa.Table.from_pydict(
+                {col: [r[col] for r in records] for col in PERFORMANCE_COLUMNS},
+                schema=self._schema(pa)
+            )
+            part_path = partition_dir / f"part-{self._part_seq:05d}-{uuid.uuid4().hex[:8]}.parquet"
+            pa.parquet.write_table(table, part_path)
+            self._part_seq += 1
+            written.append(part_path)
+
+        self._buffers = {}
+        self._buffered = 0
+        return written
+
+    @staticmethod
+    def _schema(pa):
+        return pa.schema([
+            ('sample_token', pa.string()),
+            ('timestamp', pa.string()),
+            ('inference_time', pa.float64()),
+            ('gpu_memory_used', pa.float64()),
+            ('detection_count', pa.int64()),
+            ('map_element_count', pa.int64()),
+            ('avg_confidence', pa.float64()),
+            ('high_conf_ratio', pa.float64()),
+            ('has_error', pa.bool_()),
+        ])
+
+    def list_models(self) -> List[str]:
+        """列出已存储的模型"""
+        return sorted(p.name.split('=', 1)[1] for p in self.root.glob('model=*') if p.is_dir())
+
+    def list_runs(self, model: Optional[str] = None) -> List[str]:
+        """列出已存储的运行批次"""
+        pattern = f"model={partition_value(model)}/run=*" if model else "model=*/run=*"
+        return sorted({p.name.split('=', 1)[1] for p in self.root.glob(pattern) if p.is_dir()})
+
+    def scan(self, columns: List[str], models: Optional[List[str]] = None,
+             runs: Optional[List[str]] = None):
+        """只读取所需列，并按模型/运行分区裁剪
+
+        Returns:
+            pyarrow.Table (无数据时为空表)
+        """
+        pa = _require_pyarrow()
+        import pyarrow.dataset as ds
+
+        if not any(self.root.glob('model=*/run=*/*.parquet')):
+            return pa.table({col: [] for col in columns})
+
+        dataset = ds.dataset(
+            str(self.root),
+            format='parquet',
+            partitioning=ds.partitioning(
+                pa.schema([('model', pa.string()), ('run', pa.string())]),
+                flavor='hive'
+            )
+        )
+
+        expr = None
+        if models:
+            expr = ds.field('model').isin([partition_value(m) for m in models])
+        if runs:
+            run_expr = ds.field('run').isin([partition_value(r) for r in runs])
+            expr = run_expr if expr is None else (expr & run_expr)
+
+        return dataset.to_table(columns=columns, filter=expr)
+
+    def summarize(self, models: Optional[List[str]] = None,
+                  runs: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """按模型聚合逐样本记录，用于生成比较报告"""
+        table = self.scan(
+            ['model', 'inference_time', 'gpu_memory_used', 'detection_count',
+             'map_element_count', 'avg_confidence', 'high_conf_ratio', 'has_error'],
+            models=models, runs=runs
+        )
+        if table.num_rows == 0:
+            return []
+
+        import pyarrow.compute as pc
+        table = table.append_column('error_count', pc.cast(table['has_error'], 'int64'))
+        grouped = table.group_by('model').aggregate([
+            ('inference_time', 'count'),
+            ('inference_time', 'mean'),
+            ('gpu_memory_used', 'max'),
+            ('detection_count', 'mean'),
+            ('map_element_count', 'mean'),
+            ('avg_confidence', 'mean'),
+            ('high_conf_ratio', 'mean'),
+            ('error_count', 'sum'),
+        ])
+
+        summary = []
+        for row in grouped.to_pylist():
+            summary.append({
+                'Model': row['model'],
+                'Sample_Count': row['inference_time_count'],
+                'Inference_Time_s': row['inference_time_mean'],
+                'GPU_Memory_MB': row['gpu_memory_used_max'],
+                'Detection_Count': row['detection_count_mean'],
+                'Map_Element_Count': row['map_element_count_mean'],
+                'Avg_Confidence': row['avg_confidence_mean'],
+                'High_Conf_Ratio': row['high_conf_ratio_mean'],
+                'Error_Count': row['error_count_sum'],
+            })
+        summary.sort(key=lambda r: r['Model'])
+        return summary
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+开环规划评测工具
+计算VAD规划轨迹在 1s/2s/3s 的L2误差和碰撞率，
+碰撞通过将真值目标框栅格化为BEV占用栅格进行判断
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from model_output_standard import StandardOutput
+
+
+def stack_planning_trajectories(outputs: List[StandardOutput],
+                                num_steps: int = 6) -> Tuple[np.ndarray, np.ndarray]:
+    """将各样本的规划轨迹堆叠为数组
+
+    Returns:
+        waypoints: (N, num_steps, 2) 规划路径点 [x, y]，缺失处为NaN
+        valid: (N, num_steps) 有效掩码
+    """
+    waypoints = np.full((len(outputs), num_steps, 2), np.nan)
+    for i, output in enumerate(outputs):
+        plan = output.planning_trajectory
+        if plan is None or not plan.waypoints:
+            continue
+        points = np.asarray([wp[:2] for wp in plan.waypoints[:num_steps]], dtype=np.float64)
+        waypoints[i, :len(points)] = points
+    valid = ~np.isnan(waypoints).any(axis=-1)
+    return waypoints, valid
+
+
+class PlanningEvaluator:
+    """VAD风格开环规划评测器
+
+    所有样本的轨迹以 (N, T, 2) 数组一次性计算；
+    碰撞检测按样本分块，将目标框批量栅格化为 (块大小, T, H, W) 占用栅格。
+    """
+
+    def __init__(self, dt: float = 0.5, horizons: Tuple[float, ...] = (1.0, 2.0, 3.0),
+                 bev_range: float = 51.2, resolution: float = 0.5,
+                 ego_size: Tuple[float, float] = (4.084, 1.85), chunk_size: int = 128):
+        self.dt = dt
+        self.horizons = horizons
+        self.bev_range = bev_range
+        self.resolution = resolution
+        self.grid_size = int(round(2 * bev_range / resolution))
+        self.ego_length, self.ego_width = ego_size
+        self.chunk_size = chunk_size
+
+    def evaluate(self, pred: np.ndarray, gt: np.ndarray, gt_valid: Optional[np.ndarray] = None,
+                 boxes: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, Any]:
+        """计算L2误差和碰撞率
+
+        Args:
+            pred: (N, T, 2) 规划路径点 (当前自车坐标系，累计位移)
+            gt: (N, T, 2) 真值自车未来轨迹
+            gt_valid: (N, T) 真值有效掩码
+            boxes: 其他目标的未来真值框 (列式):
+                {'sample': (K,), 'step': (K,), 'box': (K, 5) [x, y, w, l, yaw]}
+        """
+        pred = np.asarray(pred, dtype=np.float64)
+        gt = np.asarray(gt, dtype=np.float64)
+        valid = ~np.isnan(gt).any(axis=-1) & ~np.isnan(pred).any(axis=-1)
+        if gt_valid is not None:
+            valid &= np.asarray(gt_valid, dtype=bool)
+
+        l2 = np.linalg.norm(pred - gt, axis=-1)   # (N, T)
+        collisions = self.compute_collisions(pred, boxes) if boxes is not None else None
+
+        results = {'num_samples': int(pred.shape[0])}
+        for horizon in self.horizons:
+            steps = int(round(horizon / self.dt))
+            key = f"{horizon:g}s"
+            mask = valid[:, :steps]
+            # 与VAD/ST-P3一致：对该时长内各时间步的误差取平均
+            results[f"l2_{key}"] = self._masked_mean(l2[:, :steps], mask)
+            if collisions is not None:
+                results[f"collision_{key}"] = self._masked_mean(
+                    collisions[:, :steps].astype(np.float64), mask
+                )
+        return results
+
+    @staticmethod
+    def _masked_mean(values: np.ndarray, mask: np.ndarray) -> float:
+        count = mask.sum()
+        return float(np.where(mask, values, 0.0).sum() / count) if count else float('nan')
+
+    def compute_collisions(self, pred: np.ndarray, boxes: Dict[str, np.ndarray]) -> np.ndarray:
+        """逐时间步判断自车框是否与真值占用栅格重叠
+
+        Returns:
+            (N, T) 布尔数组
+        """
+        n, t = pred.shape[:2]
+        box_sample = np.asarray(boxes['sample'], dtype=np.int64)
+        box_step = np.asarray(boxes['step'], dtype=np.int64)
+        box_params = np.asarray(boxes['box'], dtype=np.float64).reshape(-1, 5)
+
+        collisions = np.zeros((n, t), dtype=bool)
+
+        for start in range(0, n, self.chunk_size):
+            stop = min(start + self.chunk_size, n)
+            sel = (box_sample >= start) & (box_sample < stop) & (box_step < t)
+            occupancy = self.rasterize_boxes(
+                box_sample[sel] - start, box_step[sel], box_params[sel], stop - start, t
+            )
+            cells = self._ego_footprint_cells(pred[start:stop])   # (块大小, T, P, 2)
+            inside = ((cells >= 0) & (cells < self.grid_size)).all(axis=-1)
+            rows = np.clip(cells[..., 0], 0, self.grid_size - 1)
+            cols = np.clip(cells[..., 1], 0, self.grid_size - 1)
+            chunk_idx = np.arange(stop - start)[:, None, None]
+            step_idx = np.arange(t)[None, :, None]
+            hit = occupancy[chunk_idx, step_idx, rows, cols] & inside
+            collisions[start:stop] = hit.any(axis=-1)
+
+        collisions &= ~np.isnan(pred).any(axis=-1)
+        return collisions
+
+    def rasterize_boxes(self, sample: np.ndarray, step: np.ndarray, box: np.ndarray,
+                        num_samples: int, num_steps: int) -> np.ndarray:
+        """批量将旋转框栅格化为 (num_samples, num_steps, H, W) 占用栅格"""
+        occupancy = np.zeros((num_samples, num_steps, self.grid_size, self.grid_size), dtype=bool)
+        if len(box) == 0:
+            return occupancy
+
+        # 每个框在其外接圆范围内的候选栅格窗口
+        half_diag = 0.5 * np.hypot(box[:, 2], box[:, 3])
+        radius = int(np.ceil(half_diag.max() / self.resolution)) + 1
+        offsets = np.arange(-radius, radius + 1)
+        di, dj = np.meshgrid(offsets, offsets, indexing='ij')
+        di, dj = di.ravel(), dj.ravel()
+
+        center_i = np.floor((box[:, 0] + self.bev_range) / self.resolution).astype(np.int64)
+        center_j = np.floor((box[:, 1] + self.bev_range) / self.resolution).astype(np.int64)
+        cell_i = center_i[:, None] + di[None, :]                       # (K, W)
+        cell_j = center_j[:, None] + dj[None, :]
+        cell_x = (cell_i + 0.5) * self.resolution - self.bev_range
+        cell_y = (cell_j + 0.5) * self.resolution - self.bev_range
+
+        # 转到框局部坐标系判断是否在框内
+        dx = cell_x - box[:, 0:1]
+        dy = cell_y - box[:, 1:2]
+        cos_yaw, sin_yaw = np.cos(box[:, 4:5]), np.sin(box[:, 4:5])
+        along = dx * cos_yaw + dy * sin_yaw
+        across = -dx * sin_yaw + dy * cos_yaw
+        inside = (np.abs(along) <= box[:, 3:4] / 2) & (np.abs(across) <= box[:, 2:3] / 2)
+        inside &= (cell_i >= 0) & (cell_i < self.grid_size) & (cell_j >= 0) & (cell_j < self.grid_size)
+
+        k_idx, w_idx = np.nonzero(inside)
+        occupancy[sample[k_idx], step[k_idx], cell_i[k_idx, w_idx], cell_j[k_idx, w_idx]] = True
+        return occupancy
+
+    def _ego_footprint_cells(self, pred: np.ndarray) -> np.ndarray:
+        """自车框在各规划路径点处覆盖的栅格索引 (N, T, P, 2)"""
+        # 朝向取相邻路径点的位移方向
+        origin = np.zeros_like(pred[:, :1])
+        delta = np.diff(np.concatenate([origin, np.nan_to_num(pred)], axis=1), axis=1)
+        yaw = np.arctan2(delta[..., 1], delta[..., 0])
+        still = np.hypot(delta[..., 0], delta[..., 1]) < 1e-3
+        yaw = np.where(still, 0.0, yaw)
+
+        # 自车框内均匀采样点 (间距为半个栅格)
+        spacing = self.resolution / 2
+        along = np.arange(-self.ego_length / 2, self.ego_length / 2 + 1e-6, spacing)
+        across = np.arange(-self.ego_width / 2, self.ego_width / 2 + 1e-6, spacing)
+        pa, pc = np.meshgrid(along, across, indexing='ij')
+        pa, pc = pa.ravel(), pc.ravel()
+
+        cos_yaw, sin_yaw = np.cos(yaw)[..., None], np.sin(yaw)[..., None]
+        x = np.nan_to_num(pred[..., 0:1]) + pa * cos_yaw - pc * sin_yaw
+        y = np.nan_to_num(pred[..., 1:2]) + pa * sin_yaw + pc * cos_yaw
+        cells = np.stack([
+            np.floor((x + self.bev_range) / self.resolution),
+            np.floor((y + self.bev_range) / self.resolution)
+        ], axis=-1)
+        return cells.astype(np.int64)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='开环规划评测 (L2 / 碰撞率)')
+    parser.add_argument('--data', type=str, required=True,
+                        help='评测数据 (.npz，包含 pred, gt, 可选 gt_valid, box_sample, box_step, box)')
+    parser.add_argument('--output', type=str, help='评测结果输出文件')
+
+    args = parser.parse_args()
+
+    data = np.load(args.data)
+    boxes = None
+    if 'box' in data:
+        boxes = {'sample': data['box_sample'], 'step': data['box_step'], 'box': data['box']}
+
+    evaluator = PlanningEvaluator()
+    result = evaluator.evaluate(
+        data['pred'], data['gt'],
+        gt_valid=data['gt_valid'] if 'gt_valid' in data else None,
+        boxes=boxes
+    )
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
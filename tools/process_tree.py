@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+进程树资源统计
+统计目标进程及其全部子孙进程 (如 demo.py 及其 dataloader worker) 的内存和CPU，
+PSS按共享页面分摊，避免fork出的worker重复计算共享内存；并按推理任务归集资源使用。
+"""
+
+import os
+import time
+import threading
+import subprocess
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import psutil
+
+
+def reaped_children_cpu_seconds() -> float:
+    """本进程已回收的子孙进程累计CPU时间 (秒)
+
+    子进程被 wait 回收时，内核把它及其已回收后代的CPU时间计入父进程的 children 时间，
+    因此短命worker在采样间隙中消耗的CPU时间也不会丢失。
+    """
+    try:
+        times = psutil.Process().cpu_times()
+    except psutil.Error:
+        return 0.0
+    return getattr(times, 'children_user', 0.0) + getattr(times, 'children_system', 0.0)
+
+
+def read_pss_uss(pid: int) -> Optional[Tuple[int, int]]:
+    """读取进程的 PSS 和 USS (字节)
+
+    优先读取 /proc/<pid>/smaps_rollup (内核已汇总，开销远小于逐映射的smaps)，
+    否则回退到 psutil.memory_full_info；无权限或平台不支持时返回 None。
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            pss = private = 0
+            for line in f:
+                if line.startswith("Pss:"):
+                    pss = int(line.split()[1]) * 1024
+                elif line.startswith(("Private_Clean:", "Private_Dirty:")):
+                    private += int(line.split()[1]) * 1024
+            return pss, private
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        info = psutil.Process(pid).memory_full_info()
+        return getattr(info, "pss", info.uss), info.uss
+    except (psutil.Error, AttributeError):
+        return None
+
+
+@dataclass
+class ProcessTreeSample:
+    """进程树的一次采样 (内存单位MB)"""
+    timestamp: float
+    num_processes: int
+    rss_mb: float
+    pss_mb: Optional[float]
+    uss_mb: Optional[float]
+    cpu_percent: float
+    cpu_seconds: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class ProcessTree:
+    """目标进程及其子孙进程的资源统计
+
+    psutil.Process 对象按PID缓存，CPU时间按PID记录最后一次读数，
+    已退出的子进程保留其最后读数。采样只能看到存活的进程，worker 在最后一次采样之后
+    (或两次采样之间整个生命周期内) 消耗的CPU时间不在其中；任务结束时的准确总量
+    由 JobTracker.run() 在回收进程树后补齐。
+    PSS读取开销高于RSS，按 pss_interval 节流，其间复用上次的值。
+    """
+
+    def __init__(self, pid: Optional[int] = None, include_pss: bool = True,
+                 pss_interval: float = 0.5):
+        self.pid = pid or os.getpid()
+        self.include_pss = include_pss
+        self.pss_interval = pss_interval
+        self._root = psutil.Process(self.pid)
+        self._procs: Dict[int, psutil.Process] = {self.pid: self._root}
+        self._cpu_seconds: Dict[int, float] = {}
+        self._last_pss: Dict[int, Tuple[int, int]] = {}
+        self._last_pss_at = 0.0
+        self._last_cpu_total: Optional[float] = None
+        self._last_wall: Optional[float] = None
+
+    def pids(self) -> List[int]:
+        """当前存活的目标进程及子孙进程PID"""
+        try:
+            children = self._root.children(recursive=True)
+        except psutil.Error:
+            return []
+        # 复用缓存对象 (psutil按创建时间区分进程，PID复用时不会混淆)，并丢弃已退出的
+        procs = {self.pid: self._root}
+        for child in children:
+            procs[child.pid] = self._procs.get(child.pid, child)
+        self._procs = procs
+        return list(procs)
+
+    def sample(self) -> ProcessTreeSample:
+        now = time.monotonic()
+        pids = self.pids()
+        refresh_pss = self.include_pss and now - self._last_pss_at >= self.pss_interval
+
+        rss = 0
+        pss = uss = 0
+        pss_known = self.include_pss
+        alive = 0
+        for pid in pids:
+            proc = self._procs[pid]
+            try:
+                with proc.oneshot():
+                    rss += proc.memory_info().rss
+                    times = proc.cpu_times()
+                    self._cpu_seconds[pid] = times.user + times.system
+            except psutil.Error:
+                continue
+            alive += 1
+            if self.include_pss:
+                if refresh_pss or pid not in self._last_pss:
+                    value = read_pss_uss(pid)
+                    if value is None:
+                        pss_known = False
+                        continue
+                    self._last_pss[pid] = value
+                pss += self._last_pss[pid][0]
+                uss += self._last_pss[pid][1]
+        if refresh_pss:
+            self._last_pss_at = now
+            self._last_pss = {pid: v for pid, v in self._last_pss.items() if pid in pids}
+
+        cpu_total = sum(self._cpu_seconds.values())
+        cpu_percent = 0.0
+        if self._last_cpu_total is not None and now > self._last_wall:
+            cpu_percent = (cpu_total - self._last_cpu_total) / (now - self._last_wall) * 100
+        self._last_cpu_total, self._last_wall = cpu_total, now
+
+        mb = 1024 ** 2
+        return ProcessTreeSample(
+            timestamp=time.time(),
+            num_processes=alive,
+            rss_mb=rss / mb,
+            pss_mb=pss / mb if pss_known else None,
+            uss_mb=uss / mb if pss_known else None,
+            cpu_percent=cpu_percent,
+            cpu_seconds=cpu_total,
+        )
+
+    def kill(self, timeout: float = 5.0):
+        """终止整个进程树 (子孙进程优先)"""
+        try:
+            children = self._root.children(recursive=True)
+        except psutil.Error:
+            children = []
+        for proc in reversed(children):
+            try:
+                proc.kill()
+            except psutil.Error:
+                pass
+        try:
+            self._root.kill()
+        except psutil.Error:
+            pass
+        psutil.wait_procs(children + [self._root], timeout=timeout)
+
+
+@dataclass
+class JobUsage:
+    """单个推理任务的资源使用汇总"""
+    job_id: str
+    pid: Optional[int] = None
+    duration_s: float = 0.0
+    samples: int = 0
+    peak_processes: int = 0
+    peak_rss_mb: float = 0.0
+    peak_pss_mb: Optional[float] = None
+    peak_uss_mb: Optional[float] = None
+    peak_gpu_mb: Optional[float] = None
+    cpu_seconds: float = 0.0
+    avg_cpu_percent: float = 0.0
+    peak_cpu_percent: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class JobTracker:
+    """按推理任务统计进程树资源
+
+    后台线程按 interval 采样任务进程树并累计峰值；
+    run() 与 subprocess.run 的检查/超时语义一致，超时时终止整个进程树。
+    任务失败或超时后 usage() 仍可获取已统计的资源使用。
+
+    gpu=True 时同时统计显存峰值: 优先累加NVML报告的进程树各进程显存；
+    容器内PID命名空间与驱动不一致而匹配不到进程时，改用设备已用显存相对任务启动时的增量。
+    """
+
+    def __init__(self, job_id: str, interval: float = 0.2, include_pss: bool = True,
+                 gpu: bool = False):
+        self.job_id = job_id
+        self.interval = interval
+        self.include_pss = include_pss
+        self.gpu = gpu
+        self.tree: Optional[ProcessTree] = None
+        self._telemetry = None
+        self._gpu_baseline_mb = 0.0
+        self._usage = JobUsage(job_id=job_id)
+        self._start = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def attach(self, pid: int) -> 'JobTracker':
+        """开始跟踪已有进程"""
+        self.tree = ProcessTree(pid, include_pss=self.include_pss)
+        self._usage.pid = pid
+        self._start = time.monotonic()
+        self._stop.clear()
+        if self.gpu:
+            from gpu_telemetry import get_telemetry
+            self._telemetry = get_telemetry()
+            snapshot = self._telemetry.snapshot(include_processes=False, max_age=0)
+            self._gpu_baseline_mb = sum(d.memory_used_mb for d in snapshot.devices)
+        self._sample()
+        self._thread = threading.Thread(target=self._run, name=f"job-tracker-{pid}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, final_cpu_seconds: Optional[float] = None) -> JobUsage:
+        """停止采样；final_cpu_seconds 为进程树回收后得到的CPU总时间 (比采样累计更完整)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if final_cpu_seconds is not None:
+            self._usage.cpu_seconds = max(self._usage.cpu_seconds, final_cpu_seconds)
+        self._usage.duration_s = time.monotonic() - self._start
+        if self._usage.duration_s > 0:
+            self._usage.avg_cpu_percent = self._usage.cpu_seconds / self._usage.duration_s * 100
+        return self._usage
+
+    def usage(self) -> JobUsage:
+        return self._usage
+
+    def run(self, command: List[str], timeout: Optional[float] = None, check: bool = False,
+            **popen_kwargs) -> subprocess.CompletedProcess:
+        """启动命令并跟踪其进程树直到退出
+
+        CPU时间取本进程回收子进程前后的 children 时间之差，包含采样间隙中退出的worker；
+        要求同一进程内同时只运行一个任务 (包装脚本即是如此)。
+        """
+        reaped_before = reaped_children_cpu_seconds()
+        proc = subprocess.Popen(command, **popen_kwargs)
+        self.attach(proc.pid)
+        try:
+            returncode = proc.wait(timeout=timeout)
+        except BaseException:
+            # 超时或被中断: 连同worker一起终止，不留孤儿进程
+            self.tree.kill()
+            proc.wait()
+            raise
+        finally:
+            self.stop(reaped_children_cpu_seconds() - reaped_before)
+        if check and returncode != 0:
+            raise subprocess.CalledProcessError(returncode, command)
+        return subprocess.CompletedProcess(command, returncode)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        try:
+            sample = self.tree.sample()
+        except psutil.Error:
+            return
+        if sample.num_processes == 0:
+            return
+        usage = self._usage
+        usage.samples += 1
+        usage.peak_processes = max(usage.peak_processes, sample.num_processes)
+        usage.peak_rss_mb = max(usage.peak_rss_mb, sample.rss_mb)
+        if sample.pss_mb is not None:
+            usage.peak_pss_mb = max(usage.peak_pss_mb or 0.0, sample.pss_mb)
+            usage.peak_uss_mb = max(usage.peak_uss_mb or 0.0, sample.uss_mb)
+        usage.cpu_seconds = max(usage.cpu_seconds, sample.cpu_seconds)
+        usage.peak_cpu_percent = max(usage.peak_cpu_percent, sample.cpu_percent)
+        if self._telemetry is not None:
+            gpu_mb = self._gpu_used_mb()
+            if gpu_mb is not None:
+                usage.peak_gpu_mb = max(usage.peak_gpu_mb or 0.0, gpu_mb)
+
+    def _gpu_used_mb(self) -> Optional[float]:
+        snapshot = self._telemetry.snapshot(include_processes=True, max_age=0)
+        if not snapshot.devices:
+            return None
+        pids = set(self.tree.pids())
+        matched = [p.used_mb for d in snapshot.devices for p in d.processes if p.pid in pids]
+        if matched:
+            return sum(matched)
+        used = sum(d.memory_used_mb for d in snapshot.devices)
+        return max(0.0, used - self._gpu_baseline_mb)
+
+
+def main():
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description='进程树内存/CPU统计')
+    parser.add_argument('--pid', type=int, required=True, help='目标进程PID (含全部子孙进程)')
+    parser.add_argument('--interval', type=float, default=1.0, help='采样间隔秒数')
+    parser.add_argument('--count', type=int, default=10, help='采样次数')
+    parser.add_argument('--no-pss', action='store_true', help='不读取PSS/USS')
+
+    args = parser.parse_args()
+
+    tree = ProcessTree(args.pid, include_pss=not args.no_pss)
+    for _ in range(args.count):
+        print(json.dumps(tree.sample().to_dict()))
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+热就绪探针
+只加载一次模型检查点并常驻，用模型真实输入尺寸的合成数据执行前向推理，
+报告热推理延迟。后续探测只做一次前向，开销很小。
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import importlib
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+# 模型配置 (与 run_comparison.py 使用同一份)
+MODELS_CONFIG_PATH = Path(__file__).resolve().parent.parent / "config" / "models_config.json"
+CHECKPOINT_DIR = os.environ.get("MODEL_CHECKPOINT_DIR", "/app/checkpoints")
+
+# 各模型测试流水线的默认输入 (相机数, 高, 宽)，配置中有 final_dim 时以配置为准
+MODEL_INPUT_SPECS = {
+    "MapTR": (6, 480, 800),         # 1600x900 缩放0.5，pad到32倍数
+    "PETR": (6, 928, 1600),         # 原始分辨率，pad到32倍数
+    "StreamPETR": (6, 320, 800),    # ida_aug_conf.final_dim
+    "TopoMLP": (7, 800, 1024),      # OpenLane-V2 七路相机
+    "VAD": (6, 384, 640),           # 1600x900 缩放0.4，pad到32倍数
+}
+
+# 允许退化为 backbone+neck 前向的时序模型: 头部依赖跨帧记忆/前一帧BEV，单帧合成输入无法完整前向。
+# 其余模型完整前向失败即视为未就绪。
+BACKBONE_FALLBACK_MODELS = {
+    "StreamPETR": "时序记忆队列需要连续帧",
+    "VAD": "时序BEV需要前一帧特征和真实can_bus",
+}
+
+
+def load_model_entry(model_name: str) -> Dict[str, Any]:
+    """从 models_config.json 读取模型条目 (不存在时返回空字典)"""
+    try:
+        with open(MODELS_CONFIG_PATH) as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    for entry in entries:
+        if entry.get("name", "").upper() == model_name.upper():
+            return entry
+    return {}
+
+
+class ReadinessProbe:
+    """热就绪探针
+
+    首次 probe() 时加载模型 (线程安全，只加载一次)，之后每次探测执行一次合成前向。
+    加载失败的结果在 min_interval 内复用 (force 也不重试)，避免反复加载损坏的检查点。
+    服务模式下探测由 HealthSampler 的后台线程执行，请求线程只读取 status()。
+    完整前向失败时报告未就绪 (附 full_forward_error)；只有 BACKBONE_FALLBACK_MODELS 中的时序模型
+    (或显式传入 allow_backbone=True) 才退化为 backbone+neck 前向，并在结果中以 forward_mode 标明。
+    """
+
+    def __init__(self, model_name: str, config_path: Optional[str] = None,
+                 checkpoint: Optional[str] = None, device: str = "cuda:0",
+                 input_shape: Optional[Tuple[int, int, int]] = None,
+                 min_interval: float = 10.0, allow_backbone: Optional[bool] = None):
+        entry = load_model_entry(model_name)
+        self.model_name = entry.get("name", model_name)
+        self.config_path = config_path or os.environ.get("MODEL_CONFIG") or entry.get("config_path")
+        self.checkpoint = checkpoint or os.environ.get("MODEL_CHECKPOINT") or (
+            os.path.join(CHECKPOINT_DIR, entry["weight_file"]) if entry.get("weight_file") else None
+        )
+        self.device = device
+        self.input_shape = input_shape
+        self.min_interval = min_interval
+        if allow_backbone is None:
+            allow_backbone = self.model_name in BACKBONE_FALLBACK_MODELS
+        self.allow_backbone = allow_backbone
+
+        self.model = None
+        self.load_time: Optional[float] = None
+        self.forward_mode = "full"
+        self.full_forward_error: Optional[str] = None
+        self._inputs = None
+        self._lock = threading.Lock()
+        self._last: Optional[Dict[str, Any]] = None
+        self._last_at = 0.0
+        self.state = "not_loaded"
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        """最近一次探测结果 (不触发探测)"""
+        return self._last
+
+    def status(self) -> Dict[str, Any]:
+        """当前就绪状态 (不触发探测，不等待探测锁)
+
+        首次加载完成前报告 state=warming，供 /ready 在请求线程中直接返回。
+        """
+        last = self._last
+        if self.model is None and self.state in ("not_loaded", "loading"):
+            return dict(last or {"model": self.model_name}, ready=False, state="warming")
+        return last
+
+    def probe(self, force: bool = False) -> Dict[str, Any]:
+        """执行一次热就绪探测
+
+        min_interval 内的重复探测直接返回上次结果；并发探测串行执行，不会重复加载。
+        加载失败时即使 force 也在 min_interval 内返回上次失败结果。
+        """
+        with self._lock:
+            if self._last is not None and time.monotonic() - self._last_at < self.min_interval:
+                load_failed = self.model is None and self.state == "failed"
+                if not force or load_failed:
+                    return self._last
+
+            result = {
+                "model": self.model_name,
+                "timestamp": time.time(),
+                "ready": False,
+                "config": self.config_path,
+                "checkpoint": self.checkpoint,
+            }
+            try:
+                if self.model is None:
+                    self.state = "loading"
+                    self._load()
+                latency = self._forward()
+                result.update({
+                    "ready": True,
+                    "load_time_s": self.load_time,
+                    "warm_latency_ms": latency * 1000,
+                    "input_shape": list(self._inputs[0].shape),
+                    "forward_mode": self.forward_mode,
+                })
+                if self.forward_mode == "backbone":
+                    result["backbone_fallback"] = BACKBONE_FALLBACK_MODELS.get(self.model_name, "allow_backbone")
+                self.state = "ready"
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+                self.state = "failed"
+            if self.full_forward_error:
+                result["full_forward_error"] = self.full_forward_error
+            result["state"] = self.state
+
+            self._last = result
+            self._last_at = time.monotonic()
+            return result
+
+    def _load(self):
+        """构建模型并加载检查点 (仅一次)"""
+        if not self.config_path or not os.path.exists(self.config_path):
+            raise FileNotFoundError(f"模型配置不存在: {self.config_path}")
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            raise FileNotFoundError(f"模型检查点不存在: {self.checkpoint}")
+
+        import torch
+        from mmcv import Config
+        from mmcv.runner import load_checkpoint
+
+        start = time.perf_counter()
+        cfg = Config.fromfile(self.config_path)
+        self._import_plugin(cfg)
+
+        try:
+            from mmdet3d.models import build_model
+        except ImportError:
+            from mmdet.models import build_detector as build_model
+        cfg.model.pretrained = None
+        model = build_model(cfg.model, test_cfg=cfg.get("test_cfg"))
+        load_checkpoint(model, self.checkpoint, map_location="cpu")
+        model = model.to(self.device).eval()
+
+        self.model = model
+        self._inputs = self._synthetic_inputs(cfg, torch)
+        if self.device.startswith("cuda"):
+            torch.cuda.synchronize(self.device)
+        self.load_time = time.perf_counter() - start
+
+    def _import_plugin(self, cfg):
+        """导入模型仓库的 mmdet3d 插件 (与各仓库 tools/test.py 的做法一致)"""
+        # 配置位于 <仓库>/projects/configs/... 或 <仓库>/configs/...，向上找到仓库根目录
+        model_root = str(Path(self.config_path).resolve().parent)
+        for parent in Path(self.config_path).resolve().parents:
+            if (parent / "tools").is_dir():
+                model_root = str(parent)
+                break
+        if model_root not in sys.path:
+            sys.path.insert(0, model_root)
+
+        if cfg.get("plugin", False) and cfg.get("plugin_dir"):
+            module_dir = os.path.dirname(cfg.plugin_dir.rstrip("/") + "/")
+            importlib.import_module(".".join(module_dir.strip("/").split("/")))
+
+    def _input_shape(self, cfg) -> Tuple[int, int, int]:
+        if self.input_shape:
+            return tuple(self.input_shape)
+        num_cams, height, width = MODEL_INPUT_SPECS.get(self.model_name, (6, 512, 1408))
+        final_dim = (cfg.get("ida_aug_conf") or {}).get("final_dim")
+        if final_dim:
+            height, width = final_dim
+        return num_cams, int(height), int(width)
+
+    def _synthetic_inputs(self, cfg, torch):
+        """按真实输入尺寸构造合成图像和相机元信息"""
+        import numpy as np
+
+        num_cams, height, width = self._input_shape(cfg)
+        img = torch.randn(1, num_cams, 3, height, width, device=self.device)
+
+        # 相机绕自车均匀分布，内参取图像中心为主点
+        intrinsic = np.eye(4)
+        intrinsic[0, 0] = intrinsic[1, 1] = width / 2
+        intrinsic[0, 2], intrinsic[1, 2] = width / 2, height / 2
+        lidar2cam, lidar2img = [], []
+        for i in range(num_cams):
+            yaw = 2 * np.pi * i / num_cams
+            # 激光雷达系 (x前, y左, z上) → 相机系 (x右, y下, z前)
+            rotation = np.array([
+                [np.sin(yaw), -np.cos(yaw), 0],
+                [0, 0, -1],
+                [np.cos(yaw), np.sin(yaw), 0],
+            ])
+            extrinsic = np.eye(4)
+            extrinsic[:3, :3] = rotation
+            lidar2cam.append(extrinsic)
+            lidar2img.append(intrinsic @ extrinsic)
+
+        meta = {
+            "img_shape": [(height, width, 3)] * num_cams,
+            "pad_shape": [(height, width, 3)] * num_cams,
+            "ori_shape": [(height, width, 3)] * num_cams,
+            "scale_factor": 1.0,
+            "lidar2img": lidar2img,
+            "lidar2cam": lidar2cam,
+            "cam_intrinsic": [intrinsic] * num_cams,
+            "can_bus": np.zeros(18),
+            "scene_token": "readiness-probe",
+            "sample_idx": "readiness-probe",
+            "prev_idx": "",
+            "next_idx": "",
+            "timestamp": 0.0,
+        }
+        try:
+            from mmdet3d.core.bbox import LiDARInstance3DBoxes
+            meta["box_type_3d"] = LiDARInstance3DBoxes
+        except ImportError:
+            pass
+        return img, meta
+
+    def _forward(self) -> float:
+        """执行一次合成前向，返回耗时 (秒)"""
+        import torch
+
+        img, meta = self._inputs
+        start = time.perf_counter()
+        with torch.no_grad():
+            if self.forward_mode == "full":
+                try:
+                    self.model(return_loss=False, rescale=True, img=[img], img_metas=[[meta]])
+                    self.full_forward_error = None
+                except Exception as e:
+                    # 头部损坏 (缺少CUDA算子、检查点键不匹配) 时不能报告就绪，
+                    # 只有显式允许的时序模型退化为 backbone 前向
+                    self.full_forward_error = f"{type(e).__name__}: {e}"
+                    if not self.allow_backbone:
+                        raise
+                    self.forward_mode = "backbone"
+            if self.forward_mode == "backbone":
+                start = time.perf_counter()
+                self.model.extract_feat(img=img, img_metas=[meta])
+            if self.device.startswith("cuda"):
+                torch.cuda.synchronize(self.device)
+        return time.perf_counter() - start
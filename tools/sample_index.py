@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+nuScenes sample_token 紧凑索引
+把 sample_token 到场景、时间戳、前后帧、六路相机文件路径及其标定/自车位姿的映射
+预先构建为定长NumPy数组 (.npy，内存映射打开) 和开放寻址哈希表。
+包装脚本和调度方无需加载 devkit 的完整内存表，即可在微秒级解析token，
+并在启动容器前快速拒绝无效token。
+索引还记录场景描述 (天气/昼夜) 和每个样本的标注数，供分层抽样 (sample_list.py) 使用。
+"""
+
+import os
+import json
+import time
+import zlib
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from json_stream import iter_json_array
+
+INDEX_FORMAT_VERSION = 2
+
+# 与 mmdet3d nuScenes 数据转换一致的相机顺序
+CAMERAS = ('CAM_FRONT', 'CAM_FRONT_RIGHT', 'CAM_FRONT_LEFT',
+           'CAM_BACK', 'CAM_BACK_LEFT', 'CAM_BACK_RIGHT')
+
+# 默认索引目录: <dataroot>/sample_index/<version>
+INDEX_DIR_ENV = 'SAMPLE_INDEX_DIR'
+INDEX_SUBDIR = 'sample_index'
+
+TOKEN_DTYPE = 'S32'
+# 标定: 平移(3) + 旋转四元数(4) + 内参(3x3)；位姿: 平移(3) + 旋转四元数(4)
+CALIB_WIDTH = 16
+POSE_WIDTH = 7
+
+
+def _samples_dtype(path_width: int) -> np.dtype:
+    n = len(CAMERAS)
+    return np.dtype([
+        ('token', TOKEN_DTYPE),
+        ('scene', np.int32),
+        ('timestamp', np.int64),
+        ('prev', TOKEN_DTYPE),
+        ('next', TOKEN_DTYPE),
+        ('cam_file', f'S{path_width}', (n,)),
+        ('cam_timestamp', np.int64, (n,)),
+        ('cam_calib', np.float32, (n, CALIB_WIDTH)),
+        ('cam_ego_pose', np.float32, (n, POSE_WIDTH)),
+        ('num_annotations', np.int32),
+    ])
+
+
+def _scenes_dtype(description_width: int) -> np.dtype:
+    return np.dtype([('token', TOKEN_DTYPE), ('name', 'S32'), ('description', f'S{description_width}')])
+
+
+def _slot(token: bytes, mask: int) -> int:
+    return zlib.crc32(token) & mask
+
+
+@dataclass
+class CameraRecord:
+    """一路相机的关键帧"""
+    filename: str
+    timestamp: int
+    sensor2ego_translation: List[float]
+    sensor2ego_rotation: List[float]
+    camera_intrinsic: List[List[float]]
+    ego2global_translation: List[float]
+    ego2global_rotation: List[float]
+
+
+@dataclass
+class SampleRecord:
+    """一个样本的索引记录"""
+    token: str
+    scene_token: str
+    scene_name: str
+    timestamp: int
+    prev: str
+    next: str
+    scene_description: str = ''
+    num_annotations: int = 0
+    cameras: Dict[str, CameraRecord] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class SampleIndex:
+    """内存映射的 sample_token 索引 (只读，多进程共享页缓存)"""
+
+    def __init__(self, index_dir: str):
+        self.index_dir = Path(index_dir)
+        with open(self.index_dir / 'meta.json') as f:
+            self.meta = json.load(f)
+        if self.meta.get('format_version') != INDEX_FORMAT_VERSION:
+            raise ValueError(f"索引格式版本不兼容: {self.meta.get('format_version')} "
+                             f"(需要 {INDEX_FORMAT_VERSION})，请重新构建")
+        self.samples = np.load(self.index_dir / 'samples.npy', mmap_mode='r')
+        self.scenes = np.load(self.index_dir / 'scenes.npy', mmap_mode='r')
+        self.table = np.load(self.index_dir / 'hash.npy', mmap_mode='r')
+        self._mask = len(self.table) - 1
+        self._tokens = self.samples['token']
+        self.cameras = tuple(self.meta['cameras'])
+
+    @property
+    def version(self) -> str:
+        return self.meta['version']
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def __contains__(self, token: str) -> bool:
+        return self.find(token) is not None
+
+    def find(self, token: str) -> Optional[int]:
+        """返回样本行号，不存在时返回None"""
+        key = token.encode('ascii', 'ignore')
+        if len(key) != 32:
+            return None
+        slot = _slot(key, self._mask)
+        while True:
+            row = int(self.table[slot])
+            if row < 0:
+                return None
+            if self._tokens[row] == key:
+                return row
+            slot = (slot + 1) & self._mask
+
+    def get(self, token: str) -> Optional[SampleRecord]:
+        row = self.find(token)
+        if row is None:
+            return None
+        sample = self.samples[row]
+        scene_row = int(sample['scene'])
+        scene = self.scenes[scene_row] if scene_row >= 0 else np.zeros((), dtype=self.scenes.dtype)
+        cameras = {}
+        for i, channel in enumerate(self.cameras):
+            filename = sample['cam_file'][i].decode()
+            if not filename:
+                continue
+            calib = sample['cam_calib'][i].tolist()
+            pose = sample['cam_ego_pose'][i].tolist()
+            cameras[channel] = CameraRecord(
+                filename=filename,
+                timestamp=int(sample['cam_timestamp'][i]),
+                sensor2ego_translation=calib[0:3],
+                sensor2ego_rotation=calib[3:7],
+                camera_intrinsic=[calib[7:10], calib[10:13], calib[13:16]],
+                ego2global_translation=pose[0:3],
+                ego2global_rotation=pose[3:7],
+            )
+        return SampleRecord(
+            token=token,
+            scene_token=scene['token'].decode(),
+            scene_name=scene['name'].decode(),
+            timestamp=int(sample['timestamp']),
+            prev=sample['prev'].decode(),
+            next=sample['next'].decode(),
+            scene_description=scene['description'].decode('utf-8', 'replace'),
+            num_annotations=int(sample['num_annotations']),
+            cameras=cameras,
+        )
+
+
+def default_index_dir(dataroot: str, version: str) -> Path:
+    return Path(dataroot) / INDEX_SUBDIR / version
+
+
+def discover_indexes(dataroot: str, index_dir: Optional[str] = None) -> List[SampleIndex]:
+    """查找可用索引: 显式目录 / 环境变量 SAMPLE_INDEX_DIR / <dataroot>/sample_index/* """
+    explicit = index_dir or os.environ.get(INDEX_DIR_ENV)
+    if explicit:
+        candidates = [Path(explicit)]
+    else:
+        root = Path(dataroot) / INDEX_SUBDIR
+        candidates = sorted(root.iterdir()) if root.is_dir() else []
+    indexes = []
+    for candidate in candidates:
+        if (candidate / 'meta.json').exists():
+            try:
+                indexes.append(SampleIndex(str(candidate)))
+            except (OSError, ValueError):
+                continue
+    return indexes
+
+
+def dataset_versions(dataroot: str) -> List[str]:
+    """dataroot 下存在的nuScenes表目录 (含 sample.json 的版本目录，如 v1.0-trainval / v1.0-mini)"""
+    root = Path(dataroot)
+    if not root.is_dir():
+        return []
+    return sorted(p.name for p in root.iterdir() if (p / 'sample.json').is_file())
+
+
+def covering_indexes(dataroot: str, index_dir: Optional[str] = None,
+                     version: Optional[str] = None) -> List[SampleIndex]:
+    """能判断token是否存在的索引
+
+    指定 version 时只取该版本的索引；未指定时要求 dataroot 下的每个表目录都有对应索引
+    (只有 v1.0-mini 的索引不能用来拒绝 v1.0-trainval 的token)。不满足时返回空列表，表示无法判断。
+    """
+    indexes = discover_indexes(dataroot, index_dir)
+    if version is not None:
+        return [index for index in indexes if index.version == version]
+    present = dataset_versions(dataroot)
+    indexed = {index.version for index in indexes}
+    if not present or not set(present) <= indexed:
+        return []
+    return [index for index in indexes if index.version in present]
+
+
+def resolve_sample_token(token: str, dataroot: str, index_dir: Optional[str] = None,
+                         version: Optional[str] = None) -> Optional[SampleRecord]:
+    """解析token
+
+    没有覆盖所评测版本的索引时返回None (无法判断)；有索引但token不在其中时抛出KeyError。
+    """
+    indexes = covering_indexes(dataroot, index_dir, version)
+    if not indexes:
+        return None
+    for index in indexes:
+        record = index.get(token)
+        if record is not None:
+            return record
+    versions = ', '.join(index.version for index in indexes)
+    raise KeyError(f"sample_token {token!r} 不在索引中 ({versions})")
+
+
+# ---- 构建 ----
+
+def _tables(dataroot: str, version: str, name: str) -> Iterator[Dict[str, Any]]:
+    return iter_json_array(os.path.join(dataroot, version, f'{name}.json'))
+
+
+def build_sample_index(dataroot: str, version: str = 'v1.0-trainval',
+                       output_dir: Optional[str] = None, verbose: bool = True) -> Path:
+    """流式读取nuScenes表文件构建索引
+
+    只保留关键帧相机的 sample_data 及其引用的标定和位姿，
+    ego_pose 表 (trainval 数百万行) 只在扫描时按需挑选，不整表加载。
+    """
+    start = time.perf_counter()
+    out = Path(output_dir) if output_dir else default_index_dir(dataroot, version)
+    out.mkdir(parents=True, exist_ok=True)
+    camera_slot = {name: i for i, name in enumerate(CAMERAS)}
+
+    def log(message: str):
+        if verbose:
+            print(f"   {message} ({time.perf_counter() - start:.1f}s)")
+
+    # 1. 相机传感器和标定 (小表)
+    sensor_channel = {r['token']: r['channel'] for r in _tables(dataroot, version, 'sensor')}
+    calib = {}
+    for r in _tables(dataroot, version, 'calibrated_sensor'):
+        channel = sensor_channel.get(r['sensor_token'])
+        if channel in camera_slot:
+            intrinsic = np.asarray(r.get('camera_intrinsic') or np.zeros((3, 3)), dtype=np.float32)
+            calib[r['token']] = (channel, np.concatenate([
+                np.asarray(r['translation'], dtype=np.float32),
+                np.asarray(r['rotation'], dtype=np.float32),
+                intrinsic.reshape(-1),
+            ]))
+    log(f"相机标定: {len(calib)} 条")
+
+    # 2. 关键帧相机 sample_data: sample_token -> {相机序号: (文件, 时间戳, 标定token, 位姿token)}
+    keyframes: Dict[str, Dict[int, tuple]] = {}
+    needed_poses = set()
+    path_width = 1
+    for r in _tables(dataroot, version, 'sample_data'):
+        if not r.get('is_key_frame') or r['calibrated_sensor_token'] not in calib:
+            continue
+        channel = calib[r['calibrated_sensor_token']][0]
+        keyframes.setdefault(r['sample_token'], {})[camera_slot[channel]] = (
+            r['filename'], r['timestamp'], r['calibrated_sensor_token'], r['ego_pose_token'])
+        needed_poses.add(r['ego_pose_token'])
+        path_width = max(path_width, len(r['filename'].encode()))
+    log(f"关键帧相机数据: {sum(len(v) for v in keyframes.values())} 条")
+
+    # 3. 只挑出需要的自车位姿
+    poses = {}
+    for r in _tables(dataroot, version, 'ego_pose'):
+        if r['token'] in needed_poses:
+            poses[r['token']] = np.concatenate([
+                np.asarray(r['translation'], dtype=np.float32),
+                np.asarray(r['rotation'], dtype=np.float32),
+            ])
+    log(f"自车位姿: {len(poses)} 条")
+
+    # 4. 每个样本的标注数 (test 集没有 sample_annotation 表)
+    annotation_counts: Dict[str, int] = {}
+    has_annotations = os.path.exists(os.path.join(dataroot, version, 'sample_annotation.json'))
+    if has_annotations:
+        for r in _tables(dataroot, version, 'sample_annotation'):
+            annotation_counts[r['sample_token']] = annotation_counts.get(r['sample_token'], 0) + 1
+        log(f"标注: {sum(annotation_counts.values())} 条")
+
+    # 5. 场景和样本
+    scene_rows = {}
+    scene_entries = []
+    for r in _tables(dataroot, version, 'scene'):
+        scene_rows[r['token']] = len(scene_entries)
+        scene_entries.append((r['token'], r['name'], r.get('description', '').encode('utf-8')))
+    description_width = max([1] + [len(entry[2]) for entry in scene_entries])
+    scenes = np.array(scene_entries, dtype=_scenes_dtype(description_width))
+
+    sample_rows = list(_tables(dataroot, version, 'sample'))
+    orphans = [r['token'] for r in sample_rows if r['scene_token'] not in scene_rows]
+    if orphans:
+        raise ValueError(f"{len(orphans)} 个样本引用的场景不在 scene 表中 (如 {orphans[0]})，表文件可能不完整")
+    samples = np.zeros(len(sample_rows), dtype=_samples_dtype(path_width))
+    for i, r in enumerate(sample_rows):
+        row = samples[i]
+        row['token'] = r['token']
+        row['scene'] = scene_rows[r['scene_token']]
+        row['timestamp'] = r['timestamp']
+        row['prev'] = r['prev']
+        row['next'] = r['next']
+        row['num_annotations'] = annotation_counts.get(r['token'], 0)
+        for slot, (filename, timestamp, calib_token, pose_token) in keyframes.get(r['token'], {}).items():
+            row['cam_file'][slot] = filename
+            row['cam_timestamp'][slot] = timestamp
+            row['cam_calib'][slot] = calib[calib_token][1]
+            if pose_token in poses:
+                row['cam_ego_pose'][slot] = poses[pose_token]
+    log(f"样本: {len(samples)} 条")
+
+    # 6. 开放寻址哈希表 (线性探测，装载因子 <= 0.5)
+    size = 1
+    while size < 2 * max(1, len(samples)):
+        size <<= 1
+    table = np.full(size, -1, dtype=np.int32)
+    mask = size - 1
+    for i, token in enumerate(samples['token']):
+        slot = _slot(bytes(token), mask)
+        while table[slot] >= 0:
+            slot = (slot + 1) & mask
+        table[slot] = i
+
+    # 先写数据文件，最后写 meta.json，读取方以 meta.json 存在作为索引完整的标志
+    meta_path = out / 'meta.json'
+    if meta_path.exists():
+        meta_path.unlink()
+    np.save(out / 'samples.npy', samples)
+    np.save(out / 'scenes.npy', scenes)
+    np.save(out / 'hash.npy', table)
+    with open(out / 'meta.tmp', 'w') as f:
+        json.dump({
+            'format_version': INDEX_FORMAT_VERSION,
+            'version': version,
+            'dataroot': str(Path(dataroot).resolve()),
+            'cameras': list(CAMERAS),
+            'samples': len(samples),
+            'scenes': len(scenes),
+            'annotations': has_annotations,
+            'built_at': time.time(),
+        }, f, indent=2)
+    os.replace(out / 'meta.tmp', meta_path)
+    log(f"索引已写入 {out}")
+    return out
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='nuScenes sample_token 紧凑索引')
+    parser.add_argument('--dataroot', type=str, default='/app/data/nuscenes', help='nuScenes 数据集根目录')
+    parser.add_argument('--version', type=str, default='v1.0-trainval', help='数据集版本 (构建和查询)')
+    parser.add_argument('--build', action='store_true', help='构建索引')
+    parser.add_argument('--output', type=str, help='索引目录 (默认 <dataroot>/sample_index/<version>)')
+    parser.add_argument('--lookup', type=str, nargs='*', metavar='TOKEN', help='查询token')
+
+    args = parser.parse_args()
+
+    if args.build:
+        print(f"🔨 构建索引: {args.dataroot} ({args.version})")
+        build_sample_index(args.dataroot, args.version, args.output)
+
+    if args.lookup:
+        failed = 0
+        for token in args.lookup:
+            start = time.perf_counter()
+            try:
+                record = resolve_sample_token(token, args.dataroot, args.output, args.version)
+            except KeyError as e:
+                print(f"❌ {e}")
+                failed += 1
+                continue
+            elapsed_us = (time.perf_counter() - start) * 1e6
+            if record is None:
+                print(f"⚠️ 未找到 {args.version} 的索引，请先使用 --build 构建")
+                raise SystemExit(2)
+            print(f"✅ {token} ({elapsed_us:.0f}µs)")
+            print(json.dumps(record.to_dict(), indent=2, ensure_ascii=False))
+        raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+分层抽样生成评测样本列表
+从 sample_index 索引中按场景、天气/昼夜 (场景描述) 和目标密度 (每帧标注数) 分层抽取子集，
+输出为 run_comparison.py 的 --data_dir 可直接使用的单token文件目录 (或token列表)，并可分为N个分片
+在多台机器/多块GPU上并行运行。
+
+各层按总体比例分配样本 (最大余数法)，层内按场景轮流抽取，使子集覆盖尽可能多的场景。
+比例分配下子集的简单平均近似于总体指标；小层补足1个样本时会偏离比例，
+需要无偏估计时按 selection.json 中记录的各层权重 (每个样本代表的总体数) 加权平均。
+"""
+
+import json
+import time
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from sample_index import SampleIndex, discover_indexes
+
+STRATA = ('scene', 'condition', 'density')
+DEFAULT_DENSITY_BINS = 3
+
+
+def scene_condition(description: str) -> str:
+    """由场景描述得到天气/昼夜类别 (nuScenes 描述中含 "Night" / "Rain" 等关键词)"""
+    text = description.lower()
+    night = 'night' in text
+    rain = 'rain' in text
+    if night and rain:
+        return 'night_rain'
+    if night:
+        return 'night'
+    if rain:
+        return 'rain'
+    return 'day'
+
+
+def density_labels(counts: np.ndarray, bins: int = DEFAULT_DENSITY_BINS) -> np.ndarray:
+    """按标注数分位数分箱，返回每个样本的箱号 (0 为最稀疏)"""
+    if bins <= 1 or len(counts) == 0:
+        return np.zeros(len(counts), dtype=np.int32)
+    edges = np.unique(np.quantile(counts, np.linspace(0, 1, bins + 1)[1:-1]))
+    return np.searchsorted(edges, counts, side='right').astype(np.int32)
+
+
+@dataclass
+class StratumSummary:
+    """一个分层的总体与抽样数量"""
+    key: str
+    population: int
+    selected: int
+    weight: float       # 该层每个抽样样本代表的总体样本数
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class SampleSelection:
+    """抽样结果"""
+    version: str
+    strata: List[str]
+    seed: int
+    population: int
+    shards: List[List[str]] = field(default_factory=list)
+    summary: List[StratumSummary] = field(default_factory=list)
+    scenes_covered: int = 0
+
+    @property
+    def tokens(self) -> List[str]:
+        return [token for shard in self.shards for token in shard]
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data['selected'] = len(self.tokens)
+        return data
+
+
+def _allocate(sizes: Sequence[int], total: int) -> List[int]:
+    """按比例分配 (最大余数法)；样本足够时，分到0个的非空层从当前分配最多的层各借1个"""
+    sizes = np.asarray(sizes, dtype=np.int64)
+    population = int(sizes.sum())
+    if total >= population:
+        return sizes.tolist()
+    quota = sizes / max(1, population) * total
+    alloc = np.floor(quota).astype(np.int64)
+    for i in np.argsort(-(quota - alloc), kind='stable')[:total - int(alloc.sum())]:
+        alloc[i] += 1
+    if total >= np.count_nonzero(sizes):
+        for i in np.flatnonzero((alloc == 0) & (sizes > 0)):
+            alloc[int(np.argmax(alloc))] -= 1
+            alloc[i] = 1
+    return alloc.tolist()
+
+
+def _scene_round_robin(rows: np.ndarray, scenes: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """层内按场景轮流抽取 k 个样本 (场景顺序和场景内顺序均随机)"""
+    groups = {}
+    for row in rng.permutation(rows):
+        groups.setdefault(int(scenes[row]), []).append(row)
+    order = list(groups.values())
+    rng.shuffle(order)
+    picked = []
+    depth = 0
+    while len(picked) < k:
+        for group in order:
+            if depth < len(group):
+                picked.append(group[depth])
+                if len(picked) == k:
+                    break
+        depth += 1
+    return np.asarray(picked, dtype=np.int64)
+
+
+def select_samples(index: SampleIndex, size: int, strata: Sequence[str] = STRATA,
+                   density_bins: int = DEFAULT_DENSITY_BINS, shards: int = 1, seed: int = 0,
+                   scene_names: Optional[Sequence[str]] = None) -> SampleSelection:
+    """从索引中分层抽取 size 个样本并分为 shards 个分片
+
+    scene_names 限定候选场景 (如 val 划分)，为空时使用索引中的全部样本。
+    """
+    unknown = [s for s in strata if s not in STRATA]
+    if unknown:
+        raise ValueError(f"未知的分层维度: {unknown} (可选 {STRATA})")
+    if 'density' in strata and not index.meta.get('annotations', False):
+        raise ValueError(f"索引 {index.version} 没有标注数据，不能按目标密度分层")
+
+    rng = np.random.default_rng(seed)
+    scenes = np.asarray(index.samples['scene'])
+    candidates = np.arange(len(index))
+    if scene_names is not None:
+        wanted = set(scene_names)
+        allowed = [i for i, name in enumerate(index.scenes['name']) if name.decode() in wanted]
+        candidates = candidates[np.isin(scenes, allowed)]
+
+    # 每个候选样本的分层键 (场景维度在层内通过轮流抽取体现，不参与划分)
+    keys: List[Tuple[str, ...]] = [()] * len(candidates)
+    if 'condition' in strata:
+        conditions = [scene_condition(d.decode('utf-8', 'replace')) for d in index.scenes['description']]
+        keys = [key + (conditions[scenes[row]],) for key, row in zip(keys, candidates)]
+    if 'density' in strata:
+        labels = density_labels(np.asarray(index.samples['num_annotations'])[candidates], density_bins)
+        keys = [key + (f'density{label}',) for key, label in zip(keys, labels)]
+
+    groups: Dict[Tuple[str, ...], List[int]] = {}
+    for key, row in zip(keys, candidates):
+        groups.setdefault(key, []).append(int(row))
+    group_keys = sorted(groups)
+    alloc = _allocate([len(groups[key]) for key in group_keys], size)
+
+    selection = SampleSelection(version=index.version, strata=list(strata), seed=seed,
+                                population=len(candidates), shards=[[] for _ in range(max(1, shards))])
+    picked_rows = []
+    for key, k in zip(group_keys, alloc):
+        rows = np.asarray(groups[key], dtype=np.int64)
+        if 'scene' in strata:
+            chosen = _scene_round_robin(rows, scenes, k, rng)
+        else:
+            chosen = rng.choice(rows, size=k, replace=False)
+        picked_rows.append(chosen)
+        selection.summary.append(StratumSummary(
+            key='/'.join(key) or 'all', population=len(rows), selected=int(k),
+            weight=round(len(rows) / k, 3) if k else 0.0))
+
+    # 按层依次轮流发到各分片，使每个分片本身也是分层样本
+    rows = np.concatenate(picked_rows) if picked_rows else np.zeros(0, dtype=np.int64)
+    tokens = index.samples['token']
+    for i, row in enumerate(rows):
+        selection.shards[i % len(selection.shards)].append(tokens[row].decode())
+    selection.scenes_covered = len(np.unique(scenes[rows])) if len(rows) else 0
+    return selection
+
+
+def write_selection(selection: SampleSelection, output_dir: str, fmt: str = 'files') -> Path:
+    """写出分片: files 为 shard_XX/<token>.txt (run_comparison.py 的 --data_dir)，list 为 shard_XX.txt"""
+    out = Path(output_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    for i, shard in enumerate(selection.shards):
+        name = f'shard_{i:02d}'
+        if fmt == 'files':
+            shard_dir = out / name
+            shard_dir.mkdir(exist_ok=True)
+            for token in shard:
+                (shard_dir / f'{token}.txt').write_text(token + '\n')
+        elif fmt == 'list':
+            (out / f'{name}.txt').write_text(''.join(token + '\n' for token in shard))
+        else:
+            raise ValueError(f"未知的输出格式: {fmt}")
+    with open(out / 'selection.json', 'w') as f:
+        json.dump({**selection.to_dict(), 'format': fmt, 'created_at': time.time()}, f, indent=2)
+    return out
+
+
+def load_split_scenes(split: str) -> List[str]:
+    """nuScenes 官方划分的场景名 (需要 nuscenes-devkit)"""
+    try:
+        from nuscenes.utils.splits import create_splits_scenes
+    except ImportError:
+        raise RuntimeError("按划分筛选需要 nuscenes-devkit，或用 --scene-list 提供场景名列表")
+    splits = create_splits_scenes()
+    if split not in splits:
+        raise ValueError(f"未知的划分: {split} (可选 {sorted(splits)})")
+    return splits[split]
+
+
+def main():
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description='从 sample_index 分层抽样生成评测样本列表')
+    parser.add_argument('--dataroot', type=str, default='/app/data/nuscenes', help='nuScenes 数据集根目录')
+    parser.add_argument('--index-dir', type=str, default=None, help='索引目录 (默认 <dataroot>/sample_index/*)')
+    parser.add_argument('--version', type=str, default=None, help='有多个索引时选择的数据集版本')
+    parser.add_argument('--size', type=int, default=500, help='抽样数量 (默认: 500)')
+    parser.add_argument('--shards', type=int, default=1, help='分片数 (默认: 1)')
+    parser.add_argument('--strata', type=str, default=','.join(STRATA),
+                        help=f'分层维度，逗号分隔 (可选 {",".join(STRATA)}，默认全部)')
+    parser.add_argument('--density-bins', type=int, default=DEFAULT_DENSITY_BINS, help='目标密度分箱数')
+    parser.add_argument('--split', type=str, default=None, help='只从官方划分的场景中抽样 (如 val，需要 nuscenes-devkit)')
+    parser.add_argument('--scene-list', type=str, default=None, help='只从列出的场景中抽样 (每行一个场景名)')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--format', choices=['files', 'list'], default='files',
+                        help='files: 每个token一个文件 (run_comparison.py 的 --data_dir)；list: 每个分片一个token列表')
+    parser.add_argument('--output', type=str, required=True, help='输出目录')
+
+    args = parser.parse_args()
+
+    indexes = discover_indexes(args.dataroot, args.index_dir)
+    if args.version:
+        indexes = [index for index in indexes if index.version == args.version]
+    if not indexes:
+        print("❌ 未找到可用索引，请先运行 sample_index.py --build (旧格式的索引需要重新构建)")
+        sys.exit(2)
+    if len(indexes) > 1:
+        print(f"❌ 找到多个索引 ({', '.join(i.version for i in indexes)})，请用 --version 指定")
+        sys.exit(2)
+    index = indexes[0]
+
+    scene_names = None
+    try:
+        if args.split:
+            scene_names = load_split_scenes(args.split)
+        if args.scene_list:
+            with open(args.scene_list) as f:
+                listed = [line.strip() for line in f if line.strip()]
+            scene_names = [s for s in scene_names if s in set(listed)] if scene_names is not None else listed
+        strata = [s for s in args.strata.split(',') if s]
+        if args.strata == parser.get_default('strata') and not index.meta.get('annotations', False):
+            print(f"⚠️ 索引 {index.version} 没有标注数据，不按目标密度分层")
+            strata.remove('density')
+        selection = select_samples(index, args.size, strata, args.density_bins, args.shards,
+                                   args.seed, scene_names)
+    except (RuntimeError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    out = write_selection(selection, args.output, args.format)
+    print(f"✅ 从 {selection.population} 个样本中抽取 {len(selection.tokens)} 个 "
+          f"({index.version}, 覆盖 {selection.scenes_covered} 个场景, {len(selection.shards)} 个分片) -> {out}")
+    for stratum in selection.summary:
+        print(f"   {stratum.key}: {stratum.selected}/{stratum.population}")
+
+
+if __name__ == "__main__":
+    main()
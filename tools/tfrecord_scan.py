@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+TFRecord 帧扫描 (不依赖 TensorFlow)
+TFRecord 文件由连续的记录组成，每条记录为:
+    uint64 长度 | uint32 长度的masked CRC32C | 数据 | uint32 数据的masked CRC32C
+只读取12字节的记录头并跳过数据即可统计帧数、发现截断 (最后一条记录不完整)；
+记录头CRC只覆盖8字节，纯Python计算也很快。校验数据CRC需要读取全部数据，
+安装了 crc32c / google-crc32c 时使用其C实现，否则退回纯Python (很慢，仅适合小文件)。
+"""
+
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterable, List, Optional
+
+# 可选的CRC32C C实现
+try:
+    from crc32c import crc32c as _crc32c_fast
+    HAS_FAST_CRC32C = True
+except ImportError:
+    try:
+        import google_crc32c
+
+        def _crc32c_fast(data: bytes) -> int:
+            return google_crc32c.value(bytes(data))
+        HAS_FAST_CRC32C = True
+    except ImportError:
+        HAS_FAST_CRC32C = False
+
+CRC_MODES = ('none', 'header', 'full')
+DEFAULT_WORKERS = 8
+
+_HEADER = struct.Struct('<QI')
+_FOOTER = struct.Struct('<I')
+_MASK_DELTA = 0xa282ead8
+
+# Castagnoli 多项式 (反射) 0x82F63B78 的查找表
+_CRC32C_TABLE = []
+for _i in range(256):
+    _crc = _i
+    for _ in range(8):
+        _crc = (_crc >> 1) ^ 0x82F63B78 if _crc & 1 else _crc >> 1
+    _CRC32C_TABLE.append(_crc)
+
+
+def _crc32c_python(data: bytes) -> int:
+    crc = 0xFFFFFFFF
+    table = _CRC32C_TABLE
+    for byte in data:
+        crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+def crc32c(data: bytes) -> int:
+    if HAS_FAST_CRC32C:
+        return _crc32c_fast(data)
+    return _crc32c_python(data)
+
+
+def masked_crc32c(data: bytes) -> int:
+    """TFRecord 使用的掩码CRC"""
+    crc = crc32c(data)
+    return (((crc >> 15) | (crc << 17)) + _MASK_DELTA) & 0xFFFFFFFF
+
+
+@dataclass
+class TFRecordStats:
+    """单个TFRecord文件的扫描结果"""
+    path: str
+    size: int = 0
+    records: int = 0
+    data_bytes: int = 0
+    crc_mode: str = 'header'
+    truncated: bool = False
+    corrupt: bool = False
+    error_offset: Optional[int] = None      # 截断/损坏记录的起始偏移
+    error: Optional[str] = None
+    elapsed_s: float = 0.0
+
+    @property
+    def valid(self) -> bool:
+        return self.error is None and self.records > 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data['valid'] = self.valid
+        return data
+
+
+def scan_tfrecord(path: str, crc_mode: str = 'header') -> TFRecordStats:
+    """沿记录头遍历文件，统计记录数并检查截断/CRC
+
+    crc_mode: none 只检查长度是否越过文件末尾；header 额外校验记录头CRC (默认)；
+    full 再读取全部数据校验数据CRC。
+    """
+    if crc_mode not in CRC_MODES:
+        raise ValueError(f"crc_mode 必须是 {CRC_MODES} 之一: {crc_mode}")
+    start = time.perf_counter()
+    stats = TFRecordStats(path=str(path), crc_mode=crc_mode)
+    try:
+        stats.size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            offset = 0
+            while offset < stats.size:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    stats.truncated = True
+                    stats.error = f"记录头不完整 (偏移 {offset})"
+                    break
+                length, length_crc = _HEADER.unpack(header)
+                if crc_mode != 'none' and masked_crc32c(header[:8]) != length_crc:
+                    stats.corrupt = True
+                    stats.error = f"记录头CRC不符 (偏移 {offset})"
+                    break
+                end = offset + _HEADER.size + length + _FOOTER.size
+                if end > stats.size:
+                    stats.truncated = True
+                    stats.error = f"记录长度 {length} 超出文件末尾 (偏移 {offset})"
+                    break
+                if crc_mode == 'full':
+                    data = f.read(length)
+                    if masked_crc32c(data) != _FOOTER.unpack(f.read(_FOOTER.size))[0]:
+                        stats.corrupt = True
+                        stats.error = f"数据CRC不符 (偏移 {offset})"
+                        break
+                else:
+                    f.seek(end)
+                stats.records += 1
+                stats.data_bytes += length
+                offset = end
+            if stats.error:
+                stats.error_offset = offset
+    except OSError as e:
+        stats.error = str(e)
+    stats.elapsed_s = time.perf_counter() - start
+    return stats
+
+
+def read_first_record(path: str) -> Optional[bytes]:
+    """读取文件中第一条记录的数据 (不校验CRC)"""
+    with open(path, 'rb') as f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return None
+        length, _ = _HEADER.unpack(header)
+        data = f.read(length)
+        return data if len(data) == length else None
+
+
+def _read_varint(data: bytes, pos: int):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _iter_fields(data: bytes):
+    """遍历protobuf消息的顶层字段: (字段号, 线类型, 值)，长度分隔字段的值为bytes"""
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        number, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = data[pos:pos + 8], pos + 8
+        elif wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            value, pos = data[pos:pos + length], pos + length
+        elif wire_type == 5:
+            value, pos = data[pos:pos + 4], pos + 4
+        else:
+            raise ValueError(f"不支持的protobuf线类型 {wire_type}")
+        yield number, wire_type, value
+
+
+def parse_frame_summary(data: bytes) -> Dict[str, Any]:
+    """从 waymo Frame 记录中解出 context.name (字段1.1) 和 timestamp_micros (字段2)
+
+    只解析顶层字段，不需要 waymo-open-dataset 的protobuf定义。
+    """
+    summary: Dict[str, Any] = {}
+    for number, wire_type, value in _iter_fields(data):
+        if number == 1 and wire_type == 2:
+            for sub_number, sub_type, sub_value in _iter_fields(value):
+                if sub_number == 1 and sub_type == 2:
+                    summary['context_name'] = bytes(sub_value).decode('utf-8', 'replace')
+                    break
+        elif number == 2 and wire_type == 0:
+            summary['timestamp_micros'] = value
+    return summary
+
+
+def scan_tfrecords(paths: Iterable[str], crc_mode: str = 'header',
+                   workers: int = DEFAULT_WORKERS) -> List[TFRecordStats]:
+    """并行扫描多个文件 (记录头模式几乎只有seek，瓶颈在存储延迟)"""
+    paths = [str(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(lambda p: scan_tfrecord(p, crc_mode), paths))
+
+
+def main():
+    import sys
+    import glob
+    import argparse
+
+    parser = argparse.ArgumentParser(description='不依赖TensorFlow扫描TFRecord文件')
+    parser.add_argument('paths', nargs='+', help='TFRecord文件或目录')
+    parser.add_argument('--crc', choices=CRC_MODES, default='header', help='CRC校验级别 (默认: header)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='并行扫描的线程数')
+
+    args = parser.parse_args()
+    if args.crc == 'full' and not HAS_FAST_CRC32C:
+        print("⚠️ 未安装 crc32c / google-crc32c，使用纯Python计算数据CRC，速度很慢")
+
+    files = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '*.tfrecord'))))
+        else:
+            files.append(path)
+
+    start = time.perf_counter()
+    results = scan_tfrecords(files, args.crc, args.workers)
+    for stats in results:
+        status = '✅' if stats.valid else '❌'
+        print(f"{status} {os.path.basename(stats.path)}: {stats.records} 帧, {stats.size / (1024 ** 2):.1f}MB")
+        if stats.error:
+            print(f"   错误: {stats.error}")
+    failed = sum(1 for s in results if not s.valid)
+    print(f"📊 {len(results) - failed}/{len(results)} 个文件完整, 共 {sum(s.records for s in results)} 帧 "
+          f"(耗时 {time.perf_counter() - start:.2f}s)")
+    sys.exit(0 if not failed else 1)
+
+
+if __name__ == "__main__":
+    main()
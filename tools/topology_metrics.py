@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+车道拓扑评测工具
+按OpenLane-V2方式计算 DET_l (车道中心线检测)、DET_t (交通元素检测)、
+TOP_ll / TOP_lt (拓扑关系) 以及综合得分 OLS，用于评估TopoMLP
+"""
+
+import json
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from model_output_standard import StandardOutput
+
+# 车道中心线统一重采样的点数
+NUM_LANE_POINTS = 11
+
+
+def resample_polyline(points: Any, num_points: int = NUM_LANE_POINTS) -> np.ndarray:
+    """按弧长将折线重采样为固定点数"""
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim != 2 or len(points) == 0:
+        return np.zeros((num_points, 3))
+    if points.shape[1] == 2:
+        points = np.hstack([points, np.zeros((len(points), 1))])
+    if len(points) == 1:
+        return np.repeat(points[:, :3], num_points, axis=0)
+
+    seg = np.linalg.norm(np.diff(points, axis=0), axis=1)
+    arc = np.concatenate([[0.0], np.cumsum(seg)])
+    if arc[-1] == 0:
+        return np.repeat(points[:1, :3], num_points, axis=0)
+    target = np.linspace(0.0, arc[-1], num_points)
+    return np.stack([np.interp(target, arc, points[:, d]) for d in range(3)], axis=1)
+
+
+def stack_lanes(lanes: Sequence[Any]) -> np.ndarray:
+    """将若干车道中心线重采样并堆叠为 (L, K, 3)"""
+    if len(lanes) == 0:
+        return np.zeros((0, NUM_LANE_POINTS, 3))
+    return np.stack([resample_polyline(lane) for lane in lanes])
+
+
+def frechet_distance_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """所有 (a_i, b_j) 折线对的离散Fréchet距离
+
+    动态规划在点序维度上迭代，每一步同时对全部折线对做向量化计算。
+    a: (P, K, D), b: (G, K, D) -> (P, G)
+    """
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    # (P, G, K, K) 逐点距离
+    d = np.linalg.norm(a[:, None, :, None, :] - b[None, :, None, :, :], axis=-1)
+    k_a, k_b = d.shape[2], d.shape[3]
+    ca = np.empty_like(d)
+    ca[:, :, 0, 0] = d[:, :, 0, 0]
+    for i in range(1, k_a):
+        ca[:, :, i, 0] = np.maximum(ca[:, :, i - 1, 0], d[:, :, i, 0])
+    for j in range(1, k_b):
+        ca[:, :, 0, j] = np.maximum(ca[:, :, 0, j - 1], d[:, :, 0, j])
+    for i in range(1, k_a):
+        for j in range(1, k_b):
+            prev = np.minimum(np.minimum(ca[:, :, i - 1, j], ca[:, :, i - 1, j - 1]), ca[:, :, i, j - 1])
+            ca[:, :, i, j] = np.maximum(prev, d[:, :, i, j])
+    return ca[:, :, -1, -1]
+
+
+def chamfer_distance_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """所有 (a_i, b_j) 折线对的对称Chamfer距离 (P, G)"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    d = np.linalg.norm(a[:, None, :, None, :] - b[None, :, None, :, :], axis=-1)
+    return 0.5 * (d.min(axis=3).mean(axis=2) + d.min(axis=2).mean(axis=2))
+
+
+def box_iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """2D框 [x1, y1, x2, y2] 的IoU矩阵 (P, G)"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=-1)
+    area_a = np.clip(a[:, 2:] - a[:, :2], 0, None).prod(axis=-1)
+    area_b = np.clip(b[:, 2:] - b[:, :2], 0, None).prod(axis=-1)
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-12), 0.0)
+
+
+def _greedy_match(similarity_ok: np.ndarray, scores: np.ndarray) -> np.ndarray:
+    """按置信度降序贪心匹配，返回每个预测对应的真值索引 (未匹配为-1)"""
+    match = np.full(similarity_ok.shape[0], -1, dtype=np.int64)
+    taken = np.zeros(similarity_ok.shape[1], dtype=bool)
+    for p in np.argsort(-scores, kind='stable'):
+        candidates = np.flatnonzero(similarity_ok[p] & ~taken)
+        if len(candidates):
+            match[p] = candidates[0]
+            taken[candidates[0]] = True
+    return match
+
+
+def _average_precision(scores: np.ndarray, tp: np.ndarray, num_gt: int) -> float:
+    """全点插值AP"""
+    if num_gt == 0:
+        return float('nan')
+    if len(scores) == 0:
+        return 0.0
+    order = np.argsort(-scores, kind='stable')
+    tp = tp[order].astype(np.float64)
+    tp_cum = np.cumsum(tp)
+    precision = tp_cum / np.arange(1, len(tp) + 1)
+    recall = tp_cum / num_gt
+    # 精度包络
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    recall = np.concatenate([[0.0], recall])
+    return float(np.sum((recall[1:] - recall[:-1]) * precision))
+
+
+def _edges(edges: Any, with_score: bool) -> np.ndarray:
+    cols = 3 if with_score else 2
+    arr = np.asarray(edges if edges is not None else [], dtype=np.float64)
+    if arr.size == 0:
+        return np.zeros((0, cols))
+    arr = arr.reshape(len(arr), -1)
+    if with_score and arr.shape[1] == 2:
+        arr = np.hstack([arr, np.ones((len(arr), 1))])
+    return arr[:, :cols]
+
+
+def topology_frame_from_output(output: StandardOutput) -> Dict[str, Any]:
+    """将TopoMLP标准化输出转换为评测用帧数据"""
+    elements = output.map_elements or []
+    lanes = [e for e in elements if e.type == 'lane_centerline']
+    tes = [e for e in elements if e.type == 'traffic_element']
+    lane_pos = {e.id: i for i, e in enumerate(lanes)}
+    te_pos = {e.id: i for i, e in enumerate(tes)}
+
+    def remap(edges, col_pos):
+        return [[lane_pos[a], col_pos[b], s] for a, b, s in edges if a in lane_pos and b in col_pos]
+
+    topology = output.topology
+    return {
+        'lanes': [e.points for e in lanes],
+        'lane_scores': [e.confidence for e in lanes],
+        'te_boxes': [np.asarray(e.points, dtype=np.float64).reshape(-1)[:4] for e in tes],
+        'te_labels': [e.attributes.get('attribute', -1) for e in tes],
+        'te_scores': [e.confidence for e in tes],
+        'lclc': remap(topology.lane_lane, lane_pos) if topology else [],
+        'lcte': remap(topology.lane_traffic, te_pos) if topology else [],
+    }
+
+
+class TopologyEvaluator:
+    """OpenLane-V2风格拓扑评测器"""
+
+    def __init__(self, lane_thresholds: Tuple[float, ...] = (1.0, 2.0, 3.0),
+                 te_iou_threshold: float = 0.75, topo_lane_threshold: float = 1.5,
+                 distance: str = 'frechet'):
+        self.lane_thresholds = lane_thresholds
+        self.te_iou_threshold = te_iou_threshold
+        self.topo_lane_threshold = topo_lane_threshold
+        if distance not in ('frechet', 'chamfer'):
+            raise ValueError(f"Unsupported lane distance: {distance}")
+        self.distance_fn = frechet_distance_matrix if distance == 'frechet' else chamfer_distance_matrix
+
+    def evaluate(self, gts: List[Dict[str, Any]], preds: List[Dict[str, Any]]) -> Dict[str, float]:
+        """评测逐帧结果 (gts 与 preds 按帧一一对应)"""
+        if len(gts) != len(preds):
+            raise ValueError("gts and preds must have the same number of frames")
+
+        # 车道检测记录: 每个阈值下 (分数, 是否TP)
+        lane_scores, lane_tp = [], {t: [] for t in self.lane_thresholds}
+        num_gt_lanes = 0
+        # 交通元素检测记录: 按类别
+        te_records: Dict[int, List[Tuple[np.ndarray, np.ndarray]]] = {}
+        te_num_gt: Dict[int, int] = {}
+        # 拓扑边记录 (已映射到真值索引空间)
+        ll_records, lt_records = [], []
+
+        for frame_idx, (gt, pred) in enumerate(zip(gts, preds)):
+            gt_lanes = stack_lanes(gt.get('lanes', []))
+            pred_lanes = stack_lanes(pred.get('lanes', []))
+            scores = np.asarray(pred.get('lane_scores', np.ones(len(pred_lanes))), dtype=np.float64)
+            dist = self.distance_fn(pred_lanes, gt_lanes)
+
+            num_gt_lanes += len(gt_lanes)
+            lane_scores.append(scores)
+            for t in self.lane_thresholds:
+                lane_tp[t].append(_greedy_match(dist < t, scores) >= 0)
+
+            lane_match = _greedy_match(dist < self.topo_lane_threshold, scores)
+            te_match = self._evaluate_traffic_elements(gt, pred, te_records, te_num_gt)
+
+            ll_records.append(self._map_edges(
+                frame_idx, pred.get('lclc'), gt.get('lclc'), lane_match, lane_match, len(gt_lanes)
+            ))
+            lt_records.append(self._map_edges(
+                frame_idx, pred.get('lcte'), gt.get('lcte'), lane_match, te_match, len(gt_lanes)
+            ))
+
+        all_scores = np.concatenate(lane_scores) if lane_scores else np.zeros(0)
+        det_l = np.nanmean([
+            _average_precision(all_scores, np.concatenate(lane_tp[t]), num_gt_lanes)
+            for t in self.lane_thresholds
+        ]) if num_gt_lanes else 0.0
+
+        te_aps = [
+            _average_precision(np.concatenate([r[0] for r in recs]),
+                               np.concatenate([r[1] for r in recs]), te_num_gt.get(label, 0))
+            for label, recs in te_records.items()
+        ]
+        te_aps += [0.0 for label in te_num_gt if label not in te_records]
+        te_aps = [ap for ap in te_aps if not np.isnan(ap)]
+        det_t = float(np.mean(te_aps)) if te_aps else 0.0
+
+        top_ll = self._topology_map(ll_records)
+        top_lt = self._topology_map(lt_records)
+        ols = (float(det_l) + det_t + np.sqrt(top_ll) + np.sqrt(top_lt)) / 4
+
+        return {
+            'DET_l': float(det_l),
+            'DET_t': det_t,
+            'TOP_ll': top_ll,
+            'TOP_lt': top_lt,
+            'OLS': float(ols),
+            'num_frames': len(gts)
+        }
+
+    def _evaluate_traffic_elements(self, gt: Dict[str, Any], pred: Dict[str, Any],
+                                   records: Dict[int, list], num_gt: Dict[int, int]) -> np.ndarray:
+        """按类别匹配交通元素，返回每个预测对应的真值索引"""
+        gt_boxes = np.asarray(gt.get('te_boxes', []), dtype=np.float64).reshape(-1, 4)
+        gt_labels = np.asarray(gt.get('te_labels', []), dtype=np.int64)
+        pred_boxes = np.asarray(pred.get('te_boxes', []), dtype=np.float64).reshape(-1, 4)
+        pred_labels = np.asarray(pred.get('te_labels', []), dtype=np.int64)
+        pred_scores = np.asarray(pred.get('te_scores', np.ones(len(pred_boxes))), dtype=np.float64)
+
+        iou = box_iou_matrix(pred_boxes, gt_boxes)
+        same_label = pred_labels[:, None] == gt_labels[None, :]
+        match = _greedy_match((iou >= self.te_iou_threshold) & same_label, pred_scores)
+
+        for label in np.unique(gt_labels):
+            num_gt[int(label)] = num_gt.get(int(label), 0) + int(np.sum(gt_labels == label))
+        for label in np.unique(pred_labels):
+            sel = pred_labels == label
+            records.setdefault(int(label), []).append((pred_scores[sel], match[sel] >= 0))
+        return match
+
+    @staticmethod
+    def _map_edges(frame_idx: int, pred_edges: Any, gt_edges: Any, row_match: np.ndarray,
+                   col_match: np.ndarray, num_gt_rows: int) -> Dict[str, np.ndarray]:
+        """将预测边映射到真值索引空间并标记是否命中真值边 (COO稀疏表示)"""
+        pred_e = _edges(pred_edges, with_score=True)
+        gt_e = _edges(gt_edges, with_score=False).astype(np.int64)
+
+        rows = row_match[pred_e[:, 0].astype(np.int64)] if len(pred_e) else np.zeros(0, dtype=np.int64)
+        cols = col_match[pred_e[:, 1].astype(np.int64)] if len(pred_e) else np.zeros(0, dtype=np.int64)
+        # 行未匹配的预测边无法归属到真值顶点，不计入；列未匹配的边视为误检
+        keep = rows >= 0
+        rows, cols, scores = rows[keep], cols[keep], pred_e[keep, 2]
+
+        width = int(max(gt_e[:, 1].max() + 1 if len(gt_e) else 0, cols.max() + 1 if len(cols) else 0, 1))
+        gt_keys = gt_e[:, 0] * width + gt_e[:, 1]
+        pred_keys = rows * width + np.maximum(cols, 0)
+        hit = (cols >= 0) & np.isin(pred_keys, gt_keys)
+
+        gt_degree = np.bincount(gt_e[:, 0], minlength=num_gt_rows) if len(gt_e) else np.zeros(num_gt_rows, dtype=np.int64)
+        return {
+            'frame': np.full(len(rows), frame_idx, dtype=np.int64),
+            'row': rows,
+            'score': scores,
+            'hit': hit,
+            'gt_degree': gt_degree,
+        }
+
+    @staticmethod
+    def _topology_map(records: List[Dict[str, np.ndarray]]) -> float:
+        """逐顶点AP的平均值 (分组累积和实现，无逐顶点Python循环)"""
+        degrees = [r['gt_degree'] for r in records]
+        num_vertices = sum(int(np.count_nonzero(d)) for d in degrees)
+        if num_vertices == 0:
+            return 0.0
+
+        # 全局顶点编号 = 帧偏移 + 行号
+        offsets = np.concatenate([[0], np.cumsum([len(d) for d in degrees])[:-1]])
+        vertex = np.concatenate([off + r['row'] for off, r in zip(offsets, records)]) if records else np.zeros(0)
+        score = np.concatenate([r['score'] for r in records]) if records else np.zeros(0)
+        hit = np.concatenate([r['hit'] for r in records]).astype(np.float64) if records else np.zeros(0)
+        degree = np.concatenate(degrees)
+
+        if len(vertex) == 0:
+            return 0.0
+
+        # 按 (顶点, 分数降序) 排序，在每个顶点组内计算累积精度
+        order = np.lexsort((-score, vertex))
+        vertex, hit = vertex[order].astype(np.int64), hit[order]
+        starts = np.flatnonzero(np.concatenate([[True], vertex[1:] != vertex[:-1]]))
+        group_len = np.diff(np.concatenate([starts, [len(vertex)]]))
+        group_id = np.repeat(np.arange(len(starts)), group_len)
+
+        hit_cum = np.cumsum(hit)
+        hit_before = np.concatenate([[0.0], hit_cum])[starts]
+        tp_in_group = hit_cum - hit_before[group_id]
+        rank_in_group = np.arange(len(vertex)) - starts[group_id] + 1
+        precision_sum = np.bincount(group_id, weights=(tp_in_group / rank_in_group) * hit)
+
+        group_vertex = vertex[starts]
+        group_degree = degree[group_vertex]
+        valid = group_degree > 0
+        ap_sum = np.sum(precision_sum[valid] / group_degree[valid])
+        # 有真值边但没有任何预测边的顶点AP为0
+        return float(ap_sum / num_vertices)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='车道拓扑评测 (OpenLane-V2 DET_l / TOP_ll / OLS)')
+    parser.add_argument('--gt', type=str, required=True, help='逐帧真值JSON文件')
+    parser.add_argument('--pred', type=str, required=True, help='逐帧预测JSON文件')
+    parser.add_argument('--distance', type=str, default='frechet', choices=['frechet', 'chamfer'],
+                        help='车道距离度量')
+    parser.add_argument('--output', type=str, help='评测结果输出文件')
+
+    args = parser.parse_args()
+
+    with open(args.gt) as f:
+        gts = json.load(f)
+    with open(args.pred) as f:
+        preds = json.load(f)
+
+    evaluator = TopologyEvaluator(distance=args.distance)
+    result = evaluator.evaluate(gts, preds)
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+多目标跟踪评测工具
+计算nuScenes风格的 AMOTA / AMOTP、ID切换 (IDS) 和轨迹碎片 (FRAG)，
+用于评估StreamPETR等时序模型的跟踪质量
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from model_output_standard import StandardOutput
+
+try:
+    from scipy.optimize import linear_sum_assignment
+    HAS_SCIPY = True
+except ImportError:
+    HAS_SCIPY = False
+
+
+@dataclass
+class TrackingFrames:
+    """逐帧跟踪数据 (列式存储，每行一个目标)"""
+    scene: np.ndarray      # (N,) 场景标识
+    frame: np.ndarray      # (N,) 场景内帧序号或时间戳 (用于排序)
+    track_id: np.ndarray   # (N,) 跟踪ID
+    center: np.ndarray     # (N, 2) BEV中心点 [x, y]
+    class_id: np.ndarray   # (N,) 类别ID
+    score: np.ndarray      # (N,) 置信度 (真值为1)
+
+    def __len__(self) -> int:
+        return len(self.track_id)
+
+    def subset(self, mask: np.ndarray) -> 'TrackingFrames':
+        """按布尔掩码取子集"""
+        return TrackingFrames(
+            scene=self.scene[mask], frame=self.frame[mask], track_id=self.track_id[mask],
+            center=self.center[mask], class_id=self.class_id[mask], score=self.score[mask]
+        )
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> 'TrackingFrames':
+        """由记录列表构建
+
+        每条记录: {"scene", "frame", "track_id", "center": [x, y, ...], "class_id", "score"(可选)}
+        """
+        return cls(
+            scene=np.array([str(r['scene']) for r in records], dtype=object),
+            frame=np.array([r['frame'] for r in records], dtype=np.float64),
+            track_id=np.array([int(r['track_id']) for r in records], dtype=np.int64),
+            center=np.array([r['center'][:2] for r in records], dtype=np.float64).reshape(-1, 2),
+            class_id=np.array([int(r['class_id']) for r in records], dtype=np.int64),
+            score=np.array([float(r.get('score', 1.0)) for r in records], dtype=np.float64)
+        )
+
+
+def tracking_frames_from_outputs(outputs: List[StandardOutput]) -> TrackingFrames:
+    """将StreamPETR标准化输出序列转换为逐帧跟踪数据
+
+    需要 sample_info 中的 scene_token 和 timestamp (或 frame_idx)，
+    以及检测属性中的 track_id
+    """
+    records = []
+    for output in outputs:
+        info = output.sample_info or {}
+        scene = info.get('scene_token', 'unknown')
+        frame = info.get('timestamp', info.get('frame_idx', 0))
+        for det in output.detections_3d or []:
+            if 'track_id' not in det.attributes:
+                continue
+            records.append({
+                'scene': scene,
+                'frame': frame,
+                'track_id': det.attributes['track_id'],
+                'center': det.bbox_3d.center,
+                'class_id': det.class_id,
+                'score': det.confidence
+            })
+    return TrackingFrames.from_records(records)
+
+
+def _assign(cost: np.ndarray, max_cost: float) -> Tuple[np.ndarray, np.ndarray]:
+    """代价矩阵上的最优匹配，超出阈值的配对被丢弃"""
+    if cost.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    if HAS_SCIPY:
+        masked = np.where(cost <= max_cost, cost, max_cost * 1e3 + 1.0)
+        rows, cols = linear_sum_assignment(masked)
+    else:
+        # 无scipy时退化为按距离的贪心匹配
+        order = np.argsort(cost, axis=None)
+        rows_all, cols_all = np.unravel_index(order, cost.shape)
+        used_r = np.zeros(cost.shape[0], dtype=bool)
+        used_c = np.zeros(cost.shape[1], dtype=bool)
+        picked = []
+        for r, c in zip(rows_all, cols_all):
+            if cost[r, c] > max_cost:
+                break
+            if not used_r[r] and not used_c[c]:
+                used_r[r] = used_c[c] = True
+                picked.append((r, c))
+        rows = np.array([p[0] for p in picked], dtype=np.int64)
+        cols = np.array([p[1] for p in picked], dtype=np.int64)
+
+    keep = cost[rows, cols] <= max_cost
+    return rows[keep], cols[keep]
+
+
+class TrackingEvaluator:
+    """nuScenes风格跟踪评测器
+
+    每个 (类别, 场景) 的逐帧距离矩阵一次性批量计算，
+    各置信度阈值的CLEAR MOT关联只在其上做掩码。
+    """
+
+    def __init__(self, dist_threshold: float = 2.0, num_thresholds: int = 40,
+                 min_recall: float = 0.1):
+        self.dist_threshold = dist_threshold
+        self.recall_thresholds = np.linspace(min_recall, 1.0, num_thresholds)
+
+    def evaluate(self, gt: TrackingFrames, pred: TrackingFrames) -> Dict[str, Any]:
+        """计算各类别及平均跟踪指标"""
+        per_class = {}
+        for class_id in np.unique(gt.class_id):
+            per_class[int(class_id)] = self._evaluate_class(
+                gt.subset(gt.class_id == class_id),
+                pred.subset(pred.class_id == class_id)
+            )
+
+        if not per_class:
+            return {'per_class': {}, 'mean': {}}
+
+        metric_names = ['amota', 'amotp', 'mota', 'motp', 'recall']
+        count_names = ['ids', 'frag', 'tp', 'fp', 'fn']
+        mean = {name: float(np.mean([m[name] for m in per_class.values()])) for name in metric_names}
+        mean.update({name: int(sum(m[name] for m in per_class.values())) for name in count_names})
+        return {'per_class': per_class, 'mean': mean}
+
+    def _evaluate_class(self, gt: TrackingFrames, pred: TrackingFrames) -> Dict[str, Any]:
+        num_gt = len(gt)
+        scenes = self._prepare_scenes(gt, pred)
+
+        # 以全部预测关联一次，由匹配上的预测分数反推各召回率对应的分数阈值
+        base = self._accumulate(scenes, -np.inf, collect_scores=True)
+        tp_scores = np.sort(base['tp_scores'])[::-1]
+
+        motar = np.zeros(len(self.recall_thresholds))
+        motp = np.full(len(self.recall_thresholds), self.dist_threshold)
+        best = base
+        best_mota = -np.inf
+
+        for i, recall in enumerate(self.recall_thresholds):
+            needed = int(np.ceil(recall * num_gt))
+            if needed == 0 or needed > len(tp_scores):
+                continue  # 该召回率不可达: MOTAR=0, MOTP取最大值
+            stats = self._accumulate(scenes, tp_scores[needed - 1])
+            errors = stats['ids'] + stats['fp'] + stats['fn'] - (1 - recall) * num_gt
+            motar[i] = min(1.0, max(0.0, 1.0 - errors / (recall * num_gt)))
+            if stats['tp'] > 0:
+                motp[i] = stats['dist'] / stats['tp']
+
+            mota = 1.0 - (stats['ids'] + stats['fp'] + stats['fn']) / num_gt
+            if mota > best_mota:
+                best_mota, best = mota, stats
+
+        return {
+            'amota': float(motar.mean()),
+            'amotp': float(motp.mean()),
+            'mota': float(max(best_mota, 0.0)) if np.isfinite(best_mota) else 0.0,
+            'motp': float(best['dist'] / best['tp']) if best['tp'] else self.dist_threshold,
+            'recall': float(base['tp'] / num_gt) if num_gt else 0.0,
+            'ids': int(best['ids']),
+            'frag': int(best['frag']),
+            'tp': int(best['tp']),
+            'fp': int(best['fp']),
+            'fn': int(best['fn']),
+            'num_gt': int(num_gt)
+        }
+
+    def _prepare_scenes(self, gt: TrackingFrames, pred: TrackingFrames) -> List[Dict[str, Any]]:
+        """按场景组织帧，并批量计算每帧的 GT×预测 距离矩阵"""
+        scenes = []
+        for scene in np.unique(np.concatenate([gt.scene, pred.scene])):
+            g = gt.subset(gt.scene == scene)
+            p = pred.subset(pred.scene == scene)
+            frames = np.unique(np.concatenate([g.frame, p.frame]))
+            g_frame = np.searchsorted(frames, g.frame)
+            p_frame = np.searchsorted(frames, p.frame)
+
+            # 按帧排序后用padding张量一次性计算全部帧的距离
+            g_order = np.argsort(g_frame, kind='stable')
+            p_order = np.argsort(p_frame, kind='stable')
+            g_counts = np.bincount(g_frame, minlength=len(frames))
+            p_counts = np.bincount(p_frame, minlength=len(frames))
+            g_pad = self._pad(g.center[g_order], g_frame[g_order], g_counts)
+            p_pad = self._pad(p.center[p_order], p_frame[p_order], p_counts)
+            dist = np.linalg.norm(g_pad[:, :, None, :] - p_pad[:, None, :, :], axis=-1)
+
+            g_starts = np.concatenate([[0], np.cumsum(g_counts)[:-1]])
+            p_starts = np.concatenate([[0], np.cumsum(p_counts)[:-1]])
+            scene_frames = []
+            for f in range(len(frames)):
+                gi = g_order[g_starts[f]:g_starts[f] + g_counts[f]]
+                pi = p_order[p_starts[f]:p_starts[f] + p_counts[f]]
+                scene_frames.append({
+                    'gt_ids': g.track_id[gi],
+                    'pred_ids': p.track_id[pi],
+                    'pred_scores': p.score[pi],
+                    'dist': dist[f, :g_counts[f], :p_counts[f]]
+                })
+            scenes.append({'frames': scene_frames, 'gt_ids': np.unique(g.track_id)})
+        return scenes
+
+    @staticmethod
+    def _pad(centers: np.ndarray, frame_idx: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        """将按帧排序的中心点填充为 (帧数, 最大目标数, 2)"""
+        width = int(counts.max()) if len(counts) and counts.max() > 0 else 0
+        padded = np.full((len(counts), width, 2), np.inf)
+        if len(centers):
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            slot = np.arange(len(centers)) - starts[frame_idx]
+            padded[frame_idx, slot] = centers
+        return padded
+
+    def _accumulate(self, scenes: List[Dict[str, Any]], score_threshold: float,
+                    collect_scores: bool = False) -> Dict[str, Any]:
+        """在给定分数阈值下执行CLEAR MOT关联并累计计数"""
+        totals = {'tp': 0, 'fp': 0, 'fn': 0, 'ids': 0, 'frag': 0, 'dist': 0.0}
+        tp_scores = []
+
+        for scene in scenes:
+            last_match = {}    # gt_id -> 最近一次匹配的pred_id
+            tracked = {gt_id: [] for gt_id in scene['gt_ids'].tolist()}
+
+            for frame in scene['frames']:
+                keep = frame['pred_scores'] >= score_threshold
+                pred_ids = frame['pred_ids'][keep]
+                scores = frame['pred_scores'][keep]
+                dist = frame['dist'][:, keep]
+                gt_ids = frame['gt_ids']
+                n_gt, n_pred = dist.shape
+
+                matched_g = np.zeros(n_gt, dtype=bool)
+                matched_p = np.zeros(n_pred, dtype=bool)
+                pairs = []
+
+                # 延续上一帧的匹配 (距离仍在阈值内)
+                if last_match and n_pred:
+                    pred_pos = {pid: j for j, pid in enumerate(pred_ids.tolist())}
+                    for i, gt_id in enumerate(gt_ids.tolist()):
+                        j = pred_pos.get(last_match.get(gt_id))
+                        if j is not None and not matched_p[j] and dist[i, j] <= self.dist_threshold:
+                            matched_g[i] = matched_p[j] = True
+                            pairs.append((i, j))
+
+                # 剩余目标做最优匹配
+                free_g = np.flatnonzero(~matched_g)
+                free_p = np.flatnonzero(~matched_p)
+                rows, cols = _assign(dist[np.ix_(free_g, free_p)], self.dist_threshold)
+                pairs.extend(zip(free_g[rows].tolist(), free_p[cols].tolist()))
+
+                for i, j in pairs:
+                    gt_id, pred_id = int(gt_ids[i]), int(pred_ids[j])
+                    if gt_id in last_match and last_match[gt_id] != pred_id:
+                        totals['ids'] += 1
+                    last_match[gt_id] = pred_id
+                    totals['dist'] += float(dist[i, j])
+                    if collect_scores:
+                        tp_scores.append(scores[j])
+
+                matched_flags = np.zeros(n_gt, dtype=bool)
+                if pairs:
+                    matched_flags[[i for i, _ in pairs]] = True
+                for gt_id, flag in zip(gt_ids.tolist(), matched_flags.tolist()):
+                    tracked[gt_id].append(flag)
+
+                totals['tp'] += len(pairs)
+                totals['fp'] += n_pred - len(pairs)
+                totals['fn'] += n_gt - len(pairs)
+
+            # 碎片数 = 每条真值轨迹被跟踪的连续片段数 - 1
+            for flags in tracked.values():
+                if flags:
+                    f = np.asarray(flags, dtype=np.int8)
+                    runs = int(f[0]) + int(np.count_nonzero(np.diff(f) == 1))
+                    totals['frag'] += max(0, runs - 1)
+
+        if collect_scores:
+            totals['tp_scores'] = np.asarray(tp_scores, dtype=np.float64)
+        return totals
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='多目标跟踪评测 (AMOTA/AMOTP)')
+    parser.add_argument('--gt', type=str, required=True, help='真值记录JSON文件')
+    parser.add_argument('--pred', type=str, required=True, help='预测记录JSON文件')
+    parser.add_argument('--dist-threshold', type=float, default=2.0, help='匹配距离阈值 (米)')
+    parser.add_argument('--output', type=str, help='评测结果输出文件')
+
+    args = parser.parse_args()
+
+    with open(args.gt) as f:
+        gt = TrackingFrames.from_records(json.load(f))
+    with open(args.pred) as f:
+        pred = TrackingFrames.from_records(json.load(f))
+
+    evaluator = TrackingEvaluator(dist_threshold=args.dist_threshold)
+    result = evaluator.evaluate(gt, pred)
+
+    print(json.dumps(result['mean'], indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,13 @@ import argparse
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from directory_size import DirectorySizer, get_sizer, set_sizer
+from json_stream import JSONArrayStats, scan_json_array
+from dataset_manifest import DatasetManifest, default_manifest_path
+from tfrecord_scan import TFRecordStats, parse_frame_summary, read_first_record, scan_tfrecord
+from parquet_scan import ParquetFileStats, scan_parquet
 
 # 设置日志
 logging.basicConfig(
@@ -27,8 +34,9 @@ logger = logging.getLogger(__name__)
 class DatasetValidator:
     """数据集验证器基类"""
     
-    def __init__(self, dataset_root: str):
+    def __init__(self, dataset_root: str, manifest: Optional[DatasetManifest] = None):
         self.dataset_root = Path(dataset_root)
+        self.manifest = manifest
         self.validation_results = {}
     
     def validate(self) -> Dict:
@@ -51,18 +59,66 @@ class DatasetValidator:
             return 0
     
     def get_directory_size(self, dir_path: str) -> int:
-        """获取目录大小 (bytes)"""
+        """获取目录大小 (bytes)
+        
+        有文件清单时直接按清单累加；否则并行扫描子目录，按目录mtime缓存，
+        复验时只重新扫描有变化的目录
+        """
+        if self.manifest is not None and self.manifest.contains(str(dir_path)):
+            return self.manifest.bytes_under(str(dir_path))
         try:
-            total_size = 0
-            for path in Path(dir_path).rglob('*'):
-                if path.is_file():
-                    total_size += path.stat().st_size
-            return total_size
+            result = get_sizer().size(str(dir_path))
         except OSError:
             return 0
+        logger.info(f"目录大小 {result.path}: {result.files} 个文件, {result.directories} 个目录, "
+                    f"重新扫描 {result.rescanned} 个, 耗时 {result.elapsed_s:.2f}s")
+        return result.total_bytes
+
+# nuScenes 表文件中每条记录必须包含的键
+NUSCENES_TABLE_KEYS = {
+    'scene.json': ['token', 'name', 'log_token', 'nbr_samples', 'first_sample_token', 'last_sample_token'],
+    'sample.json': ['token', 'timestamp', 'scene_token', 'prev', 'next'],
+    'sample_data.json': ['token', 'sample_token', 'ego_pose_token', 'calibrated_sensor_token',
+                         'filename', 'timestamp', 'is_key_frame'],
+    'ego_pose.json': ['token', 'translation', 'rotation', 'timestamp'],
+    'calibrated_sensor.json': ['token', 'sensor_token', 'translation', 'rotation', 'camera_intrinsic'],
+    'sensor.json': ['token', 'channel', 'modality'],
+}
 
 class NuScenesValidator(DatasetValidator):
-    """nuScenes 数据集验证器"""
+    """nuScenes 数据集验证器
+    
+    表文件流式扫描 (内存占用与文件大小无关)，统计记录数并检查必需键；
+    完整加载 nuscenes-devkit 需要数GB内存，仅在 load_devkit=True 时执行。
+    """
+    
+    def __init__(self, dataset_root: str, load_devkit: bool = False,
+                 manifest: Optional[DatasetManifest] = None):
+        super().__init__(dataset_root, manifest)
+        self.load_devkit = load_devkit
+    
+    def scan_table(self, file_path: Path, keys: List[str]) -> Tuple[JSONArrayStats, int]:
+        """流式扫描一张表，返回统计和各场景 nbr_samples 之和 (仅 scene.json 有意义)
+        
+        有文件清单且表文件未变化时复用上次的扫描结果
+        """
+        def scan():
+            nbr_samples_total = [0]
+            
+            def count_scene_samples(record):
+                nbr_samples_total[0] += record.get('nbr_samples', 0)
+            
+            on_record = count_scene_samples if file_path.name == 'scene.json' else None
+            stats = scan_json_array(str(file_path), keys, on_record=on_record)
+            data = stats.to_dict()
+            data.pop('valid')
+            return {'stats': data, 'nbr_samples_total': nbr_samples_total[0]}
+        
+        if self.manifest is not None:
+            cached = self.manifest.cached(str(file_path), 'table_scan', scan)
+        else:
+            cached = scan()
+        return JSONArrayStats(**cached['stats']), cached['nbr_samples_total']
     
     def validate(self) -> Dict:
         logger.info("验证 nuScenes 数据集...")
@@ -100,27 +156,50 @@ class NuScenesValidator(DatasetValidator):
             else:
                 results['status'] = 'valid'
             
-            # 验证数据集内容
+            # 验证数据集内容 (流式扫描各表)
             try:
-                import json
+                tables = {}
+                scene_sample_total = 0
                 
-                # 读取场景信息
-                scene_file = mini_path / 'scene.json'
-                with open(scene_file, 'r') as f:
-                    scenes = json.load(f)
-                
-                # 读取样本信息
-                sample_file = mini_path / 'sample.json'
-                with open(sample_file, 'r') as f:
-                    samples = json.load(f)
+                for file_name, keys in NUSCENES_TABLE_KEYS.items():
+                    file_path = mini_path / file_name
+                    if file_name in missing_files:
+                        continue
+                    stats, nbr_samples_total = self.scan_table(file_path, keys)
+                    if file_name == 'scene.json':
+                        scene_sample_total = nbr_samples_total
+                    tables[file_name] = stats
+                    results['details'].setdefault('table_records', {})[file_name] = stats.records
+                    if stats.missing_keys:
+                        results['details'].setdefault('missing_keys', {})[file_name] = stats.missing_keys
+                    if stats.error:
+                        results['details'].setdefault('table_errors', {})[file_name] = stats.error
                 
+                scenes = tables.get('scene.json')
+                samples = tables.get('sample.json')
                 results['details'].update({
-                    'scene_count': len(scenes),
-                    'sample_count': len(samples),
+                    'scene_count': scenes.records if scenes else 0,
+                    'sample_count': samples.records if samples else 0,
                     'dataset_size_mb': round(self.get_directory_size(self.dataset_root) / (1024 * 1024), 2)
                 })
+                if scenes and scenes.first_record:
+                    results['details']['first_scene_token'] = scenes.first_record.get('token')
+                    results['details']['first_scene_name'] = scenes.first_record.get('name')
+                
+                # 各场景 nbr_samples 之和应等于样本总数
+                if scenes and samples and scene_sample_total != samples.records:
+                    results['details']['sample_count_mismatch'] = {
+                        'scene_nbr_samples_total': scene_sample_total,
+                        'sample_records': samples.records,
+                    }
+                
+                if any(not stats.valid for stats in tables.values()) and results['status'] == 'valid':
+                    results['status'] = 'incomplete'
                 
-                # 验证 API 可用性
+                # 验证 API 可用性 (完整加载需要大量内存，默认跳过)
+                if not self.load_devkit:
+                    results['details']['api_check'] = 'skipped'
+                    return results
                 try:
                     from nuscenes.nuscenes import NuScenes
                     nusc = NuScenes(version='v1.0-mini', dataroot=str(self.dataset_root), verbose=False)
@@ -151,7 +230,32 @@ class NuScenesValidator(DatasetValidator):
         return results
 
 class WaymoValidator(DatasetValidator):
-    """Waymo Open Dataset 验证器"""
+    """Waymo Open Dataset 验证器
+    
+    所有 TFRecord 文件沿记录头并行扫描 (不需要 TensorFlow)，统计每个segment的帧数并检查截断；
+    首帧的 context 名称和时间戳直接从protobuf线格式解出。
+    """
+    
+    def __init__(self, dataset_root: str, manifest: Optional[DatasetManifest] = None,
+                 crc_mode: str = 'header', workers: int = 16):
+        super().__init__(dataset_root, manifest)
+        self.crc_mode = crc_mode
+        self.workers = workers
+    
+    def scan_tfrecords(self, tfrecord_files: List[Path]) -> List[TFRecordStats]:
+        """并行扫描 TFRecord 文件，有文件清单时复用未变化文件的扫描结果"""
+        def scan(path: Path) -> TFRecordStats:
+            def compute():
+                data = scan_tfrecord(str(path), self.crc_mode).to_dict()
+                data.pop('valid')
+                return data
+            
+            if self.manifest is not None:
+                return TFRecordStats(**self.manifest.cached(str(path), f'tfrecord_scan_{self.crc_mode}', compute))
+            return TFRecordStats(**compute())
+        
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            return list(executor.map(scan, tfrecord_files))
     
     def validate(self) -> Dict:
         logger.info("验证 Waymo Open Dataset...")
@@ -172,7 +276,7 @@ class WaymoValidator(DatasetValidator):
                 return results
             
             # 查找 TFRecord 文件
-            tfrecord_files = list(validation_path.glob('*.tfrecord'))
+            tfrecord_files = sorted(validation_path.glob('*.tfrecord'))
             
             if not tfrecord_files:
                 results['status'] = 'failed'
@@ -180,21 +284,30 @@ class WaymoValidator(DatasetValidator):
                 return results
             
             results['status'] = 'valid'
+            
+            # 验证文件完整性 (全部文件沿记录头扫描，统计帧数并检查截断)
+            scans = self.scan_tfrecords(tfrecord_files)
             results['details'].update({
                 'tfrecord_count': len(tfrecord_files),
+                'frame_count': sum(stats.records for stats in scans),
+                'frames_per_segment': {Path(stats.path).name: stats.records for stats in scans},
+                'tfrecord_crc': self.crc_mode,
                 'dataset_size_mb': round(self.get_directory_size(validation_path) / (1024 * 1024), 2)
             })
+            invalid = {Path(stats.path).name: stats.error or 'no records' for stats in scans if not stats.valid}
+            if invalid:
+                results['status'] = 'incomplete'
+                results['details']['invalid_tfrecords'] = invalid
             
-            # 验证文件完整性
-            file_sizes = []
-            for tf_file in tfrecord_files[:5]:  # 检查前5个文件
-                size_mb = round(self.get_file_size(tf_file) / (1024 * 1024), 2)
-                file_sizes.append({
-                    'filename': tf_file.name,
-                    'size_mb': size_mb
-                })
-            
-            results['details']['sample_files'] = file_sizes
+            # 不依赖 waymo-open-dataset 解析首帧的 context 名称和时间戳
+            first_valid = next((stats.path for stats in scans if stats.valid), None)
+            if first_valid:
+                try:
+                    record = read_first_record(first_valid)
+                    if record is not None:
+                        results['details']['sample_frame'] = parse_frame_summary(record)
+                except (OSError, ValueError, IndexError) as e:
+                    results['details']['sample_frame_error'] = str(e)
             
             # 验证 API 可用性
             try:
@@ -240,8 +353,42 @@ class WaymoValidator(DatasetValidator):
         
         return results
 
+# av2 场景文件必须包含的列，以及可从列统计直接得到的常量列
+AV2_SCENARIO_COLUMNS = ['track_id', 'timestep', 'position_x', 'position_y', 'heading',
+                        'scenario_id', 'focal_track_id']
+AV2_CONSTANT_COLUMNS = ['scenario_id', 'focal_track_id', 'city']
+
 class ArgoverseValidator(DatasetValidator):
-    """Argoverse 2 数据集验证器"""
+    """Argoverse 2 数据集验证器
+    
+    所有场景文件只读取Parquet文件尾并行扫描，得到行数、列名和常量列并检查文件完整性；
+    count_tracks 时额外统计轨迹数: pyarrow 写出的文件没有 distinct_count，
+    需要读取每个文件的 track_id 列，因此默认关闭。
+    """
+    
+    def __init__(self, dataset_root: str, manifest: Optional[DatasetManifest] = None,
+                 workers: int = 16, count_tracks: bool = False):
+        super().__init__(dataset_root, manifest)
+        self.workers = workers
+        self.count_tracks = count_tracks
+    
+    def scan_parquet_files(self, parquet_files: List[Path]) -> List[ParquetFileStats]:
+        """并行扫描文件尾，有文件清单时复用未变化文件的扫描结果"""
+        distinct = ['track_id'] if self.count_tracks else []
+        
+        def scan(path: Path) -> ParquetFileStats:
+            def compute():
+                data = scan_parquet(str(path), AV2_CONSTANT_COLUMNS, distinct).to_dict()
+                data.pop('valid')
+                return data
+            
+            if self.manifest is not None:
+                key = 'parquet_footer_tracks' if self.count_tracks else 'parquet_footer'
+                return ParquetFileStats(**self.manifest.cached(str(path), key, compute))
+            return ParquetFileStats(**compute())
+        
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            return list(executor.map(scan, parquet_files))
     
     def validate(self) -> Dict:
         logger.info("验证 Argoverse 2 数据集...")
@@ -266,10 +413,11 @@ class ArgoverseValidator(DatasetValidator):
             parquet_files = []
             
             if self.check_directory_exists(val_path):
-                parquet_files = list(val_path.glob('*.parquet'))
+                # av2 的目录结构为 val/<scenario_id>/scenario_<scenario_id>.parquet
+                parquet_files = sorted(val_path.rglob('*.parquet'))
             else:
                 # 检查根目录下的 parquet 文件
-                parquet_files = list(motion_path.glob('*.parquet'))
+                parquet_files = sorted(motion_path.glob('*.parquet'))
             
             if not parquet_files:
                 results['status'] = 'failed'
@@ -277,30 +425,51 @@ class ArgoverseValidator(DatasetValidator):
                 return results
             
             results['status'] = 'valid'
+            
+            # 验证文件完整性 (全部文件只读取文件尾)
+            scans = self.scan_parquet_files(parquet_files)
+            valid_scans = [stats for stats in scans if stats.valid]
+            track_counts = [stats.distinct['track_id'] for stats in valid_scans if 'track_id' in stats.distinct]
             results['details'].update({
                 'scenario_count': len(parquet_files),
+                'total_rows': sum(stats.num_rows for stats in valid_scans),
                 'dataset_size_mb': round(self.get_directory_size(motion_path) / (1024 * 1024), 2)
             })
+            if track_counts:
+                results['details']['track_count'] = sum(track_counts)
+                results['details']['track_counted_files'] = len(track_counts)
             
-            # 验证文件完整性
-            file_sizes = []
-            for pq_file in parquet_files[:5]:  # 检查前5个文件
-                size_kb = round(self.get_file_size(pq_file) / 1024, 2)
-                file_sizes.append({
-                    'filename': pq_file.name,
-                    'size_kb': size_kb
-                })
+            invalid = {Path(stats.path).name: stats.error for stats in scans if not stats.valid}
+            schema_mismatch = {}
+            for stats in valid_scans:
+                missing = [c for c in AV2_SCENARIO_COLUMNS if c not in stats.columns]
+                if missing:
+                    schema_mismatch[Path(stats.path).name] = missing
+            if invalid:
+                results['details']['invalid_parquet'] = invalid
+            if schema_mismatch:
+                results['details']['schema_mismatch'] = schema_mismatch
+            if invalid or schema_mismatch:
+                results['status'] = 'incomplete'
             
-            results['details']['sample_files'] = file_sizes
+            # 首个完整文件的场景信息 (来自列统计，不读取列数据)
+            if valid_scans:
+                first = valid_scans[0]
+                results['details']['sample_scenario'] = {
+                    **first.constants,
+                    'row_count': first.num_rows,
+                    'track_count': first.distinct.get('track_id'),
+                    'columns': first.columns,
+                }
             
             # 验证 API 可用性
             try:
                 from av2.datasets.motion_forecasting import scenario_serialization
                 results['details']['av2_api_available'] = True
                 
-                # 尝试加载第一个场景
-                if parquet_files:
-                    first_file = parquet_files[0]
+                # 尝试加载第一个完整的场景
+                if valid_scans:
+                    first_file = Path(valid_scans[0].path)
                     try:
                         scenario = scenario_serialization.load_argoverse_scenario_parquet(first_file)
                         
@@ -327,7 +496,36 @@ class ArgoverseValidator(DatasetValidator):
         
         return results
 
-def validate_all_datasets(base_data_dir: str) -> Dict:
+def run_validator(validator_cls, dataset_path: Path, use_manifest: bool = True,
+                  manifest_dir: Optional[str] = None, hash_files: bool = False,
+                  workers: int = 16, **kwargs) -> Dict:
+    """运行单个数据集验证器
+    
+    启用文件清单时先与上次清单比较 (报告新增/删除/修改的文件)，
+    验证中复用未变化文件的检查结果，结束后写回清单。
+    """
+    manifest = None
+    diff = None
+    if use_manifest:
+        manifest = DatasetManifest(str(dataset_path), default_manifest_path(str(dataset_path), manifest_dir),
+                                   hash_files=hash_files, workers=workers)
+        diff = manifest.update()
+        if diff.baseline:
+            logger.info(f"建立文件清单 {dataset_path}: {diff.files} 个文件, 耗时 {diff.elapsed_s:.2f}s")
+        else:
+            logger.info(f"文件清单比较 {dataset_path}: 新增 {len(diff.added)}, 删除 {len(diff.removed)}, "
+                        f"修改 {len(diff.modified)}, 未变化 {diff.unchanged}, 耗时 {diff.elapsed_s:.2f}s")
+    
+    result = validator_cls(str(dataset_path), manifest=manifest, **kwargs).validate()
+    
+    if manifest is not None:
+        result['details']['manifest'] = diff.to_dict()
+        manifest.save()
+    return result
+
+def validate_all_datasets(base_data_dir: str, load_devkit: bool = False, use_manifest: bool = True,
+                          manifest_dir: Optional[str] = None, hash_files: bool = False,
+                          workers: int = 16, tfrecord_crc: str = 'header', count_tracks: bool = False) -> Dict:
     """验证所有数据集"""
     logger.info(f"开始验证数据集，根目录: {base_data_dir}")
     
@@ -337,12 +535,18 @@ def validate_all_datasets(base_data_dir: str) -> Dict:
         'base_directory': str(base_path),
         'datasets': {}
     }
+    manifest_options = {
+        'use_manifest': use_manifest,
+        'manifest_dir': manifest_dir,
+        'hash_files': hash_files,
+        'workers': workers,
+    }
     
     # 验证 nuScenes
     nuscenes_path = base_path / 'nuscenes'
     if nuscenes_path.exists():
-        validator = NuScenesValidator(str(nuscenes_path))
-        all_results['datasets']['nuscenes'] = validator.validate()
+        all_results['datasets']['nuscenes'] = run_validator(
+            NuScenesValidator, nuscenes_path, load_devkit=load_devkit, **manifest_options)
     else:
         all_results['datasets']['nuscenes'] = {
             'dataset': 'nuScenes',
@@ -353,8 +557,8 @@ def validate_all_datasets(base_data_dir: str) -> Dict:
     # 验证 Waymo
     waymo_path = base_path / 'waymo'
     if waymo_path.exists():
-        validator = WaymoValidator(str(waymo_path))
-        all_results['datasets']['waymo'] = validator.validate()
+        all_results['datasets']['waymo'] = run_validator(WaymoValidator, waymo_path, crc_mode=tfrecord_crc,
+                                                         **manifest_options)
     else:
         all_results['datasets']['waymo'] = {
             'dataset': 'Waymo',
@@ -365,8 +569,8 @@ def validate_all_datasets(base_data_dir: str) -> Dict:
     # 验证 Argoverse 2
     argoverse_path = base_path / 'argoverse2'
     if argoverse_path.exists():
-        validator = ArgoverseValidator(str(argoverse_path))
-        all_results['datasets']['argoverse2'] = validator.validate()
+        all_results['datasets']['argoverse2'] = run_validator(ArgoverseValidator, argoverse_path,
+                                                              count_tracks=count_tracks, **manifest_options)
     else:
         all_results['datasets']['argoverse2'] = {
             'dataset': 'Argoverse2',
@@ -421,6 +625,12 @@ def print_validation_summary(results: Dict):
         elif dataset_name == 'waymo':
             if 'tfrecord_count' in details:
                 print(f"   TFRecord 文件数: {details['tfrecord_count']}")
+            if 'frame_count' in details:
+                print(f"   帧数: {details['frame_count']}")
+            if details.get('invalid_tfrecords'):
+                print(f"   ❌ 不完整的 TFRecord: {len(details['invalid_tfrecords'])} 个")
+                for name, error in list(details['invalid_tfrecords'].items())[:5]:
+                    print(f"     {name}: {error}")
             if 'tensorflow_available' in details:
                 tf_status = "✅" if details['tensorflow_available'] else "❌"
                 print(f"   TensorFlow: {tf_status}")
@@ -431,10 +641,32 @@ def print_validation_summary(results: Dict):
         elif dataset_name == 'argoverse2':
             if 'scenario_count' in details:
                 print(f"   场景文件数: {details['scenario_count']}")
+            if 'total_rows' in details:
+                print(f"   轨迹状态行数: {details['total_rows']}")
+            if 'track_count' in details:
+                print(f"   轨迹数: {details['track_count']}")
+            if details.get('invalid_parquet'):
+                print(f"   ❌ 损坏的 Parquet: {len(details['invalid_parquet'])} 个")
+                for name, error in list(details['invalid_parquet'].items())[:5]:
+                    print(f"     {name}: {error}")
+            if details.get('schema_mismatch'):
+                print(f"   ❌ 缺少必需列的文件: {len(details['schema_mismatch'])} 个")
             if 'av2_api_available' in details:
                 api_status = "✅" if details['av2_api_available'] else "❌"
                 print(f"   AV2 API: {api_status}")
         
+        # 与上次文件清单的差异
+        manifest = details.get('manifest')
+        if manifest:
+            if manifest['baseline']:
+                print(f"   文件清单: 已建立 ({manifest['files']} 个文件)")
+            else:
+                print(f"   文件清单: 新增 {manifest['added_count']}, 删除 {manifest['removed_count']}, "
+                      f"修改 {manifest['modified_count']}, 未变化 {manifest['unchanged']}")
+                for name in ('added', 'removed', 'modified'):
+                    for rel in manifest[name][:5]:
+                        print(f"     {name}: {rel}")
+        
         # 错误信息
         if 'error' in details:
             print(f"   ❌ 错误: {details['error']}")
@@ -492,15 +724,42 @@ def main():
                        help='生成的配置文件 (默认: dataset_config.json)')
     parser.add_argument('--quiet', action='store_true',
                        help='静默模式，仅输出错误')
+    parser.add_argument('--size-workers', type=int, default=16,
+                       help='统计目录大小的线程数 (默认: 16)')
+    parser.add_argument('--size-cache', type=str, default=None,
+                       help='目录大小缓存文件 (默认: ~/.cache/runpod_det3d/directory_sizes.json)')
+    parser.add_argument('--no-size-cache', action='store_true',
+                       help='不使用目录大小缓存，全部重新扫描')
+    parser.add_argument('--nuscenes-devkit', action='store_true',
+                       help='额外完整加载 nuscenes-devkit 验证API (需要数GB内存)')
+    parser.add_argument('--tfrecord-crc', choices=['none', 'header', 'full'], default='header',
+                       help='TFRecord CRC校验级别: header 只校验记录头, full 校验全部数据 (默认: header)')
+    parser.add_argument('--count-tracks', action='store_true',
+                       help='统计 Argoverse 2 轨迹数 (需要 pyarrow 读取每个场景文件的 track_id 列，默认只读文件尾)')
+    parser.add_argument('--manifest-dir', type=str, default=None,
+                       help='文件清单目录 (默认: ~/.cache/runpod_det3d/manifests)')
+    parser.add_argument('--no-manifest', action='store_true',
+                       help='不使用文件清单，全量验证 (清单每次需 stat 全部文件，trainval 约15s、1GB内存)')
+    parser.add_argument('--manifest-hash', action='store_true',
+                       help='为新增/修改的文件计算 sha256 记入清单 (首次运行需读取全部数据)')
     
     args = parser.parse_args()
     
     if args.quiet:
         logging.getLogger().setLevel(logging.ERROR)
     
+    set_sizer(DirectorySizer(args.size_cache, workers=args.size_workers,
+                             use_cache=not args.no_size_cache))
+    
     try:
         # 验证数据集
-        results = validate_all_datasets(args.data_dir)
+        results = validate_all_datasets(args.data_dir, load_devkit=args.nuscenes_devkit,
+                                        use_manifest=not args.no_manifest,
+                                        manifest_dir=args.manifest_dir,
+                                        hash_files=args.manifest_hash,
+                                        workers=args.size_workers,
+                                        tfrecord_crc=args.tfrecord_crc,
+                                        count_tracks=args.count_tracks)
         
         # 保存验证结果
         with open(args.output, 'w') as f: